@@ -1,5 +1,7 @@
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.websockets import WebSocketState
 import numpy as np
 from PIL import Image
 import io
@@ -7,6 +9,7 @@ import uuid
 from datetime import datetime
 import sys
 import os
+import asyncio
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -19,11 +22,25 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from .models.fusion_model import MultiModalFusion
 from .models.fairness import FairnessAuditor
 from .services.loan_service import LoanEligibilityChecker
-from .services.llm_service import LLMService
+from .services.llm_service import LLMService, explanation_cache
 from .services.tts_service import CloudTTSService
+from .services.tts_cache import tts_cache
 from .services.vision_service import VisionService
+from .services.report_image import report_image_stats
+from .services.report_dedup import report_dedup
 from .services.ollama_service import OllamaService
 from .services.story_video_service import StoryVideoService
+from .services.vitals_store import vitals_store, fahrenheit_to_celsius
+from .services.pipeline import Stage, StagePipeline, iterate_in_thread, stage_pool_stats
+from .services.llm_client import llm_client
+from .services.llm_router import llm_router
+from .services.ollama_manager import ollama_manager
+from .services.translation_memory import translation_memory, SUPPORTED_LANGUAGES
+from .services.single_flight import single_flight_stats, fingerprint
+from .services.job_queue import JobQueue, QueueFull, job_queue_stats
+from .services.story_cache import (farm_story_cache, story_video_cache, top_fingerprints, in_prewarm_window,
+                                   STORY_PREWARM_TOP, STORY_PREWARM_LANGUAGES, STORY_CACHE_VARIANTS)
+from .services.upload_stage import read_upload, sniff_table_format, HEADER_BYTES, MAX_REQUEST_BYTES
 
 
 app = FastAPI(title="Nexus AI Healthcare Backend", version="2.0.0")
@@ -44,6 +61,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def reject_oversized_requests(request: Request, call_next):
+    """Refuse bodies above MAX_REQUEST_BYTES before multipart parsing buffers them."""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_REQUEST_BYTES:
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"Request too large; limit is {MAX_REQUEST_BYTES // (1024 * 1024)} MB", "status": "failed"}
+        )
+    return await call_next(request)
+
 fusion_model = MultiModalFusion()
 fairness_auditor = FairnessAuditor()
 loan_checker = LoanEligibilityChecker()
@@ -53,9 +82,331 @@ vision_service = VisionService()
 ollama_service = OllamaService()
 story_video_service = StoryVideoService()
 
+# Story videos are generated by a small worker pool instead of on the request;
+# the local LLM is CPU-bound, so more workers than cores only adds latency
+story_video_jobs = JobQueue(
+    "story-video", story_video_service.generate_story_video,
+    workers=int(os.getenv("STORY_VIDEO_WORKERS", "2")),
+    max_queue=int(os.getenv("STORY_VIDEO_QUEUE_SIZE", "64")),
+)
+
 # In-memory audit log for demo / doctor dashboard
 audit_logs: list[dict] = []
 
+
+def _prewarm_stories(limit, languages, variants):
+    """Fill the story caches for the most common diagnoses in the audit log."""
+    fingerprints = top_fingerprints(list(audit_logs), limit)
+    added = {"farm_story": 0, "story_video": 0}
+    failed = 0
+    for diagnosis, count in fingerprints:
+        for language in languages:
+            try:
+                added["farm_story"] += ollama_service.prewarm_farm_story(diagnosis, language, variants)
+                added["story_video"] += story_video_service.prewarm_story_video(diagnosis, language, variants)
+            except Exception as e:
+                failed += 1
+                print(f"❌ Story prewarm failed for {[d['name'] for d in diagnosis['diseases']]} ({language}): {str(e)}")
+    print(f"🔥 Story prewarm: {len(fingerprints)} diagnoses x {len(languages)} languages, added {added}")
+    return {"fingerprints": len(fingerprints), "languages": languages, "variants": variants,
+            "added": added, "failed": failed}
+
+
+# One prewarm at a time, on its own worker so it never delays user story videos
+story_prewarm_jobs = JobQueue("story-prewarm", _prewarm_stories, workers=1, max_queue=4)
+STORY_PREWARM_CHECK_SECONDS = float(os.getenv("STORY_PREWARM_CHECK_SECONDS", "600"))
+
+
+async def _story_prewarm_scheduler():
+    """Start one prewarm per day inside the STORY_PREWARM_HOURS window."""
+    last_day = None
+    while True:
+        await asyncio.sleep(STORY_PREWARM_CHECK_SECONDS)
+        today = datetime.now().date()
+        if last_day != today and audit_logs and in_prewarm_window():
+            try:
+                story_prewarm_jobs.submit(STORY_PREWARM_TOP, STORY_PREWARM_LANGUAGES, STORY_CACHE_VARIANTS,
+                                          key="prewarm")
+                last_day = today
+                print("🔥 Off-peak story prewarm started")
+            except QueueFull:
+                pass
+
+# ──────── /api/diagnose stage graph ────────
+# Only the fusion model is on the critical path; the LLM explanation and the farm
+# story run side by side and fall back to their offline templates on timeout.
+DIAGNOSE_LLM_TIMEOUT = float(os.getenv("DIAGNOSE_LLM_TIMEOUT", "20"))
+DIAGNOSE_STORY_TIMEOUT = float(os.getenv("DIAGNOSE_STORY_TIMEOUT", "20"))
+
+
+def _decode_diagnose_image(image_bytes):
+    if image_bytes is None:
+        return None
+    image_array = np.array(Image.open(io.BytesIO(image_bytes)).convert('RGB'))
+    print(f"📷 Image decoded, shape: {image_array.shape}")
+    return image_array
+
+
+async def _translate_diagnosis(diagnosis, patient_data, language):
+    # The router fails over / falls back to templates inside the stage deadline
+    return await llm_service.analyze_and_translate_async(diagnosis, patient_data, language,
+                                                         timeout=DIAGNOSE_LLM_TIMEOUT * 0.9)
+
+
+# Everything up to the structured result; /api/diagnose/stream sends this before any LLM text
+DIAGNOSE_CORE_STAGES = (
+    Stage("image_array", _decode_diagnose_image, deps=("image_bytes",)),
+    Stage("diagnosis", lambda image_array, patient_data: fusion_model.predict(image_array, patient_data),
+          deps=("image_array", "patient_data")),
+    Stage("fairness", lambda age, gender: fairness_auditor.audit(age, gender), deps=("age", "gender")),
+    Stage("loan", lambda income, diagnosis: loan_checker.check_eligibility(income, diagnosis["treatment_cost"]),
+          deps=("income", "diagnosis")),
+)
+
+diagnose_pipeline = StagePipeline(
+    *DIAGNOSE_CORE_STAGES,
+    Stage("translation", _translate_diagnosis,
+          deps=("diagnosis", "patient_data", "language"), timeout=DIAGNOSE_LLM_TIMEOUT,
+          fallback=lambda diagnosis, patient_data, language: llm_service._smart_mock_response(diagnosis, language)),
+    Stage("farm_story", lambda diagnosis, language: ollama_service.generate_farm_story(diagnosis, language),
+          deps=("diagnosis", "language"), timeout=DIAGNOSE_STORY_TIMEOUT,
+          fallback=lambda diagnosis, language: ollama_service._fallback_story(diagnosis, language)),
+    inputs=("image_bytes", "patient_data", "age", "gender", "income", "language"),
+)
+
+diagnose_core_pipeline = StagePipeline(
+    *DIAGNOSE_CORE_STAGES, inputs=("image_bytes", "patient_data", "age", "gender", "income"),
+)
+
+
+def _build_patient_data(glucose, heart_rate, systolic, diastolic, spo2, temperature,
+                        age, gender, symptoms, income, lab_data):
+    return {
+        "vitals": {
+            "glucose": glucose,
+            "heart_rate": heart_rate,
+            "blood_pressure": {"systolic": systolic, "diastolic": diastolic},
+            "spo2": spo2,
+            "temperature": temperature
+        },
+        "demographics": {
+            "age": age,
+            "gender": gender
+        },
+        "symptoms": symptoms,
+        "income": income,
+        "lab_data": lab_data
+    }
+
+
+def _diagnosis_summary(results, patient_data, patient_id, returning_patient=False):
+    """
+    Structured part of the diagnose response (no LLM text). Records the audit log
+    entry, and the visit's vitals when the client sent its own patient_id (a
+    generated one is never seen again, so its series would only grow the store).
+    """
+    diagnosis = results["diagnosis"]
+    vitals = patient_data["vitals"]
+    timestamp = datetime.now().isoformat()
+    vitals_spikes = {}
+    if returning_patient:
+        vitals_spikes = vitals_store.record(
+            patient_id, glucose=vitals["glucose"], heart_rate=vitals["heart_rate"],
+            systolic=vitals["blood_pressure"]["systolic"], diastolic=vitals["blood_pressure"]["diastolic"],
+            spo2=vitals["spo2"], temperature=fahrenheit_to_celsius(vitals["temperature"])
+        )
+
+    detailed_explanation = []
+    for d in diagnosis['diseases']:
+        detailed_explanation.append(f"- {d['name']} ({int(d['probability']*100)}% confidence)")
+
+    # Extract diet recommendations for Thali (Feature 3)
+    eat_foods = ["bajra roti", "palak sabzi", "dahi", "moong dal"]
+    avoid_foods = ["white chawal", "aloo", "mithai", "tel"]
+
+    if diagnosis['risk_level'] == 'high':
+        eat_foods = ["khichdi", "dalia", "nimbu pani", "tulsi chai"]
+        avoid_foods = ["heavy food", "spicy", "fried", "cold drinks"]
+
+    audit_logs.append(
+        {
+            "patient_id": patient_id,
+            "timestamp": timestamp,
+            "risk": diagnosis["risk_level"],
+            "risk_score": diagnosis["risk_score"],
+            "confidence": diagnosis["confidence"],
+            "diseases": diagnosis["diseases"],
+            "medications": diagnosis["treatment_plan"]["medications"],
+            "demographics": patient_data["demographics"],
+            "symptoms": patient_data["symptoms"],
+        }
+    )
+
+    return {
+        "patient_id": patient_id,
+        "risk": diagnosis['risk_level'],
+        "risk_score": diagnosis['risk_score'],
+        "confidence": diagnosis['confidence'],
+        "detailedExplanation": detailed_explanation,
+        "featureImportance": [
+            {"name": k, "value": v, "color": "#3b82f6"}
+            for k, v in diagnosis['feature_importance'].items()
+        ],
+        "diseases": diagnosis['diseases'],
+        "treatmentPlan": diagnosis['treatment_plan'],
+        "fairnessMetrics": results["fairness"],
+        "loanEligibility": results["loan"],
+        "timestamp": timestamp,
+        "vitalsTrend": vitals_store.trends(patient_id) if returning_patient else {},
+        "vitalsSpikes": vitals_spikes,
+        "recommended_foods": eat_foods,
+        "avoid_foods": avoid_foods,
+        "severity": diagnosis.get('risk_score', 5),
+    }
+
+
+def _sse(event, data):
+    """One server-sent event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+async def _story_events(diagnosis, language, queue, timeout):
+    """
+    Queue story_delta events as Ollama writes, then the full story. A stream cut
+    off by the timeout or an error ends with the template story instead.
+    """
+    parts = []
+    complete = False
+
+    async def pump():
+        nonlocal complete
+        chunks = iterate_in_thread(ollama_service.stream_farm_story, diagnosis, language)
+        try:
+            async for text in chunks:
+                parts.append(text)
+                await queue.put(_sse("story_delta", {"text": text}))
+            complete = True
+        finally:
+            # Stops the Ollama stream in its worker thread
+            await chunks.aclose()
+
+    try:
+        await asyncio.wait_for(pump(), timeout=timeout)
+    except Exception as e:
+        print(f"⚠️ Farm story stream stopped ({e or 'timed out'})")
+    if complete and parts:
+        await queue.put(_sse("story", {"farmStory": "".join(parts)}))
+    else:
+        await queue.put(_sse("story", {"farmStory": ollama_service._fallback_story(diagnosis, language),
+                                       "truncated": bool(parts)}))
+
+
+async def _explanation_events(diagnosis, patient_data, language, queue, timeout):
+    """Queue explanation_delta events as the LLM writes, then the parsed explanation."""
+    result = None
+    try:
+        async for kind, value in llm_service.stream_explanation(diagnosis, patient_data, language, timeout=timeout):
+            if kind == "delta":
+                await queue.put(_sse("explanation_delta", {"text": value}))
+            else:
+                result = value
+    except Exception as e:
+        print(f"⚠️ Explanation stream stopped ({e})")
+    if result is None:
+        result = llm_service._smart_mock_response(diagnosis, language)
+    await queue.put(_sse("explanation", {
+        "explanation": result.get("explanation", diagnosis['risk_level']),
+        "dietTips": result.get("diet_tips", []),
+        "medicationGuide": result.get("medication_guide", ""),
+    }))
+
+
+async def _merge_events(*producers):
+    """Run producers (each filling the queue they're given) and yield their events as they arrive."""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run(producer):
+        try:
+            await producer(queue)
+        finally:
+            await queue.put(None)
+
+    tasks = [asyncio.ensure_future(run(p)) for p in producers]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event is None:
+                remaining -= 1
+            else:
+                yield event
+    finally:
+        # Client went away: stop generating
+        for task in tasks:
+            task.cancel()
+
+@app.on_event("startup")
+async def warm_ollama():
+    # Loads the model in the background and keeps it resident; requests never wait on it
+    ollama_manager.start()
+
+
+TTS_PREWARM = os.getenv("TTS_PREWARM", "1") == "1"
+RISK_LEVELS = ("HIGH", "MEDIUM", "LOW")
+
+
+def _static_tts_phrases():
+    """(text, language) for every fixed template the app speaks: mock explanations, fallback stories, story narrations."""
+    phrases = []
+    for lang in SUPPORTED_LANGUAGES:
+        for risk in RISK_LEVELS:
+            mock = llm_service._smart_mock_response({"risk_level": risk}, lang)
+            phrases += [(mock["explanation"], lang), *((tip, lang) for tip in mock["diet_tips"]),
+                        (mock["medication_guide"], lang)]
+            phrases.append((ollama_service._fallback_story({"risk_level": risk}, lang), lang))
+        # Disease-specific narration lines are cached on first use instead
+        template = story_video_service._fallback_story({}, lang)
+        phrases += [(scene["narration"], lang) for scene in template["scenes"]]
+    return list(dict.fromkeys(phrases))
+
+
+def _prewarm_tts():
+    phrases = _static_tts_phrases()
+    counts = tts_service.prewarm(phrases)
+    print(f"🔊 TTS prewarm: {len(phrases)} template phrases, {counts}")
+
+
+@app.on_event("startup")
+async def start_tts_prewarm():
+    # Off the event loop: a cold cache means a network round-trip per phrase
+    if TTS_PREWARM:
+        app.state.tts_prewarm_task = asyncio.create_task(asyncio.to_thread(_prewarm_tts))
+
+
+@app.on_event("startup")
+async def start_story_prewarm_scheduler():
+    app.state.story_prewarm_task = asyncio.create_task(_story_prewarm_scheduler())
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_client.aclose()
+    app.state.story_prewarm_task.cancel()
+    story_video_jobs.shutdown()
+    story_prewarm_jobs.shutdown()
+    ollama_manager.stop()
+
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    """In-flight calls, errors and timeouts per async LLM provider, router health, cache hit rates and coalesced calls."""
+    return {**llm_client.stats(), "router": llm_router.stats(), "explanation_cache": explanation_cache.stats(),
+            "translation_memory": translation_memory.stats(), "single_flight": single_flight_stats()}
+
+
 @app.get("/")
 async def root():
     return {"message": "Seva AI Backend Running", "status": "healthy"}
@@ -64,6 +415,12 @@ async def root():
 async def health_check():
     return {"status": "healthy", "model": "Seva AI v2.0"}
 
+@app.get("/api/ollama/status")
+async def ollama_status():
+    """Local LLM readiness: 200 once the model is loaded and resident, 503 while loading or unreachable."""
+    stats = ollama_manager.stats()
+    return JSONResponse(status_code=200 if stats["ready"] else 503, content=stats)
+
 @app.post("/api/diagnose")
 async def diagnose(
     image: UploadFile = File(None),
@@ -78,17 +435,15 @@ async def diagnose(
     gender: str = Form("Female"),
     symptoms: str = Form(""),
     income: float = Form(25000),
-    language: str = Form("en")
+    language: str = Form("en"),
+    patient_id: str = Form(None)
 ):
     try:
         print(f"🔍 Diagnosis request received - Language: {language}, Symptoms: {symptoms}")
         
-        image_array = None
+        image_bytes = await read_upload(image, "diagnose") if image else None
         if image:
-            contents = await image.read()
-            pil_image = Image.open(io.BytesIO(contents)).convert('RGB')
-            image_array = np.array(pil_image)
-            print(f"📷 Image uploaded: {image.filename}, shape: {image_array.shape}")
+            print(f"📷 Image uploaded: {image.filename}")
         
         # Mock Lab Report Processing
         lab_data = {}
@@ -96,91 +451,30 @@ async def diagnose(
             lab_data['abnormal'] = 'abnormal' in lab_report.filename.lower()
             print(f"📄 Lab report uploaded: {lab_report.filename}")
         
-        patient_data = {
-            "vitals": {
-                "glucose": glucose,
-                "heart_rate": heart_rate,
-                "blood_pressure": {"systolic": systolic, "diastolic": diastolic},
-                "spo2": spo2,
-                "temperature": temperature
-            },
-            "demographics": {
-                "age": age,
-                "gender": gender
-            },
-            "symptoms": symptoms,
-            "income": income,
-            "lab_data": lab_data
-        }
-        
-        print(f"🏥 Running diagnosis with patient data...")
-        diagnosis = fusion_model.predict(image_array, patient_data)
-        fairness_report = fairness_auditor.audit(age, gender)
-        loan_eligibility = loan_checker.check_eligibility(income, diagnosis["treatment_cost"])
+        patient_data = _build_patient_data(glucose, heart_rate, systolic, diastolic, spo2, temperature,
+                                           age, gender, symptoms, income, lab_data)
         
-        print(f"🤖 Running LLM translation to {language}...")
-        translated_analysis = llm_service.analyze_and_translate(diagnosis, patient_data, language)
+        print(f"🏥 Running diagnosis pipeline (LLM translation to {language} and farm story in parallel)...")
+        results, stage_report = await diagnose_pipeline.run(
+            image_bytes=image_bytes, patient_data=patient_data,
+            age=age, gender=gender, income=income, language=language
+        )
+        diagnosis = results["diagnosis"]
+        translated_analysis = results["translation"]
 
-        patient_id = f"PAT-{uuid.uuid4().hex[:8].upper()}"
-        timestamp = datetime.now().isoformat()
+        # Returning patients keep their id so their vitals accumulate into one series
+        returning_patient = bool(patient_id)
+        patient_id = patient_id or f"PAT-{uuid.uuid4().hex[:8].upper()}"
+        response = _diagnosis_summary(results, patient_data, patient_id, returning_patient)
 
         # Use translated explanation if available
-        explanation = translated_analysis.get("explanation", diagnosis['risk_level'])
-        
-        detailed_explanation = []
-        for d in diagnosis['diseases']:
-            detailed_explanation.append(f"- {d['name']} ({int(d['probability']*100)}% confidence)")
-        
-        response = {
-            "patient_id": patient_id,
-            "risk": diagnosis['risk_level'],
-            "risk_score": diagnosis['risk_score'],
-            "confidence": diagnosis['confidence'],
-            "explanation": explanation,
-            "dietTips": translated_analysis.get("diet_tips", []),
-            "medicationGuide": translated_analysis.get("medication_guide", ""),
-            "detailedExplanation": detailed_explanation,
-            "featureImportance": [
-                {"name": k, "value": v, "color": "#3b82f6"}
-                for k, v in diagnosis['feature_importance'].items()
-            ],
-            "diseases": diagnosis['diseases'],
-            "treatmentPlan": diagnosis['treatment_plan'],
-            "fairnessMetrics": fairness_report,
-            "loanEligibility": loan_eligibility,
-            "timestamp": timestamp,
-        }
-
-        audit_logs.append(
-            {
-                "patient_id": patient_id,
-                "timestamp": timestamp,
-                "risk": diagnosis["risk_level"],
-                "risk_score": diagnosis["risk_score"],
-                "confidence": diagnosis["confidence"],
-                "diseases": diagnosis["diseases"],
-                "demographics": patient_data["demographics"],
-                "symptoms": symptoms,
-            }
-        )
+        response["explanation"] = translated_analysis.get("explanation", diagnosis['risk_level'])
+        response["dietTips"] = translated_analysis.get("diet_tips", [])
+        response["medicationGuide"] = translated_analysis.get("medication_guide", "")
+        response["farmStory"] = results["farm_story"]
+        response["pipeline"] = stage_report
         
         print(f"✅ Diagnosis complete for {patient_id} - Risk: {diagnosis['risk_level']}")
-        # Generate Farm Story using Ollama (Feature 2)
-        farm_story = ollama_service.generate_farm_story(diagnosis, language)
-        
-        # Extract diet recommendations for Thali (Feature 3)
-        eat_foods = ["bajra roti", "palak sabzi", "dahi", "moong dal"]
-        avoid_foods = ["white chawal", "aloo", "mithai", "tel"]
-        
-        if diagnosis['risk_level'] == 'high':
-            eat_foods = ["khichdi", "dalia", "nimbu pani", "tulsi chai"]
-            avoid_foods = ["heavy food", "spicy", "fried", "cold drinks"]
-        
-        # Add farm story and diet to response
-        response["farmStory"] = farm_story
-        response["recommended_foods"] = eat_foods
-        response["avoid_foods"] = avoid_foods
-        response["severity"] = diagnosis.get('risk_score', 5)
         
         return response
         
@@ -198,34 +492,84 @@ async def diagnose(
             "treatmentPlan": {}
         }
 
+@app.post("/api/diagnose/stream")
+async def diagnose_stream(
+    image: UploadFile = File(None),
+    lab_report: UploadFile = File(None),
+    glucose: float = Form(120),
+    heart_rate: float = Form(80),
+    systolic: float = Form(120),
+    diastolic: float = Form(80),
+    spo2: float = Form(98),
+    temperature: float = Form(98.6),
+    age: int = Form(45),
+    gender: str = Form("Female"),
+    symptoms: str = Form(""),
+    income: float = Form(25000),
+    language: str = Form("en"),
+    patient_id: str = Form(None)
+):
+    """
+    Streaming /api/diagnose (server-sent events). Sends the structured result as
+    soon as the fusion model is done, then the explanation and farm story as the
+    LLMs write them:
+      diagnosis -> explanation_delta* / story_delta* (interleaved) -> explanation, story -> done
+    The final explanation/story events carry the complete text (or the offline
+    templates if generation failed) and replace the deltas.
+    """
+    try:
+        print(f"🔍 Streaming diagnosis request received - Language: {language}")
+        started = time.perf_counter()
+        image_bytes = await read_upload(image, "diagnose") if image else None
+        lab_data = {'abnormal': 'abnormal' in lab_report.filename.lower()} if lab_report else {}
+        patient_data = _build_patient_data(glucose, heart_rate, systolic, diastolic, spo2, temperature,
+                                           age, gender, symptoms, income, lab_data)
+        results, stage_report = await diagnose_core_pipeline.run(
+            image_bytes=image_bytes, patient_data=patient_data, age=age, gender=gender, income=income
+        )
+        returning_patient = bool(patient_id)
+        patient_id = patient_id or f"PAT-{uuid.uuid4().hex[:8].upper()}"
+        summary = {**_diagnosis_summary(results, patient_data, patient_id, returning_patient),
+                   "pipeline": stage_report}
+    except Exception as e:
+        print(f"❌ Error in streaming diagnosis: {str(e)}")
+        return {"error": str(e), "status": "failed"}
+
+    diagnosis = results["diagnosis"]
+
+    async def events():
+        yield _sse("diagnosis", summary)
+        async for event in _merge_events(
+            lambda q: _explanation_events(diagnosis, patient_data, language, q, DIAGNOSE_LLM_TIMEOUT),
+            lambda q: _story_events(diagnosis, language, q, DIAGNOSE_STORY_TIMEOUT),
+        ):
+            yield event
+        print(f"✅ Streaming diagnosis complete for {patient_id} - Risk: {diagnosis['risk_level']}")
+        yield _sse("done", {"patient_id": patient_id, "ms": round((time.perf_counter() - started) * 1000, 1)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/api/analyze-report")
 async def analyze_medical_report(
     file: UploadFile = File(...),
-    language: str = Form("en")
+    language: str = Form("en"),
+    patient_id: str = Form(None),
+    session_id: str = Form(None)
 ):
     """
     Village Vaidya Report Reader - Analyze medical images/reports using Gemini Vision.
+    A retake of a report sent with the same patient_id (or session_id) in the
+    last few minutes reuses that analysis; without either, every upload is analyzed.
     """
     try:
         print(f"📸 Analyzing medical report in language: {language}")
-        contents = await file.read()
+        contents = await read_upload(file, "analyze-report")
         print(f"📄 File: {file.filename}, size: {len(contents)} bytes")
         
-        result = await vision_service.analyze_medical_report(contents, language)
+        result = await vision_service.analyze_medical_report(contents, language, _report_scope(patient_id, session_id))
         print(f"✅ Analysis complete: Severity {result.get('severity')}/10")
         
-        return {
-            "success": True,
-            "report_type": result.get("report_type", "Medical Report"),
-            "key_findings": result.get("key_findings", []),
-            "severity": result.get("severity", 5),
-            "severity_analogy": result.get("severity_analogy", ""),
-            "explanation": result.get("explanation", ""),
-            "eat_foods": result.get("eat_foods", []),
-            "avoid_foods": result.get("avoid_foods", []),
-            "action_needed": result.get("action_needed", "Consult doctor"),
-            "timestamp": datetime.now().isoformat()
-        }
+        return _report_response(result)
     except Exception as e:
         print(f"❌ Report analysis error: {str(e)}")
         import traceback
@@ -236,6 +580,69 @@ async def analyze_medical_report(
             "explanation": f"Could not analyze report: {str(e)}"
         }
 
+def _report_scope(patient_id: str, session_id: str) -> str:
+    """
+    Whose earlier uploads a retake may match: the patient, else the browser
+    session. Empty (no dedup) without either: the client address is the proxy's
+    behind nginx, so it would pool every uploader together.
+    """
+    if patient_id:
+        return f"patient:{patient_id}"
+    return f"session:{session_id}" if session_id else ""
+
+def _report_response(result):
+    return {
+        "success": True,
+        "report_type": result.get("report_type", "Medical Report"),
+        "key_findings": result.get("key_findings", []),
+        "severity": result.get("severity", 5),
+        "severity_analogy": result.get("severity_analogy", ""),
+        "explanation": result.get("explanation", ""),
+        "eat_foods": result.get("eat_foods", []),
+        "avoid_foods": result.get("avoid_foods", []),
+        "action_needed": result.get("action_needed", "Consult doctor"),
+        "preprocessing": result.get("preprocessing"),
+        "dedup": result.get("dedup"),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/api/analyze-report/stats")
+async def analyze_report_stats():
+    """Bytes saved by report image preprocessing, Gemini latency (preprocessed vs raw) and retake dedup hits."""
+    return {**report_image_stats.stats(), "dedup": report_dedup.stats()}
+
+
+@app.post("/api/analyze-report/stream")
+async def analyze_medical_report_stream(
+    file: UploadFile = File(...),
+    language: str = Form("en"),
+    patient_id: str = Form(None),
+    session_id: str = Form(None)
+):
+    """
+    Streaming report reader (server-sent events): a finding event for each key
+    finding as Gemini writes it, then report (same shape as /api/analyze-report) and done.
+    """
+    try:
+        print(f"📸 Streaming report analysis in language: {language}")
+        contents = await read_upload(file, "analyze-report")
+    except Exception as e:
+        print(f"❌ Report analysis error: {str(e)}")
+        return {"error": str(e), "status": "failed"}
+
+    async def events():
+        async for kind, value in vision_service.stream_medical_report(contents, language,
+                                                                      _report_scope(patient_id, session_id)):
+            if kind == "finding":
+                yield _sse("finding", {"text": value})
+            else:
+                print(f"✅ Analysis complete: Severity {value.get('severity')}/10")
+                yield _sse("report", _report_response(value))
+        yield _sse("done", {"language": language})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/api/generate-farm-story")
 async def generate_farm_story(
     diagnosis: dict = Form(...),
@@ -252,7 +659,7 @@ async def generate_farm_story(
         if isinstance(diagnosis, str):
             diagnosis = json.loads(diagnosis)
         
-        story = ollama_service.generate_farm_story(diagnosis, language)
+        story = await asyncio.to_thread(ollama_service.generate_farm_story, diagnosis, language)
         
         return {
             "success": True,
@@ -267,10 +674,37 @@ async def generate_farm_story(
             "error": str(e)
         }
 
+@app.post("/api/generate-farm-story/stream")
+async def generate_farm_story_stream(
+    diagnosis: str = Form(...),
+    language: str = Form("en")
+):
+    """
+    Streaming farm story (server-sent events): story_delta events as Ollama
+    writes, then story with the full text, then done.
+    """
+    try:
+        print(f"🌾 Streaming farm story in {language}")
+        diagnosis = json.loads(diagnosis)
+    except Exception as e:
+        print(f"❌ Farm story error: {str(e)}")
+        return {"error": str(e), "status": "failed"}
+
+    async def events():
+        async for event in _merge_events(
+            lambda q: _story_events(diagnosis, language, q, DIAGNOSE_STORY_TIMEOUT),
+        ):
+            yield event
+        yield _sse("done", {"language": language})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/api/generate-story-video")
 async def generate_story_video(request: dict):
     """
     Generate animated story video from diagnosis (Feature 7: Animated Story Video Explainer)
+    Runs on the story-video worker pool; prefer POST /api/story-video/jobs, which
+    doesn't hold the connection open for the whole generation.
     """
     try:
         print(f"🎬 Generating story video...")
@@ -279,7 +713,11 @@ async def generate_story_video(request: dict):
         language = request.get('language', 'en')
         
         # Generate story video using Ollama
-        story_video = story_video_service.generate_story_video(diagnosis, language)
+        job = story_video_jobs.submit(diagnosis, language, key=fingerprint(diagnosis=diagnosis, language=language))
+        await story_video_jobs.wait_async(job)
+        if job.error:
+            raise RuntimeError(job.error)
+        story_video = job.result
         
         print(f"✅ Story video generated: {story_video.get('title')}")
         
@@ -299,15 +737,189 @@ async def generate_story_video(request: dict):
             "scenes": []
         }
 
+
+def _job_links(job):
+    return {"poll_url": f"/api/story-video/jobs/{job.id}", "events_url": f"/api/story-video/jobs/{job.id}/events"}
+
+
+@app.post("/api/generate-story-video/stream")
+async def generate_story_video_stream(request: dict):
+    """
+    Streaming story video (server-sent events): a scene event for each scene as
+    soon as the model finishes it, so the client can start rendering scene 1,
+    then story with the full script and done.
+    """
+    diagnosis = request.get('diagnosis', {})
+    language = request.get('language', 'en')
+    print(f"🎬 Streaming story video...")
+
+    async def events():
+        # Runs on a story-video worker, so streams and queued jobs share one concurrency limit
+        scenes = iterate_in_thread(story_video_service.stream_story_video, diagnosis, language,
+                                   start=story_video_jobs.run)
+        try:
+            async for kind, value in scenes:
+                yield _sse(kind, value)
+        except QueueFull as e:
+            print(f"⚠️ Story video stream rejected: {str(e)}")
+            yield _sse("error", {"error": str(e), "status": "failed"})
+            return
+        finally:
+            # Client went away: stop generating scenes
+            await scenes.aclose()
+        yield _sse("done", {"language": language})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.post("/api/story-video/jobs")
+async def submit_story_video_job(request: dict):
+    """
+    Queue a story video generation and return its job id immediately (202).
+    Identical requests that are still queued or running share one job.
+    """
+    diagnosis = request.get('diagnosis', {})
+    language = request.get('language', 'en')
+    try:
+        job = story_video_jobs.submit(diagnosis, language, key=fingerprint(diagnosis=diagnosis, language=language))
+    except QueueFull as e:
+        print(f"⚠️ Story video job rejected: {str(e)}")
+        return JSONResponse(status_code=503, headers={"Retry-After": "30"},
+                            content={"error": str(e), "status": "failed"})
+    print(f"🎬 Story video job {job.id} {job.status} (position {story_video_jobs.position(job)})")
+    return JSONResponse(status_code=202, content={
+        **job.to_dict(), "queue_position": story_video_jobs.position(job), **_job_links(job)
+    })
+
+
+@app.get("/api/story-video/jobs/{job_id}")
+async def get_story_video_job(job_id: str, wait: float = 0):
+    """Job status (and result once succeeded). ``wait`` long-polls up to that many seconds (max 30)."""
+    job = story_video_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job", "status": "failed"})
+    if wait > 0 and not job.done:
+        await story_video_jobs.wait_async(job, timeout=min(wait, 30))
+    return {**job.to_dict(), "queue_position": story_video_jobs.position(job)}
+
+
+@app.get("/api/story-video/jobs/{job_id}/events")
+async def story_video_job_events(job_id: str):
+    """Server-sent events: a status event on every change, then result (or error) when the job finishes."""
+    job = story_video_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job", "status": "failed"})
+
+    async def events():
+        last = None
+        while True:
+            state = (job.status, story_video_jobs.position(job))
+            if state != last:
+                last = state
+                yield _sse("status", {"job_id": job.id, "status": job.status, "queue_position": state[1]})
+            if job.done:
+                break
+            # Wake on start/finish; the timeout refreshes the queue position
+            await story_video_jobs.wait_change_async(job, timeout=1.0)
+        yield _sse("result" if job.status == "succeeded" else "error", job.to_dict())
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.post("/api/story-cache/prewarm")
+async def prewarm_story_cache(limit: int = STORY_PREWARM_TOP, languages: str = ",".join(STORY_PREWARM_LANGUAGES),
+                              variants: int = STORY_CACHE_VARIANTS):
+    """
+    Generate farm stories and story videos for the ``limit`` most common diagnoses
+    in the audit log, up to ``variants`` per language, as a background job (202).
+    """
+    langs = [l.strip() for l in languages.split(",") if l.strip()]
+    try:
+        job = story_prewarm_jobs.submit(limit, langs, min(variants, STORY_CACHE_VARIANTS), key="prewarm")
+    except QueueFull as e:
+        return JSONResponse(status_code=503, headers={"Retry-After": "60"},
+                            content={"error": str(e), "status": "failed"})
+    print(f"🔥 Story prewarm job {job.id} {job.status}")
+    return JSONResponse(status_code=202, content=job.to_dict())
+
+
+@app.get("/api/story-cache/prewarm/{job_id}")
+async def get_story_prewarm_job(job_id: str):
+    job = story_prewarm_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job", "status": "failed"})
+    return job.to_dict()
+
+
+@app.get("/api/story-cache/stats")
+async def story_cache_stats():
+    """Variants served/stored and tier sizes for the farm story and story video caches."""
+    return {"farm_story": farm_story_cache.stats(), "story_video": story_video_cache.stats()}
+
+
+@app.get("/api/jobs/stats")
+async def jobs_stats():
+    """Queue depth, running jobs, outcomes and queued/run durations per background job queue."""
+    return job_queue_stats()
+
+
+@app.get("/api/pipeline/stats")
+async def pipeline_stats():
+    """Stage pool size and blocking stage calls still running after their request gave up on them."""
+    return stage_pool_stats()
+
 @app.post("/api/tts")
 async def text_to_speech(text: str = Form(...), language: str = Form("en-IN")):
     """
     Convert text to speech using Google Cloud TTS
     Returns base64-encoded MP3 audio
     """
-    result = tts_service.synthesize_speech(text, language)
+    result = await asyncio.to_thread(tts_service.synthesize_speech, text, language)
     return result
 
+
+@app.post("/api/tts/stream")
+async def text_to_speech_stream(text: str = Form(...), language: str = Form("en-IN")):
+    """
+    Streaming TTS: chunked audio/mpeg, one MP3 segment per sentence in order.
+    Sentences are synthesized a few at a time ahead of playback, so audio starts
+    after the first sentence instead of after the whole text.
+    """
+    # stream_speech keeps its own synthesis window; only one finished segment waits here
+    chunks = iterate_in_thread(tts_service.stream_speech, text, language, max_buffered=1)
+    try:
+        # Fail with a status code, not a truncated stream, if nothing can be spoken
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        return JSONResponse(status_code=400, content={"error": "No text to speak", "status": "failed"})
+    except Exception as e:
+        print(f"❌ TTS stream error: {e}")
+        await chunks.aclose()
+        return JSONResponse(status_code=503, content={"error": str(e), "status": "failed"})
+
+    async def audio():
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # Client went away: closes stream_speech, which cancels sentences not started yet
+            await chunks.aclose()
+
+    return StreamingResponse(audio(), media_type="audio/mpeg", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/api/tts/backends")
+async def tts_backends():
+    """Per-backend availability, learned ms/char and failures, plus the audio cache stats."""
+    return tts_service.stats()
+
+
+@app.get("/api/tts/cache/stats")
+async def tts_cache_stats():
+    """Hit/miss counters and hot-set / disk sizes for the synthesized audio cache."""
+    return tts_cache.stats()
+
 @app.get("/api/fairness-report/{demographic}")
 async def get_fairness_report(demographic: str = "all"):
     report = fairness_auditor.full_audit(demographic)
@@ -329,6 +941,14 @@ async def get_patient_summary(patient_id: str):
     return {"error": "Patient not found"}
 
 
+@app.get("/api/patient/{patient_id}/vitals")
+async def get_patient_vitals(patient_id: str, window: int = 10, rollup: str = "hourly", limit: int = 48):
+    """Vitals history: per-vital trend (moving average, slope, spikes) plus hourly/daily rollups."""
+    if rollup not in ("hourly", "daily"):
+        return {"error": "rollup must be 'hourly' or 'daily'", "status": "failed"}
+    return vitals_store.summary(patient_id, window=max(window, 2), rollup=rollup, limit=max(limit, 1))
+
+
 # ═══════════════════════════════════════════════════════════════════
 # MERGED ENDPOINTS — from nexmed_ai and NEXUS_2 projects
 # ═══════════════════════════════════════════════════════════════════
@@ -337,10 +957,16 @@ import cv2
 import base64
 import json
 import hashlib
+import time
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel
-from scipy.ndimage import sobel
 from scipy.signal import find_peaks
+from .services.xray_service import row_gradient_profile, sobel_dy_row
+from .services.result_cache import result_cache, make_cache_key
+from .services import anemia_service
+from .services import cough_service
+from .services.triage_engine import triage_engine, parse_bp
+from .services import bulk_triage
 
 
 def _image_to_base64(img):
@@ -355,6 +981,12 @@ def _read_image_from_upload(file_data):
     return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
 
+@app.get("/api/result-cache/stats")
+async def result_cache_stats():
+    """Hit/miss counters and tier sizes for the image result cache."""
+    return result_cache.stats()
+
+
 # ──────── ANEMIA EYE SCANNER (from nexmed_ai) ────────
 @app.post("/api/anemia-eye-scanner")
 async def anemia_eye_scanner(file: UploadFile = File(...)):
@@ -363,7 +995,12 @@ async def anemia_eye_scanner(file: UploadFile = File(...)):
     Uses OpenCV CLAHE + LAB color space for hemoglobin estimation.
     """
     try:
-        contents = await file.read()
+        contents = await read_upload(file, "anemia-eye-scanner")
+        cache_key = make_cache_key("anemia-eye-scanner", contents)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         img = _read_image_from_upload(contents)
         if img is None:
             return {"error": "Failed to process image", "status": "failed"}
@@ -373,172 +1010,277 @@ async def anemia_eye_scanner(file: UploadFile = File(...)):
         brightness = float(np.mean(gray))
         laplacian_var = float(cv2.Laplacian(gray, cv2.CV_64F).var())
 
-        quality_score = "Good"
-        lighting_status = "Optimal"
-        confidence = "High"
-
-        if brightness < 60:
-            lighting_status = "Too Dark - Results may be inaccurate"
-            confidence = "Low"
-        elif brightness > 200:
-            lighting_status = "Too Bright (glare detected)"
-            confidence = "Low"
-        if laplacian_var < 50:
-            quality_score = "Blurry"
-            confidence = "Low"
-
         # CLAHE enhancement in LAB color space
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-        l, a, b_channel = cv2.split(lab)
-        cl = clahe.apply(l)
-        enhanced_img = cv2.cvtColor(cv2.merge((cl, a, b_channel)), cv2.COLOR_LAB2BGR)
+        enhanced_img = anemia_service.enhance(img)
 
         # ROI analysis
-        resize_img = cv2.resize(enhanced_img, (400, 300))
-        h, w = resize_img.shape[:2]
-        roi = resize_img[int(h * 0.3):int(h * 0.7), int(w * 0.25):int(w * 0.75)]
-        b_val, g_val, r_val = cv2.split(roi)
+        resize_img = cv2.resize(enhanced_img, anemia_service.ROI_GRID)
+        y0, y1, x0, x1 = anemia_service.roi_bounds(*resize_img.shape[:2])
+        b_val, g_val, r_val = cv2.split(resize_img[y0:y1, x0:x1])
         red_mean = float(np.mean(r_val))
         green_mean = float(np.mean(g_val))
-        erythema_index = red_mean - green_mean
-
-        # Diagnostic logic
-        if erythema_index > 45:
-            hemoglobin_status, severity, risk_level, hgb_estimate = "NORMAL (Healthy)", "No pallor detected", "Low", 14.5
-        elif erythema_index > 25:
-            hemoglobin_status, severity, risk_level, hgb_estimate = "MILD / BORDERLINE", "Slight conjunctival pallor", "Medium", 11.2
-        elif erythema_index > 10:
-            hemoglobin_status, severity, risk_level, hgb_estimate = "MODERATE ANEMIA", "Visible pallor - Iron deficiency likely", "High", 9.0
-        else:
-            hemoglobin_status, severity, risk_level, hgb_estimate = "SEVERE ANEMIA", "Critical pallor (Ghostly white)", "Critical", 6.5
-            confidence = "High"
-
-        # Recommendations
-        if hgb_estimate >= 12:
-            recommendations = ["Continue regular health monitoring", "Maintain balanced iron-rich diet", "Annual blood tests recommended"]
-        elif hgb_estimate >= 9:
-            recommendations = ["Increase iron-rich food intake (spinach, meat, beans)", "Consider iron supplements", "Schedule blood test within 1 week"]
-        elif hgb_estimate >= 6:
-            recommendations = ["URGENT: Consult physician immediately", "Prescribed iron supplementation needed", "May require transfusion assessment"]
-        else:
-            recommendations = ["CRITICAL: Emergency medical intervention required", "Likely needs immediate transfusion", "Contact emergency services immediately"]
 
-        # Visualization
-        heatmap_img = resize_img.copy()
-        color = (0, 255, 0) if risk_level == "Low" else (0, 0, 255)
-        cv2.rectangle(heatmap_img, (int(w * 0.25), int(h * 0.3)), (int(w * 0.75), int(h * 0.7)), color, 2)
-        img_str = _image_to_base64(heatmap_img)
+        # Diagnostic logic + recommendations
+        result = anemia_service.build_report(brightness, laplacian_var, red_mean, green_mean)
 
-        return {
-            "status": "success",
-            "hemoglobin_status": hemoglobin_status,
-            "estimated_hemoglobin": hgb_estimate,
-            "severity": severity,
-            "risk_level": risk_level,
-            "hgb_estimate": hgb_estimate,
-            "confidence_score": confidence,
-            "image_quality": {"lighting": lighting_status, "sharpness": quality_score},
-            "erythema_index": round(erythema_index, 2),
-            "color_analysis": {
-                "red_intensity": round(red_mean, 2),
-                "green_intensity": round(green_mean, 2),
-                "color_ratio": round(red_mean / max(green_mean, 1), 3)
-            },
-            "recommendations": recommendations,
-            "processed_image": img_str
-        }
+        # Visualization
+        result["processed_image"] = _image_to_base64(anemia_service.draw_roi(resize_img, result["risk_level"]))
+        result_cache.put(cache_key, result)
+        return result
     except Exception as e:
         print(f"❌ Anemia scanner error: {e}")
         return {"error": str(e), "status": "failed"}
 
 
+@app.post("/api/anemia-eye-scanner/batch")
+async def anemia_eye_scanner_batch(
+    files: List[UploadFile] = File(...),
+    include_images: bool = Form(False)
+):
+    """
+    Screening-camp mode: analyse many eye photos in one request.
+    Images are decoded in parallel onto the 400x300 ROI grid and scored with
+    vectorised reductions; results stream back as NDJSON, one line per image
+    (in upload order) followed by a summary line.
+    """
+    if len(files) > anemia_service.MAX_BATCH_IMAGES:
+        return {"error": f"Too many images; limit is {anemia_service.MAX_BATCH_IMAGES} per batch", "status": "failed"}
+
+    print(f"👁️ Batch anemia screening: {len(files)} images")
+    started = time.perf_counter()
+
+    errors: Dict[int, str] = {}
+    payloads: Dict[int, bytes] = {}
+    for i, f in enumerate(files):
+        try:
+            payloads[i] = await read_upload(f, "anemia-eye-scanner")
+        except Exception as e:
+            errors[i] = str(e)
+
+    loop = asyncio.get_running_loop()
+    prepared = await asyncio.gather(*(
+        loop.run_in_executor(anemia_service.decode_pool, anemia_service.prepare_for_batch, data)
+        for data in payloads.values()
+    ))
+
+    ok_indices: List[int] = []
+    originals, enhanced = [], []
+    for i, item in zip(payloads.keys(), prepared):
+        if item is None:
+            errors[i] = "Failed to process image"
+            continue
+        ok_indices.append(i)
+        originals.append(item[0])
+        enhanced.append(item[1])
+
+    metrics = {}
+    enhanced_stack = None
+    if ok_indices:
+        enhanced_stack = np.stack(enhanced)
+        metrics = anemia_service.batch_metrics(np.stack(originals), enhanced_stack)
+    del originals, enhanced
+    row_of = {idx: row for row, idx in enumerate(ok_indices)}
+
+    def stream():
+        risk_counts: Dict[str, int] = {}
+        for i, f in enumerate(files):
+            if i in errors:
+                line = {"index": i, "filename": f.filename, "status": "failed", "error": errors[i]}
+            else:
+                row = row_of[i]
+                line = {"index": i, "filename": f.filename, **anemia_service.build_report(
+                    float(metrics["brightness"][row]), float(metrics["laplacian_var"][row]),
+                    float(metrics["red_mean"][row]), float(metrics["green_mean"][row]),
+                )}
+                risk_counts[line["risk_level"]] = risk_counts.get(line["risk_level"], 0) + 1
+                if include_images:
+                    line["processed_image"] = _image_to_base64(
+                        anemia_service.draw_roi(enhanced_stack[row], line["risk_level"])
+                    )
+            yield json.dumps(line) + "\n"
+        yield json.dumps({
+            "summary": True,
+            "total": len(files),
+            "analyzed": len(ok_indices),
+            "failed": len(errors),
+            "risk_counts": risk_counts,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 # ──────── COUGH ANALYZER (from nexmed_ai — Python rewrite) ────────
 @app.post("/api/cough-analyzer")
 async def cough_analyzer(request: dict):
     """
     Analyze cough audio for respiratory condition detection.
-    Uses signal processing metrics from the audio data.
+    Decodes WAV/PCM (or WebM/Ogg via ffmpeg) at the real sample rate and
+    computes framed STFT features.
+    Optional fields: "encoding" (pcm_s16le, pcm_f32le, ...) and "sampleRate" for raw PCM.
     """
     try:
         audio_data = request.get("audioData", "")
-        duration_ms = request.get("duration", 1000)
 
         if not audio_data:
             return {"error": "No audio data provided", "status": "failed"}
 
         # Decode base64 audio
         audio_bytes = base64.b64decode(audio_data)
-        audio_array = np.frombuffer(audio_bytes, dtype=np.uint8).astype(np.float32)
+        # Browser WebM goes through an ffmpeg subprocess: keep it off the event loop
+        samples, sample_rate, decoder = await asyncio.to_thread(
+            cough_service.decode_audio, audio_bytes, request.get("encoding"), request.get("sampleRate")
+        )
 
-        if len(audio_array) == 0:
+        if len(samples) == 0:
             return {"error": "Empty audio data", "status": "failed"}
 
-        # Signal processing
-        audio_norm = audio_array / max(np.max(np.abs(audio_array)), 1)
-        rms_energy = float(np.sqrt(np.mean(audio_norm ** 2)))
-        zero_crossings = float(np.sum(np.diff(np.sign(audio_norm - np.mean(audio_norm))) != 0) / len(audio_norm))
-
-        # Spectral analysis
-        fft_vals = np.abs(np.fft.fft(audio_norm))
-        freqs = np.fft.fftfreq(len(audio_norm), 1.0 / 44100)
-        pos_mask = freqs > 0
-        spectral_centroid = float(np.sum(freqs[pos_mask] * fft_vals[pos_mask]) / max(np.sum(fft_vals[pos_mask]), 1))
-
-        # Cough classification based on acoustic features
-        if rms_energy > 0.5 and zero_crossings > 0.3:
-            cough_type, risk_level, severity = "Productive (Wet)", "Medium-High", "Moderate"
-            conditions = ["Bronchitis", "Pneumonia", "Post-nasal drip"]
-        elif rms_energy > 0.3 and zero_crossings < 0.15:
-            cough_type, risk_level, severity = "Dry Cough", "Low-Medium", "Mild"
-            conditions = ["Viral infection", "Allergic reaction", "Irritant exposure"]
-        elif rms_energy > 0.6:
-            cough_type, risk_level, severity = "Barking Cough", "High", "Significant"
-            conditions = ["Croup", "Pertussis", "Acute bronchitis"]
-        else:
-            cough_type, risk_level, severity = "Mild Cough", "Low", "Minor"
-            conditions = ["Common cold", "Mild irritation"]
-
-        # Recommendations
-        if risk_level in ["High", "Medium-High"]:
-            recs = ["Seek medical evaluation within 24 hours", "Start prescribed antibiotics if bacterial",
-                     "Monitor oxygen saturation", "Stay hydrated"]
-            urgent = True
-        elif risk_level == "Medium":
-            recs = ["Monitor symptoms for 3-5 days", "Use honey and warm liquids", "Over-the-counter cough suppressant"]
-            urgent = False
-        else:
-            recs = ["Rest and hydration recommended", "Monitor for worsening symptoms", "Use steam inhalation"]
-            urgent = False
+        features = cough_service.StreamingCoughAnalyzer(sample_rate).analyze(samples)
+        result = cough_service.build_report(
+            features["rms_energy"], features["zero_crossing_rate"], features["spectral_centroid"],
+            features["duration_ms"], features["burst_count"]
+        )
+        result["audio"] = {"decoder": decoder, "sample_rate": sample_rate, "samples": len(samples)}
+        return result
+    except Exception as e:
+        print(f"❌ Cough analyzer error: {e}")
+        return {"error": str(e), "status": "failed"}
 
+
+@app.post("/api/cough-analyzer/batch")
+async def cough_analyzer_batch(request: dict):
+    """
+    Household mode: analyse many cough clips in one request.
+    Body: {"clips": [{"id": "...", "audioData": "<base64>", "encoding": ..., "sampleRate": ...}, ...]}
+    Clips sharing a sample rate are featurised and classified in one vectorised pass.
+    """
+    try:
+        clips = request.get("clips", [])
+        if not clips:
+            return {"error": "No clips provided", "status": "failed"}
+        if len(clips) > cough_service.MAX_BATCH_CLIPS:
+            return {"error": f"Too many clips; limit is {cough_service.MAX_BATCH_CLIPS} per batch", "status": "failed"}
+
+        started = time.perf_counter()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(clips)
+        by_rate: Dict[int, List[tuple]] = {}
+
+        def decode(clip):
+            return cough_service.decode_audio(
+                base64.b64decode(clip.get("audioData", "")), clip.get("encoding"), clip.get("sampleRate")
+            )
+
+        # Decodes (ffmpeg subprocesses for WebM) run in worker threads, not on the event loop
+        decoded = await asyncio.gather(*(asyncio.to_thread(decode, clip) for clip in clips), return_exceptions=True)
+        for i, outcome in enumerate(decoded):
+            try:
+                if isinstance(outcome, Exception):
+                    raise outcome
+                samples, sample_rate, decoder = outcome
+                if len(samples) == 0:
+                    raise ValueError("Empty audio data")
+                by_rate.setdefault(sample_rate, []).append((i, samples, decoder))
+            except Exception as e:
+                results[i] = {"error": str(e), "status": "failed"}
+
+        def analyze() -> float:
+            audio_seconds = 0.0
+            for sample_rate, group in by_rate.items():
+                features = cough_service.batch_features([samples for _, samples, _ in group], sample_rate)
+                classes = cough_service.classify_cough_batch(features["rms_energy"], features["zero_crossing_rate"])
+                audio_seconds += float(features["duration_ms"].sum()) / 1000.0
+                for row, (i, samples, decoder) in enumerate(group):
+                    report = cough_service.build_report(
+                        float(features["rms_energy"][row]), float(features["zero_crossing_rate"][row]),
+                        float(features["spectral_centroid"][row]), float(features["duration_ms"][row]),
+                        int(features["burst_count"][row]), cough_class=int(classes[row])
+                    )
+                    report["audio"] = {"decoder": decoder, "sample_rate": sample_rate, "samples": len(samples)}
+                    results[i] = report
+            return audio_seconds
+
+        # Featurising and classifying a full batch is seconds of numpy work: keep it off the event loop too
+        audio_seconds = await asyncio.to_thread(analyze)
+
+        for i, clip in enumerate(clips):
+            results[i] = {"id": clip.get("id", i), **results[i]}
+
+        elapsed = time.perf_counter() - started
         return {
             "status": "success",
-            "cough_type": cough_type,
-            "risk_level": risk_level,
-            "severity_level": severity,
-            "confidence_score": "High" if rms_energy > 0.1 else "Low",
-            "acoustic_analysis": {
-                "rms_energy": round(rms_energy, 4),
-                "zero_crossing_rate": round(zero_crossings, 4),
-                "spectral_centroid": round(spectral_centroid, 2),
-                "duration_ms": duration_ms
-            },
-            "pattern_analysis": {
-                "intensity_level": "Strong" if rms_energy > 0.4 else "Moderate" if rms_energy > 0.2 else "Weak",
-                "frequency_content": "High" if zero_crossings > 0.25 else "Mid" if zero_crossings > 0.1 else "Low",
-                "estimated_frequency_hz": round(spectral_centroid, 0),
-                "burst_detection": "Multi-burst" if rms_energy > 0.5 else "Single burst",
-                "duration_seconds": round(duration_ms / 1000, 2)
-            },
-            "predicted_conditions": conditions,
-            "recommendations": recs,
-            "urgent_action": urgent
+            "results": results,
+            "throughput": {
+                "clips": len(clips),
+                "audio_seconds": round(audio_seconds, 2),
+                "elapsed_ms": round(elapsed * 1000, 1),
+                "realtime_factor": round(audio_seconds / elapsed, 1) if elapsed > 0 else None,
+            }
         }
     except Exception as e:
-        print(f"❌ Cough analyzer error: {e}")
+        print(f"❌ Cough batch error: {e}")
         return {"error": str(e), "status": "failed"}
 
 
+@app.websocket("/ws/cough-analyzer")
+async def cough_analyzer_stream(websocket: WebSocket):
+    """
+    Live cough analysis. Protocol:
+      1. client sends JSON config: {"encoding": "wav" | "pcm_s16le" | ..., "sampleRate": 16000}
+      2. client streams binary audio chunks; server replies per chunk with
+         {"type": "frames", "frames": [...], "burst_count": n}
+      3. client sends {"type": "end"}; server replies {"type": "result", ...} and closes
+    Only one partial frame is buffered, so memory is bounded for any length.
+    """
+    await websocket.accept()
+    try:
+        config = await websocket.receive_json()
+        decoder = cough_service.PCMStreamDecoder(config.get("encoding", "wav"), config.get("sampleRate"))
+        analyzer = None
+        await websocket.send_json({"type": "ready"})
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                samples = decoder.feed(message["bytes"])
+                if analyzer is None and decoder.ready:
+                    analyzer = cough_service.StreamingCoughAnalyzer(decoder.sample_rate)
+                if analyzer is None:
+                    continue
+                frames = analyzer.push(samples)
+                if frames:
+                    await websocket.send_json({"type": "frames", "frames": frames, "burst_count": analyzer.burst_count})
+            elif message.get("text") is not None and json.loads(message["text"]).get("type") == "end":
+                break
+
+        if analyzer is None or analyzer.n_samples == 0:
+            await websocket.send_json({"type": "error", "error": "No audio received", "status": "failed"})
+        else:
+            frames = analyzer.flush()
+            if frames:
+                await websocket.send_json({"type": "frames", "frames": frames, "burst_count": analyzer.burst_count})
+            features = analyzer.summary()
+            result = cough_service.build_report(
+                features["rms_energy"], features["zero_crossing_rate"], features["spectral_centroid"],
+                features["duration_ms"], features["burst_count"]
+            )
+            await websocket.send_json({"type": "result", **result})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"❌ Cough stream error: {e}")
+        # The failure may be the socket itself (client gone, already closed): reporting it is best effort
+        try:
+            if (websocket.client_state == WebSocketState.CONNECTED
+                    and websocket.application_state == WebSocketState.CONNECTED):
+                await websocket.send_json({"type": "error", "error": str(e), "status": "failed"})
+                await websocket.close()
+        except Exception as send_error:
+            print(f"⚠️ Cough stream error not delivered: {send_error}")
+
+
 # ──────── VEIN FINDER (from nexmed_ai) ────────
 @app.post("/api/vein-finder")
 async def vein_finder(file: UploadFile = File(...)):
@@ -546,7 +1288,12 @@ async def vein_finder(file: UploadFile = File(...)):
     Near-infrared vein visualization using CLAHE + green channel enhancement.
     """
     try:
-        contents = await file.read()
+        contents = await read_upload(file, "vein-finder")
+        cache_key = make_cache_key("vein-finder", contents)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         img = _read_image_from_upload(contents)
         if img is None:
             return {"error": "Failed to process image", "status": "failed"}
@@ -561,7 +1308,9 @@ async def vein_finder(file: UploadFile = File(...)):
         final_view = cv2.addWeighted(img, 0.6, vein_map, 0.4, 0)
 
         img_str = _image_to_base64(final_view)
-        return {"status": "success", "image": f"data:image/jpeg;base64,{img_str}"}
+        result = {"status": "success", "image": f"data:image/jpeg;base64,{img_str}"}
+        result_cache.put(cache_key, result)
+        return result
     except Exception as e:
         print(f"❌ Vein finder error: {e}")
         return {"error": str(e), "status": "failed"}
@@ -574,7 +1323,12 @@ async def risk_projection(file: UploadFile = File(...), days: int = Form(7)):
     Heatmap-based disease risk projection over time.
     """
     try:
-        contents = await file.read()
+        contents = await read_upload(file, "risk-projection")
+        cache_key = make_cache_key("risk-projection", contents, days=days)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         img = _read_image_from_upload(contents)
         if img is None:
             return {"error": "Failed to process image", "status": "failed"}
@@ -588,13 +1342,83 @@ async def risk_projection(file: UploadFile = File(...), days: int = Form(7)):
         final_view = cv2.addWeighted(img, 1, heatmap, alpha, 0)
 
         img_str = _image_to_base64(final_view)
-        return {"status": "success", "image": f"data:image/jpeg;base64,{img_str}", "days": days}
+        result = {"status": "success", "image": f"data:image/jpeg;base64,{img_str}", "days": days}
+        result_cache.put(cache_key, result)
+        return result
     except Exception as e:
         print(f"❌ Risk projection error: {e}")
         return {"error": str(e), "status": "failed"}
 
 
 # ──────── X-RAY FRACTURE DETECTOR (from NEXUS_2) ────────
+def _xray_image_findings(contents):
+    """Image-only part of the X-ray analysis; a pure function of the upload bytes."""
+    img = Image.open(io.BytesIO(contents)).convert('L')
+    img_array = np.asarray(img)
+
+    # Sobel edge detection (float32, strip-by-strip for large films)
+    row_grad, col_mean = row_gradient_profile(img_array)
+
+    peaks, properties = find_peaks(row_grad, prominence=0.15, distance=img.height * 0.03, width=5)
+
+    if len(peaks) > 0:
+        prominences = properties['prominences']
+        sort_idx = np.argsort(prominences)[::-1]
+        peaks = peaks[sort_idx]
+
+    # Attention targets
+    attention_targets = []
+    labels = ["Fracture Site", "Bone Fragment", "Cortical Break"]
+    bone_center_x = int(np.argmax(col_mean))
+
+    for i, peak_row in enumerate(peaks[:3]):
+        row_slice = sobel_dy_row(img_array, peak_row)
+        edge_peaks, _ = find_peaks(row_slice, prominence=np.max(row_slice) * 0.15 if np.max(row_slice) > 0 else 0.1, distance=30, width=10)
+
+        if len(edge_peaks) >= 2:
+            x = float(np.mean(edge_peaks[:2]))
+        elif len(edge_peaks) == 1:
+            x = float(edge_peaks[0])
+        else:
+            x = float(np.argmax(row_slice)) if np.max(row_slice) > 0 else bone_center_x
+
+        if abs(x - bone_center_x) > img.width * 0.2:
+            x = bone_center_x
+
+        attention_targets.append({
+            "x": round((x / img.width) * 100, 1),
+            "y": round((peak_row / img.height) * 100, 1),
+            "label": labels[i % len(labels)]
+        })
+
+    is_fracture = len(peaks) > 0
+    confidence = 94.2 if not is_fracture else min(99.0, 70 + len(peaks) * 10)
+    diagnosis_text = "No abnormality detected" if not is_fracture else f"Fracture detected ({len(peaks)} potential sites)"
+    is_severe = is_fracture and len(peaks) > 1
+
+    # Default precautions
+    precautions = []
+    if is_fracture:
+        precautions = [
+            "Immobilize the affected area",
+            "Apply ice to reduce swelling",
+            "Keep the limb elevated",
+            "Avoid putting weight on the injury",
+            "Consult an orthopedic specialist"
+        ]
+
+    return {
+        "status": "success",
+        "diagnosis": diagnosis_text,
+        "confidence": confidence,
+        "is_severe": is_severe,
+        "is_fracture": is_fracture,
+        "fracture_sites": len(peaks),
+        "attention_targets": attention_targets,
+        "precautions": precautions
+    }
+
+
 @app.post("/api/xray-analyze")
 async def xray_analyze(file: UploadFile = File(...), symptoms: str = Form("")):
     """
@@ -602,65 +1426,12 @@ async def xray_analyze(file: UploadFile = File(...), symptoms: str = Form("")):
     Returns attention targets highlighting potential fracture sites.
     """
     try:
-        contents = await file.read()
-        img = Image.open(io.BytesIO(contents)).convert('L')
-        img_array = np.array(img)
-
-        # Sobel edge detection
-        dy = sobel(img_array, axis=0)
-        dx = sobel(img_array, axis=1)
-        grad = np.sqrt(dx ** 2 + dy ** 2)
-        row_grad = np.mean(np.abs(dy), axis=1)
-        row_grad = row_grad / np.max(row_grad) if np.max(row_grad) > 0 else row_grad
-
-        peaks, properties = find_peaks(row_grad, prominence=0.15, distance=img.height * 0.03, width=5)
-
-        if len(peaks) > 0:
-            prominences = properties['prominences']
-            sort_idx = np.argsort(prominences)[::-1]
-            peaks = peaks[sort_idx]
-
-        # Attention targets
-        attention_targets = []
-        labels = ["Fracture Site", "Bone Fragment", "Cortical Break"]
-        col_mean = np.mean(img_array, axis=0)
-        bone_center_x = int(np.argmax(col_mean))
-
-        for i, peak_row in enumerate(peaks[:3]):
-            row_slice = np.abs(dy[peak_row, :])
-            edge_peaks, _ = find_peaks(row_slice, prominence=np.max(row_slice) * 0.15 if np.max(row_slice) > 0 else 0.1, distance=30, width=10)
-
-            if len(edge_peaks) >= 2:
-                x = float(np.mean(edge_peaks[:2]))
-            elif len(edge_peaks) == 1:
-                x = float(edge_peaks[0])
-            else:
-                x = float(np.argmax(row_slice)) if np.max(row_slice) > 0 else bone_center_x
-
-            if abs(x - bone_center_x) > img.width * 0.2:
-                x = bone_center_x
-
-            attention_targets.append({
-                "x": round((x / img.width) * 100, 1),
-                "y": round((peak_row / img.height) * 100, 1),
-                "label": labels[i % len(labels)]
-            })
-
-        is_fracture = len(peaks) > 0
-        confidence = 94.2 if not is_fracture else min(99.0, 70 + len(peaks) * 10)
-        diagnosis_text = "No abnormality detected" if not is_fracture else f"Fracture detected ({len(peaks)} potential sites)"
-        is_severe = is_fracture and len(peaks) > 1
-
-        # Default precautions
-        precautions = []
-        if is_fracture:
-            precautions = [
-                "Immobilize the affected area",
-                "Apply ice to reduce swelling",
-                "Keep the limb elevated",
-                "Avoid putting weight on the injury",
-                "Consult an orthopedic specialist"
-            ]
+        contents = await read_upload(file, "xray-analyze")
+        cache_key = make_cache_key("xray-analyze", contents)
+        findings = result_cache.get(cache_key)
+        if findings is None:
+            findings = _xray_image_findings(contents)
+            result_cache.put(cache_key, findings)
 
         # Semantic search for similar cases (if vector_db available)
         similar_cases = []
@@ -679,17 +1450,7 @@ async def xray_analyze(file: UploadFile = File(...), symptoms: str = Form("")):
         except Exception:
             pass
 
-        return {
-            "status": "success",
-            "diagnosis": diagnosis_text,
-            "confidence": confidence,
-            "is_severe": is_severe,
-            "is_fracture": is_fracture,
-            "fracture_sites": len(peaks),
-            "attention_targets": attention_targets,
-            "precautions": precautions,
-            "similar_cases": similar_cases
-        }
+        return {**findings, "similar_cases": similar_cases}
     except Exception as e:
         print(f"❌ X-ray analysis error: {e}")
         import traceback
@@ -707,105 +1468,96 @@ async def clinical_intelligence(
     last_temp: float = Form(None),
     heart_rate: int = Form(None),
     bp: str = Form(None),
-    o2: int = Form(None)
+    o2: int = Form(None),
+    patient_id: str = Form(None)
 ):
     """
     Advanced triage engine: SIRS scoring, shock index, red flag detection, differential diagnosis.
+    Rules live in app/rules/triage_rules.json and are compiled by the triage engine.
+    With a patient_id, stored history supplies last_temp and this visit is recorded.
     """
     try:
-        shock_index = 0.0
-        map_val = 0.0
-        pulse_pressure = 0.0
-
-        if bp and '/' in bp and heart_rate:
-            try:
-                sys_val, dia_val = map(int, bp.split('/'))
-                pulse_pressure = sys_val - dia_val
-                map_val = (sys_val + (2 * dia_val)) / 3
-                if sys_val > 0:
-                    shock_index = heart_rate / sys_val
-            except (ValueError, ZeroDivisionError):
-                pass
-
-        base_fever = 38.0 if age < 65 else 37.5
-        has_fever = temp >= base_fever
-
-        sirs_score = 0
-        if temp > 38.0 or temp < 36.0: sirs_score += 1
-        if heart_rate and heart_rate > 90: sirs_score += 1
-        if "shortness of breath" in symptoms.lower(): sirs_score += 1
-
-        hypoxia_level = "None"
-        o2_status = "Normal"
-        if o2:
-            if o2 < 85: hypoxia_level, o2_status = "CRITICAL HYPOXIA", "Critical"
-            elif o2 < 90: hypoxia_level, o2_status = "Severe Hypoxia", "Severe"
-            elif o2 < 94: hypoxia_level, o2_status = "Mild Hypoxia", "Mild"
-
-        red_flags = []
-        symp_lower = symptoms.lower()
-        if sirs_score >= 2: red_flags.append(f"SIRS ALERT (Score: {sirs_score}/3) - Potential Sepsis")
-        if o2_status != "Normal": red_flags.append(f"{hypoxia_level} Detected (SpO2: {o2}%)")
-        if shock_index > 0.9: red_flags.append(f"CRITICAL: Shock Index {shock_index:.2f} (>0.9 indicates instability)")
-        if map_val < 65 and map_val > 0: red_flags.append(f"Hypoperfusion Risk (MAP {map_val:.0f} mmHg)")
-        if "chest pain" in symp_lower: red_flags.append("Potential Acute Coronary Syndrome (Triage Level 1)")
-        if temp > 40.0: red_flags.append("Hyperpyrexia - Immediate Cooling Required")
-
-        trend = "Stable"
-        if last_temp:
-            if temp > last_temp + 0.5: trend = "Worsening (Spiking Fever)"
-            elif temp < last_temp - 0.5: trend = "Improving (Defervescence)"
-
-        rule_outs = []
-        referral = "General Physician"
-        if "cough" in symp_lower:
-            referral = "Pulmonologist"
-            rule_outs = ["Bronchitis", "Pneumonia", "Viral URI"]
-            if "night sweats" in symp_lower or "weight loss" in symp_lower:
-                rule_outs.append("Tuberculosis (High Probability)")
-        if "abdominal" in symp_lower:
-            referral = "Gastroenterologist"
-            rule_outs = ["Gastritis", "Food Poisoning"]
-            if "right lower" in symp_lower:
-                red_flags.append("Possible Appendicitis")
-        if age > 70 and has_fever:
-            referral = "Geriatric Specialist / ER"
-
-        prevention = ["Maintain strict hydration"]
-        if "diabetes" in history.lower():
-            prevention.append("Strict Glycemic control (Sepsis risk elevated)")
-
-        triage_score = 5
-        if len(red_flags) > 0: triage_score = 3
-        if sirs_score >= 2 or shock_index > 0.9: triage_score = 2
-        if "chest pain" in symp_lower or o2_status == "Critical": triage_score = 1
+        if patient_id:
+            if last_temp is None:
+                last_temp = vitals_store.last_value(patient_id, "temperature")
+            systolic, diastolic = parse_bp(bp)
+            vitals_store.record(
+                patient_id, temperature=temp, heart_rate=heart_rate or None, spo2=o2 or None,
+                systolic=None if np.isnan(systolic) else systolic, diastolic=None if np.isnan(diastolic) else diastolic
+            )
+
+        r = triage_engine.evaluate(age, temp, symptoms, history, last_temp, heart_rate, bp, o2)
+        triage_score = r["triage_level"]
+        sirs_score = r["sirs_score"]
+        red_flags = r["red_flags"]
 
-        return {
+        response = {
             "status": "success",
             "triage_level": triage_score,
             "protocol_compliance": "COMPLIANT" if (age and temp and symptoms) else "PARTIAL DATA",
             "age_adjusted_analysis": {
-                "threshold": base_fever,
-                "status": "Fever" if has_fever else "Afebrile",
+                "threshold": r["base_fever"],
+                "status": "Fever" if r["has_fever"] else "Afebrile",
                 "derived_vitals": {
-                    "shock_index": round(shock_index, 2),
-                    "MAP": round(map_val, 1),
-                    "pulse_pressure": pulse_pressure,
+                    "shock_index": round(r["shock_index"], 2),
+                    "MAP": round(r["map"], 1),
+                    "pulse_pressure": r["pulse_pressure"],
                     "sirs_score": sirs_score
                 }
             },
             "red_flags": red_flags,
-            "temporal_trend": trend,
-            "rule_outs": rule_outs,
-            "prevention_plan": prevention,
-            "referral_engine": referral,
-            "feature_story": f"AI Triage Level: {triage_score}. Found {len(red_flags)} critical flags." + (" SIRS criteria met (Sepsis screening advised)." if sirs_score >= 2 else "")
+            "temporal_trend": r["temporal_trend"],
+            "rule_outs": r["rule_outs"],
+            "prevention_plan": r["prevention"],
+            "referral_engine": r["referral"],
+            "feature_story": f"AI Triage Level: {triage_score}. Found {len(red_flags)} critical flags." + (" SIRS criteria met (Sepsis screening advised)." if r["sirs_alert"] else "")
         }
+        if patient_id:
+            response["vitals_history"] = vitals_store.trends(patient_id)
+        return response
     except Exception as e:
         print(f"❌ Clinical intelligence error: {e}")
         return {"error": str(e), "status": "failed"}
 
 
+@app.post("/api/clinical-intelligence/bulk")
+async def clinical_intelligence_bulk(
+    file: UploadFile = File(...),
+    include_details: bool = Form(False)
+):
+    """
+    Outbreak mode: triage a whole patient list (CSV with a header row, or NDJSON).
+    Columns: age, temp, symptoms (required); history, last_temp, heart_rate, bp, o2,
+    patient_id (optional). Streams NDJSON sorted by urgency, then a summary line.
+    """
+    try:
+        started = time.perf_counter()
+        contents = await read_upload(file, "bulk-triage")
+        kind = sniff_table_format(contents[:HEADER_BYTES])
+        columns = bulk_triage.parse_ndjson(contents) if kind == "ndjson" else bulk_triage.parse_csv(contents)
+        del contents
+        scored = bulk_triage.score_columns(columns)
+        print(f"🚑 Bulk triage: {scored['rows']} patients scored in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return StreamingResponse(
+            bulk_triage.iter_ndjson(scored, columns, include_details, started),
+            media_type="application/x-ndjson"
+        )
+    except Exception as e:
+        print(f"❌ Bulk triage error: {e}")
+        return {"error": str(e), "status": "failed"}
+
+@app.post("/api/triage-rules/reload")
+async def reload_triage_rules():
+    """Recompile the triage rulebook from disk (also happens automatically on file change)."""
+    try:
+        info = triage_engine.reload()
+        print(f"🔄 Triage rulebook v{info['version']} reloaded")
+        return {"status": "success", **info}
+    except Exception as e:
+        print(f"❌ Triage rulebook reload error: {e}")
+        return {"error": str(e), "status": "failed", "active": triage_engine.info()}
+
+
 # ──────── SEMANTIC SEARCH (from NEXUS_2) ────────
 @app.post("/api/semantic-search")
 async def semantic_search(request: dict):
@@ -874,7 +1626,7 @@ async def upload_prescription(
         from .services.vector_db import vector_db, generate_embedding
         from .services import medical_db
 
-        contents = await file.read()
+        contents = await read_upload(image, "prescription")
 
         # Save image
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
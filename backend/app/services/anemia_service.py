@@ -0,0 +1,144 @@
+"""
+Anemia Screening Service — conjunctiva color analysis shared by the single
+and batch eye-scanner endpoints.
+
+The batch path decodes images in a thread pool, resizes them onto the common
+400x300 ROI grid and stacks them, so colour and quality metrics for a whole
+screening camp are single NumPy reductions.
+"""
+import os
+import numpy as np
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+ROI_GRID = (400, 300)  # (width, height) in cv2 order
+MAX_BATCH_IMAGES = int(os.getenv("ANEMIA_MAX_BATCH_IMAGES", "64"))
+
+# cv2 releases the GIL while decoding, so threads give real parallelism
+decode_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 2), thread_name_prefix="anemia-decode")
+
+
+def roi_bounds(h: int, w: int) -> Tuple[int, int, int, int]:
+    """(y0, y1, x0, x1) of the central conjunctiva region."""
+    return int(h * 0.3), int(h * 0.7), int(w * 0.25), int(w * 0.75)
+
+
+def enhance(img: np.ndarray) -> np.ndarray:
+    """CLAHE on the L channel of LAB, converted back to BGR."""
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+    l, a, b_channel = cv2.split(lab)
+    cl = clahe.apply(l)
+    return cv2.cvtColor(cv2.merge((cl, a, b_channel)), cv2.COLOR_LAB2BGR)
+
+
+def classify_erythema(erythema_index: float) -> Tuple[str, str, str, float]:
+    """(hemoglobin_status, severity, risk_level, hgb_estimate)"""
+    if erythema_index > 45:
+        return "NORMAL (Healthy)", "No pallor detected", "Low", 14.5
+    if erythema_index > 25:
+        return "MILD / BORDERLINE", "Slight conjunctival pallor", "Medium", 11.2
+    if erythema_index > 10:
+        return "MODERATE ANEMIA", "Visible pallor - Iron deficiency likely", "High", 9.0
+    return "SEVERE ANEMIA", "Critical pallor (Ghostly white)", "Critical", 6.5
+
+
+def recommendations_for(hgb_estimate: float) -> List[str]:
+    if hgb_estimate >= 12:
+        return ["Continue regular health monitoring", "Maintain balanced iron-rich diet", "Annual blood tests recommended"]
+    if hgb_estimate >= 9:
+        return ["Increase iron-rich food intake (spinach, meat, beans)", "Consider iron supplements", "Schedule blood test within 1 week"]
+    if hgb_estimate >= 6:
+        return ["URGENT: Consult physician immediately", "Prescribed iron supplementation needed", "May require transfusion assessment"]
+    return ["CRITICAL: Emergency medical intervention required", "Likely needs immediate transfusion", "Contact emergency services immediately"]
+
+
+def build_report(brightness: float, laplacian_var: float, red_mean: float, green_mean: float) -> Dict[str, Any]:
+    """Screening result from the four scalar measurements (no image payload)."""
+    quality_score = "Good"
+    lighting_status = "Optimal"
+    confidence = "High"
+
+    if brightness < 60:
+        lighting_status = "Too Dark - Results may be inaccurate"
+        confidence = "Low"
+    elif brightness > 200:
+        lighting_status = "Too Bright (glare detected)"
+        confidence = "Low"
+    if laplacian_var < 50:
+        quality_score = "Blurry"
+        confidence = "Low"
+
+    erythema_index = red_mean - green_mean
+    hemoglobin_status, severity, risk_level, hgb_estimate = classify_erythema(erythema_index)
+    if risk_level == "Critical":
+        confidence = "High"
+
+    return {
+        "status": "success",
+        "hemoglobin_status": hemoglobin_status,
+        "estimated_hemoglobin": hgb_estimate,
+        "severity": severity,
+        "risk_level": risk_level,
+        "hgb_estimate": hgb_estimate,
+        "confidence_score": confidence,
+        "image_quality": {"lighting": lighting_status, "sharpness": quality_score},
+        "erythema_index": round(erythema_index, 2),
+        "color_analysis": {
+            "red_intensity": round(red_mean, 2),
+            "green_intensity": round(green_mean, 2),
+            "color_ratio": round(red_mean / max(green_mean, 1), 3)
+        },
+        "recommendations": recommendations_for(hgb_estimate),
+    }
+
+
+def draw_roi(resize_img: np.ndarray, risk_level: str) -> np.ndarray:
+    """Copy of the resized image with the analysed ROI outlined."""
+    h, w = resize_img.shape[:2]
+    y0, y1, x0, x1 = roi_bounds(h, w)
+    heatmap_img = resize_img.copy()
+    color = (0, 255, 0) if risk_level == "Low" else (0, 0, 255)
+    cv2.rectangle(heatmap_img, (x0, y0), (x1, y1), color, 2)
+    return heatmap_img
+
+
+# ──────── Batch path ────────
+def prepare_for_batch(contents: bytes) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Decode one upload onto the ROI grid: (resized original, resized enhanced)."""
+    img = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    resized = cv2.resize(img, ROI_GRID, interpolation=cv2.INTER_AREA)
+    return resized, cv2.resize(enhance(img), ROI_GRID)
+
+
+def _laplacian_var(gray_stack: np.ndarray) -> np.ndarray:
+    """Per-image variance of the 4-neighbour Laplacian (cv2 ksize=1, reflect-101 border)."""
+    p = np.pad(gray_stack, ((0, 0), (1, 1), (1, 1)), mode="reflect")
+    lap = p[:, :-2, 1:-1] + p[:, 2:, 1:-1] + p[:, 1:-1, :-2] + p[:, 1:-1, 2:] - 4 * p[:, 1:-1, 1:-1]
+    return lap.var(axis=(1, 2))
+
+
+def batch_metrics(originals: np.ndarray, enhanced: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Vectorised measurements over stacked (N, 300, 400, 3) BGR arrays.
+    Quality is measured on the grid rather than full resolution, so
+    sharpness values are comparable across phones with different cameras.
+    """
+    h, w = enhanced.shape[1:3]
+    y0, y1, x0, x1 = roi_bounds(h, w)
+    roi = enhanced[:, y0:y1, x0:x1]
+    red_mean = roi[..., 2].mean(axis=(1, 2), dtype=np.float64)
+    green_mean = roi[..., 1].mean(axis=(1, 2), dtype=np.float64)
+
+    # BT.601 luma, matching cv2.COLOR_BGR2GRAY
+    gray = originals.astype(np.float32) @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+    return {
+        "brightness": gray.mean(axis=(1, 2)),
+        "laplacian_var": _laplacian_var(gray),
+        "red_mean": red_mean,
+        "green_mean": green_mean,
+        "erythema_index": red_mean - green_mean,
+    }
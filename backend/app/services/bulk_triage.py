@@ -0,0 +1,190 @@
+"""
+Bulk Triage Service — scores whole patient lists (CSV or NDJSON) with the
+compiled triage rulebook.
+
+Rows are turned into columns once; BP strings, derived vitals, SIRS scores
+and hypoxia bands are NumPy column operations, and the rulebook is evaluated
+over the full (rows, fields) matrix in one call. Results are ordered by
+urgency: triage level, then number of red flags, then shock index.
+"""
+import os
+import csv
+import io
+import json
+import time
+import logging
+import numpy as np
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .triage_engine import FIELDS, FIELD_INDEX, derive_vitals, parse_bp_column, triage_engine
+
+logger = logging.getLogger(__name__)
+
+MAX_BULK_ROWS = int(os.getenv("BULK_TRIAGE_MAX_ROWS", "200000"))
+STREAM_BATCH_ROWS = 2000
+
+NUMERIC_COLUMNS = ("age", "temp", "heart_rate", "o2", "last_temp")
+# Same falsy-means-missing convention as the single-patient form
+FALSY_MISSING = ("heart_rate", "o2", "last_temp")
+ID_COLUMNS = ("patient_id", "id", "name")
+
+
+class BulkTriageError(ValueError):
+    """Raised when a patient list cannot be parsed."""
+
+
+def _normalise_header(name: str) -> str:
+    return (name or "").strip().lower().replace(" ", "_")
+
+
+def parse_csv(data: bytes) -> Dict[str, List[str]]:
+    """Header row plus data rows -> {column: [str, ...]}."""
+    reader = csv.reader(io.StringIO(data.decode("utf-8-sig", errors="replace")))
+    try:
+        header = [_normalise_header(h) for h in next(reader)]
+    except StopIteration:
+        raise BulkTriageError("CSV file is empty")
+    rows = [r for r in reader if any(cell.strip() for cell in r)]
+    if len(rows) > MAX_BULK_ROWS:
+        raise BulkTriageError(f"Too many rows ({len(rows)}); limit is {MAX_BULK_ROWS}")
+    return {name: [r[j] if j < len(r) else "" for r in rows] for j, name in enumerate(header)}
+
+
+def parse_ndjson(data: bytes) -> Dict[str, List[str]]:
+    """One JSON object per line -> {column: [str, ...]} (missing keys become '')."""
+    records = []
+    for line_no, line in enumerate(data.decode("utf-8-sig", errors="replace").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BulkTriageError(f"Invalid JSON on line {line_no}: {e.msg}")
+        if not isinstance(obj, dict):
+            raise BulkTriageError(f"Line {line_no} is not a JSON object")
+        records.append({_normalise_header(k): v for k, v in obj.items()})
+        if len(records) > MAX_BULK_ROWS:
+            raise BulkTriageError(f"Too many rows; limit is {MAX_BULK_ROWS}")
+    names = {k for rec in records for k in rec}
+    return {name: ["" if rec.get(name) is None else str(rec.get(name)) for rec in records] for name in names}
+
+
+def to_float_column(values: Sequence[str]) -> np.ndarray:
+    """Strings -> float64 with NaN for blanks and unparsable cells."""
+    arr = np.char.strip(np.asarray(values, dtype=str))
+    arr[arr == ""] = "nan"
+    try:
+        return arr.astype(np.float64)
+    except ValueError:
+        out = np.empty(len(arr), dtype=np.float64)
+        for i, v in enumerate(arr):
+            try:
+                out[i] = float(v)
+            except ValueError:
+                out[i] = np.nan
+        return out
+
+
+def score_columns(columns: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Evaluate the rulebook over all rows; returns column arrays plus the urgency order."""
+    missing = [c for c in ("age", "temp", "symptoms") if c not in columns]
+    if missing:
+        raise BulkTriageError(f"Missing required column(s): {', '.join(missing)}")
+
+    rows = len(columns["age"])
+    rb = triage_engine.current()
+    values = np.full((rows, len(FIELDS)), np.nan)
+    for name in NUMERIC_COLUMNS:
+        if name in columns:
+            col = to_float_column(columns[name])
+            if name in FALSY_MISSING:
+                col[col == 0] = np.nan
+            values[:, FIELD_INDEX[name]] = col
+
+    systolic, diastolic = parse_bp_column(columns.get("bp", [""] * rows))
+    values[:, FIELD_INDEX["systolic"]] = systolic
+    values[:, FIELD_INDEX["diastolic"]] = diastolic
+    derived = derive_vitals(values[:, FIELD_INDEX["heart_rate"]], systolic, diastolic)
+    for name, col in derived.items():
+        values[:, FIELD_INDEX[name]] = col
+
+    symptoms = columns["symptoms"]
+    history = columns.get("history", [""] * rows)
+    result = rb.evaluate_matrix(values, symptoms, history)
+
+    valid = ~np.isnan(values[:, FIELD_INDEX["age"]]) & ~np.isnan(values[:, FIELD_INDEX["temp"]])
+    flag_count = result["flag_hits"].sum(axis=1)
+    for hits, (_, rule) in zip(result["referral_hits"], rb.referral_rules):
+        if "red_flag" in rule:
+            flag_count += hits
+    triage = np.where(valid, result["triage"], np.iinfo(np.int64).max)
+    # np.lexsort sorts by the last key first
+    order = np.lexsort((np.arange(rows), -derived["shock_index"], -flag_count, triage))
+
+    return {
+        "rulebook": rb,
+        "rows": rows,
+        "values": values,
+        "result": result,
+        "valid": valid,
+        "flag_count": flag_count,
+        "order": order,
+    }
+
+
+def iter_ndjson(scored: Dict[str, Any], columns: Dict[str, List[str]], include_details: bool = False,
+                started: Optional[float] = None) -> Iterator[str]:
+    """NDJSON lines in urgency order, batched into chunks for the response stream."""
+    rb = scored["rulebook"]
+    values, result, valid = scored["values"], scored["result"], scored["valid"]
+    id_column = next((c for c in ID_COLUMNS if c in columns), None)
+    band_names = list(rb.bands)
+    sirs_col = FIELD_INDEX["sirs_score"] if "sirs_score" in rb.scores else None
+    level_counts: Dict[int, int] = {}
+
+    buf: List[str] = []
+    for r in scored["order"]:
+        r = int(r)
+        line: Dict[str, Any] = {"row": r + 1}
+        if id_column:
+            line[id_column] = columns[id_column][r]
+        if not valid[r]:
+            line.update({"status": "failed", "error": "age and temp are required"})
+        else:
+            level = int(result["triage"][r])
+            level_counts[level] = level_counts.get(level, 0) + 1
+            line.update({
+                "triage_level": level,
+                "red_flag_count": int(scored["flag_count"][r]),
+                "sirs_score": int(values[r, sirs_col]) if sirs_col is not None else None,
+                "shock_index": round(float(values[r, FIELD_INDEX["shock_index"]]), 2),
+                "MAP": round(float(values[r, FIELD_INDEX["map"]]), 1),
+                "pulse_pressure": int(values[r, FIELD_INDEX["pulse_pressure"]]),
+            })
+            for name in band_names:
+                k = result["bands"][name][r]
+                bands = rb.bands[name]["bands"]
+                line[f"{name}_status"] = bands[k]["status"] if k < len(bands) else rb.bands[name]["default"]["status"]
+            if include_details:
+                details = rb.row_details(result, values, r)
+                line.update({
+                    "red_flags": details["red_flags"],
+                    "referral": details["referral"],
+                    "rule_outs": details["rule_outs"],
+                })
+        buf.append(json.dumps(line))
+        if len(buf) >= STREAM_BATCH_ROWS:
+            yield "\n".join(buf) + "\n"
+            buf = []
+    if buf:
+        yield "\n".join(buf) + "\n"
+
+    yield json.dumps({
+        "summary": True,
+        "total": scored["rows"],
+        "scored": int(valid.sum()),
+        "failed": int((~valid).sum()),
+        "triage_counts": {str(k): v for k, v in sorted(level_counts.items())},
+        "rulebook_version": rb.version,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1) if started else None,
+    }) + "\n"
@@ -0,0 +1,473 @@
+"""
+Cough Audio Service — PCM/WAV decoding and framed STFT features for the cough
+analyzer, shared by the HTTP endpoint and the WebSocket stream.
+
+Audio is analysed in Hann-windowed frames with a real FFT. Features are
+accumulated incrementally, so memory stays bounded by one frame plus the
+incoming chunk no matter how long the recording runs.
+"""
+import os
+import shutil
+import struct
+import subprocess
+import logging
+import numpy as np
+from functools import lru_cache
+from scipy import fft as sp_fft
+from scipy.ndimage import binary_closing
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FRAME_MS = 32
+DEFAULT_SAMPLE_RATE = 16000
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+
+# Burst detection: a frame is "loud" above max(BURST_ABS_MIN, noise floor * BURST_RATIO)
+BURST_ABS_MIN = 0.02
+BURST_RATIO = 4.0
+BURST_GAP_MS = 120
+
+# encoding -> (bytes per sample, numpy dtype)
+PCM_ENCODINGS = {
+    "pcm_u8": (1, np.uint8),
+    "pcm_s16le": (2, np.dtype("<i2")),
+    "pcm_s24le": (3, None),
+    "pcm_s32le": (4, np.dtype("<i4")),
+    "pcm_f32le": (4, np.dtype("<f4")),
+}
+
+
+class AudioDecodeError(ValueError):
+    """Raised when the uploaded audio cannot be turned into PCM samples."""
+
+
+# ──────── Decoding ────────
+def parse_wav_header(buf: bytes) -> Optional[Tuple[str, int, int, int]]:
+    """
+    Parse a RIFF/WAVE header. Returns (encoding, channels, sample_rate,
+    data_offset) once the 'data' chunk is reached, or None if more bytes
+    are needed.
+    """
+    if len(buf) < 12:
+        return None
+    if buf[:4] != b"RIFF" or buf[8:12] != b"WAVE":
+        raise AudioDecodeError("Not a RIFF/WAVE file")
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(buf):
+        chunk_id = buf[pos:pos + 4]
+        chunk_len = struct.unpack("<I", buf[pos + 4:pos + 8])[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            if body + 16 > len(buf):
+                return None
+            tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", buf[body:body + 16])
+            if tag == 0xFFFE and chunk_len >= 40 and body + 26 <= len(buf):
+                tag = struct.unpack("<H", buf[body + 24:body + 26])[0]  # WAVE_FORMAT_EXTENSIBLE sub-format
+            if tag == 1 and bits in (8, 16, 24, 32):
+                encoding = {8: "pcm_u8", 16: "pcm_s16le", 24: "pcm_s24le", 32: "pcm_s32le"}[bits]
+            elif tag == 3 and bits == 32:
+                encoding = "pcm_f32le"
+            else:
+                raise AudioDecodeError(f"Unsupported WAV format (tag {tag}, {bits}-bit)")
+            fmt = (encoding, channels, rate)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioDecodeError("WAV 'data' chunk before 'fmt ' chunk")
+            return fmt[0], fmt[1], fmt[2], body
+        pos = body + chunk_len + (chunk_len & 1)
+    return None
+
+
+def pcm_to_float(raw, encoding: str, channels: int = 1) -> np.ndarray:
+    """Convert interleaved PCM bytes to mono float32 in [-1, 1]."""
+    width, dtype = PCM_ENCODINGS[encoding]
+    if encoding == "pcm_s24le":
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = (b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16))
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        samples = ints.astype(np.float32) / 8388608.0
+    else:
+        data = np.frombuffer(raw, dtype=dtype)
+        if encoding == "pcm_u8":
+            samples = (data.astype(np.float32) - 128.0) / 128.0
+        elif encoding == "pcm_f32le":
+            samples = data.astype(np.float32, copy=False)
+        else:
+            samples = data.astype(np.float32) / float(np.iinfo(dtype).max + 1)
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+class PCMStreamDecoder:
+    """
+    Incremental decoder for a WAV or raw PCM byte stream. Holds back partial
+    samples between feeds so chunk boundaries can fall anywhere.
+    """
+
+    def __init__(self, encoding: Optional[str] = None, sample_rate: Optional[int] = None, channels: int = 1):
+        if encoding not in (None, "wav") and encoding not in PCM_ENCODINGS:
+            raise AudioDecodeError(f"Unsupported encoding '{encoding}'")
+        self.encoding = None if encoding in (None, "wav") else encoding
+        self.sample_rate = sample_rate or (None if self.encoding is None else DEFAULT_SAMPLE_RATE)
+        self.channels = channels
+        self._pending = b""
+
+    @property
+    def ready(self) -> bool:
+        return self.encoding is not None
+
+    def feed(self, data: bytes) -> np.ndarray:
+        buf = self._pending + bytes(data)
+        if self.encoding is None:
+            header = parse_wav_header(buf)
+            if header is None:
+                if len(buf) > 64 * 1024:
+                    raise AudioDecodeError("WAV header not found in first 64 KB")
+                self._pending = buf
+                return np.zeros(0, dtype=np.float32)
+            self.encoding, self.channels, self.sample_rate, offset = header
+            buf = buf[offset:]
+        frame_bytes = PCM_ENCODINGS[self.encoding][0] * self.channels
+        usable = len(buf) - len(buf) % frame_bytes
+        self._pending = buf[usable:]
+        return pcm_to_float(memoryview(buf)[:usable], self.encoding, self.channels)
+
+
+def _ffmpeg_decode(audio_bytes: bytes) -> np.ndarray:
+    proc = subprocess.run(
+        [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-ac", "1", "-ar", str(DEFAULT_SAMPLE_RATE), "pipe:1"],
+        input=audio_bytes, capture_output=True, timeout=30,
+    )
+    if proc.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg could not decode audio: {proc.stderr.decode(errors='ignore')[:200]}")
+    return pcm_to_float(proc.stdout, "pcm_s16le")
+
+
+def decode_audio(audio_bytes: bytes, encoding: Optional[str] = None,
+                 sample_rate: Optional[int] = None) -> Tuple[np.ndarray, int, str]:
+    """
+    Decode an in-memory recording to mono float32.
+    WAV and raw PCM are decoded natively; compressed containers (WebM/Ogg/MP3
+    from browser MediaRecorder) go through ffmpeg when it is installed.
+    Returns (samples, sample_rate, decoder_name).
+    """
+    if audio_bytes[:4] == b"RIFF":
+        decoder = PCMStreamDecoder("wav")
+        samples = decoder.feed(audio_bytes)
+        if not decoder.ready:
+            raise AudioDecodeError("Truncated WAV header")
+        return samples, decoder.sample_rate, "wav"
+    if encoding in PCM_ENCODINGS:
+        decoder = PCMStreamDecoder(encoding, sample_rate)
+        return decoder.feed(audio_bytes), decoder.sample_rate, encoding
+    if shutil.which(FFMPEG_BIN):
+        return _ffmpeg_decode(audio_bytes), DEFAULT_SAMPLE_RATE, "ffmpeg"
+    raise AudioDecodeError("Unsupported audio format - send WAV or raw PCM (or install ffmpeg for WebM/Ogg)")
+
+
+# ──────── Framed STFT features ────────
+def frame_length(sample_rate: int) -> int:
+    """Power-of-two frame size closest to FRAME_MS at this sample rate."""
+    target = sample_rate * FRAME_MS / 1000.0
+    return int(2 ** round(np.log2(max(target, 16))))
+
+
+@lru_cache(maxsize=32)
+def hann_window(n: int) -> np.ndarray:
+    return np.hanning(n).astype(np.float32)
+
+
+@lru_cache(maxsize=64)
+def rfft_freqs(n: int, sample_rate: int) -> np.ndarray:
+    return np.fft.rfftfreq(n, 1.0 / sample_rate).astype(np.float32)
+
+
+def frame_features(frames: np.ndarray, sample_rate: int, workers: int = 1,
+                   with_zcr: bool = True) -> Dict[str, np.ndarray]:
+    """Per-frame RMS, zero-crossing rate, spectral centroid and magnitude sums for (F, N) frames."""
+    n = frames.shape[1]
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / n)
+    zcr = None
+    if with_zcr:
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / max(n - 1, 1)
+    # scipy.fft keeps float32 in single precision and can split rows across threads
+    mag = np.abs(sp_fft.rfft(frames * hann_window(n), axis=1, workers=workers))
+    mag_sum = mag.sum(axis=1)
+    weighted = mag @ rfft_freqs(n, sample_rate)
+    centroid = np.divide(weighted, mag_sum, out=np.zeros_like(weighted), where=mag_sum > 0)
+    return {"rms": rms, "zcr": zcr, "centroid": centroid, "mag_sum": mag_sum, "weighted": weighted}
+
+
+class StreamingCoughAnalyzer:
+    """
+    Incremental cough feature extractor. ``push`` returns the features of every
+    frame completed by the new samples; ``summary`` gives whole-recording
+    features equivalent to the batch analysis.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.frame_len = frame_length(sample_rate)
+        self.hop = self.frame_len // 2
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._frames_done = 0
+        # whole-recording accumulators
+        self.n_samples = 0
+        self._sum_sq = 0.0
+        self._peak = 0.0
+        self._crossings = 0
+        self._last_sign: Optional[bool] = None
+        self._mag_sum = 0.0
+        self._weighted = 0.0
+        # burst state
+        self._noise_floor: Optional[float] = None
+        self._in_burst = False
+        self._quiet_frames = 0
+        self._gap_frames = max(1, int(round(BURST_GAP_MS / 1000.0 * sample_rate / self.hop)))
+        self.burst_count = 0
+
+    def push(self, samples: np.ndarray) -> List[Dict[str, Any]]:
+        if len(samples) == 0:
+            return []
+        samples = np.asarray(samples, dtype=np.float32)
+        self._accumulate_samples(samples)
+
+        buf = np.concatenate([self._tail, samples]) if len(self._tail) else samples
+        return self._emit_frames(buf)
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Zero-pad and analyse the trailing partial frame at end of stream."""
+        if len(self._tail) == 0 or (self._frames_done > 0 and len(self._tail) <= self.frame_len - self.hop):
+            return []
+        buf = np.zeros(self.frame_len, dtype=np.float32)
+        buf[:len(self._tail)] = self._tail
+        out = self._emit_frames(buf)
+        self._tail = np.zeros(0, dtype=np.float32)
+        return out
+
+    def _emit_frames(self, buf: np.ndarray) -> List[Dict[str, Any]]:
+        if len(buf) < self.frame_len:
+            self._tail = buf.copy()
+            return []
+        n_frames = 1 + (len(buf) - self.frame_len) // self.hop
+        frames = np.lib.stride_tricks.sliding_window_view(buf, self.frame_len)[::self.hop][:n_frames]
+        feats = frame_features(frames, self.sample_rate)
+        self._tail = buf[n_frames * self.hop:].copy()
+
+        self._mag_sum += float(feats["mag_sum"].sum())
+        self._weighted += float(feats["weighted"].sum())
+
+        out = []
+        for k in range(n_frames):
+            rms = float(feats["rms"][k])
+            started = self._update_burst(rms)
+            out.append({
+                "frame": self._frames_done,
+                "t_ms": round(self._frames_done * self.hop * 1000.0 / self.sample_rate, 1),
+                "energy": round(rms, 5),
+                "zcr": round(float(feats["zcr"][k]), 4),
+                "spectral_centroid": round(float(feats["centroid"][k]), 1),
+                "burst": self._in_burst,
+                "burst_start": started,
+            })
+            self._frames_done += 1
+        return out
+
+    def _accumulate_samples(self, samples: np.ndarray) -> None:
+        self.n_samples += len(samples)
+        self._sum_sq += float(np.dot(samples, samples))
+        self._peak = max(self._peak, float(np.max(np.abs(samples))))
+        signs = np.signbit(samples)
+        self._crossings += int(np.count_nonzero(signs[1:] != signs[:-1]))
+        if self._last_sign is not None and signs[0] != self._last_sign:
+            self._crossings += 1
+        self._last_sign = bool(signs[-1])
+
+    def _update_burst(self, rms: float) -> bool:
+        if self._noise_floor is None:
+            self._noise_floor = rms
+        threshold = max(BURST_ABS_MIN, self._noise_floor * BURST_RATIO)
+        if rms > threshold:
+            self._quiet_frames = 0
+            if not self._in_burst:
+                self._in_burst = True
+                self.burst_count += 1
+                return True
+            return False
+        self._noise_floor = 0.95 * self._noise_floor + 0.05 * rms
+        if self._in_burst:
+            self._quiet_frames += 1
+            if self._quiet_frames >= self._gap_frames:
+                self._in_burst = False
+        return False
+
+    def analyze(self, samples: np.ndarray, block_seconds: float = 2.0) -> Dict[str, float]:
+        """Feed a whole recording in fixed blocks (bounded temporaries) and summarise it."""
+        block = max(int(self.sample_rate * block_seconds), self.frame_len)
+        for start in range(0, len(samples), block):
+            self.push(samples[start:start + block])
+        self.flush()
+        return self.summary()
+
+    def summary(self) -> Dict[str, float]:
+        n = max(self.n_samples, 1)
+        rms = np.sqrt(self._sum_sq / n)
+        return {
+            # Peak-normalised RMS keeps the classifier thresholds gain-independent
+            "rms_energy": float(rms / self._peak) if self._peak > 0 else 0.0,
+            "zero_crossing_rate": self._crossings / n,
+            "spectral_centroid": self._weighted / self._mag_sum if self._mag_sum > 0 else 0.0,
+            "duration_ms": self.n_samples * 1000.0 / self.sample_rate,
+            "burst_count": self.burst_count,
+        }
+
+
+# ──────── Batch path ────────
+MAX_BATCH_CLIPS = int(os.getenv("COUGH_MAX_BATCH_CLIPS", "100"))
+FFT_WORKERS = int(os.getenv("COUGH_FFT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def _batch_bursts(frame_rms: np.ndarray, n_frames: np.ndarray, gap_frames: int) -> np.ndarray:
+    """
+    Burst counts for padded (C, F) frame energies. Uses a per-clip median noise
+    floor instead of the streaming EWMA so the whole batch is one array pass;
+    loud runs separated by fewer than gap_frames quiet frames are merged.
+    """
+    valid = np.arange(frame_rms.shape[1])[None, :] < n_frames[:, None]
+    masked = np.where(valid, frame_rms, np.nan)
+    floor = np.nan_to_num(np.nanmedian(masked, axis=1), nan=0.0)
+    loud = valid & (frame_rms > np.maximum(BURST_ABS_MIN, floor * BURST_RATIO)[:, None])
+    loud = (binary_closing(loud, structure=np.ones((1, gap_frames + 1), dtype=bool)) & valid) | loud
+    edges = np.diff(loud.astype(np.int8), axis=1, prepend=0) == 1
+    return edges.sum(axis=1)
+
+
+def batch_features(clips: List[np.ndarray], sample_rate: int) -> Dict[str, np.ndarray]:
+    """
+    Whole-clip features for many same-rate clips in one vectorised pass.
+    Clips are laid end to end (each zero-padded to a whole number of frames),
+    sample statistics are segment reductions over that buffer, and every frame
+    of every clip is stacked into one (F_total, N) matrix for a single rfft.
+    """
+    n_clips = len(clips)
+    lengths = np.array([len(c) for c in clips], dtype=np.int64)
+    if (lengths == 0).any():
+        raise ValueError("batch_features requires non-empty clips")
+
+    # Frame every clip exactly as the streaming analyzer does (trailing
+    # partial frame zero-padded)
+    frame_len = frame_length(sample_rate)
+    hop = frame_len // 2
+    n_frames = 1 + (np.maximum(lengths - frame_len, 0) + hop - 1) // hop
+    padded_len = (n_frames - 1) * hop + frame_len
+    starts = np.concatenate([[0], np.cumsum(padded_len)[:-1]])
+
+    buf = np.zeros(int(padded_len.sum()), dtype=np.float32)
+    in_clip = np.zeros(len(buf), dtype=bool)
+    for clip, start, length in zip(clips, starts, lengths):
+        buf[start:start + length] = clip
+        in_clip[start:start + length - 1] = True  # positions with a successor in the same clip
+
+    sum_sq = np.add.reduceat(np.square(buf, dtype=np.float64), starts)
+    peak = np.maximum.reduceat(np.abs(buf), starts)
+    signs = np.signbit(buf)
+    changes = np.zeros(len(buf), dtype=np.int64)
+    changes[:-1] = (signs[1:] != signs[:-1]) & in_clip[:-1]
+    crossings = np.add.reduceat(changes, starts)
+    rms = np.sqrt(sum_sq / lengths)
+
+    clip_idx = np.repeat(np.arange(n_clips), n_frames)
+    frame_idx = np.arange(len(clip_idx)) - np.repeat(np.cumsum(n_frames) - n_frames, n_frames)
+    frames = np.lib.stride_tricks.sliding_window_view(buf, frame_len)[starts[clip_idx] + frame_idx * hop]
+    feats = frame_features(frames, sample_rate, workers=FFT_WORKERS, with_zcr=False)
+
+    mag_sum = np.bincount(clip_idx, weights=feats["mag_sum"], minlength=n_clips)
+    weighted = np.bincount(clip_idx, weights=feats["weighted"], minlength=n_clips)
+    frame_rms = np.zeros((n_clips, int(n_frames.max())), dtype=np.float32)
+    frame_rms[clip_idx, frame_idx] = feats["rms"]
+    gap_frames = max(1, int(round(BURST_GAP_MS / 1000.0 * sample_rate / hop)))
+
+    return {
+        "rms_energy": np.divide(rms, peak, out=np.zeros_like(rms), where=peak > 0),
+        "zero_crossing_rate": crossings / lengths,
+        "spectral_centroid": np.divide(weighted, mag_sum, out=np.zeros_like(weighted), where=mag_sum > 0),
+        "duration_ms": lengths * 1000.0 / sample_rate,
+        "burst_count": _batch_bursts(frame_rms, n_frames, gap_frames),
+    }
+
+
+# ──────── Classification ────────
+# (cough_type, risk_level, severity, conditions), indexed by classify_cough_batch
+COUGH_CLASSES = [
+    ("Productive (Wet)", "Medium-High", "Moderate", ["Bronchitis", "Pneumonia", "Post-nasal drip"]),
+    ("Dry Cough", "Low-Medium", "Mild", ["Viral infection", "Allergic reaction", "Irritant exposure"]),
+    ("Barking Cough", "High", "Significant", ["Croup", "Pertussis", "Acute bronchitis"]),
+    ("Mild Cough", "Low", "Minor", ["Common cold", "Mild irritation"]),
+]
+
+
+def classify_cough_batch(rms_energy: np.ndarray, zero_crossings: np.ndarray) -> np.ndarray:
+    """Vectorised rule evaluation; returns an index into COUGH_CLASSES per clip."""
+    rms_energy = np.asarray(rms_energy)
+    zero_crossings = np.asarray(zero_crossings)
+    return np.select(
+        [(rms_energy > 0.5) & (zero_crossings > 0.3),
+         (rms_energy > 0.3) & (zero_crossings < 0.15),
+         rms_energy > 0.6],
+        [0, 1, 2],
+        default=3,
+    )
+
+
+def classify_cough(rms_energy: float, zero_crossings: float) -> Tuple[str, str, str, List[str]]:
+    """(cough_type, risk_level, severity, conditions) from acoustic features."""
+    return COUGH_CLASSES[int(classify_cough_batch(rms_energy, zero_crossings))]
+
+
+def build_report(rms_energy: float, zero_crossings: float, spectral_centroid: float,
+                 duration_ms: float, burst_count: int, cough_class: Optional[int] = None) -> Dict[str, Any]:
+    if cough_class is None:
+        cough_type, risk_level, severity, conditions = classify_cough(rms_energy, zero_crossings)
+    else:
+        cough_type, risk_level, severity, conditions = COUGH_CLASSES[cough_class]
+
+    if risk_level in ["High", "Medium-High"]:
+        recs = ["Seek medical evaluation within 24 hours", "Start prescribed antibiotics if bacterial",
+                "Monitor oxygen saturation", "Stay hydrated"]
+        urgent = True
+    elif risk_level == "Medium":
+        recs = ["Monitor symptoms for 3-5 days", "Use honey and warm liquids", "Over-the-counter cough suppressant"]
+        urgent = False
+    else:
+        recs = ["Rest and hydration recommended", "Monitor for worsening symptoms", "Use steam inhalation"]
+        urgent = False
+
+    return {
+        "status": "success",
+        "cough_type": cough_type,
+        "risk_level": risk_level,
+        "severity_level": severity,
+        "confidence_score": "High" if rms_energy > 0.1 else "Low",
+        "acoustic_analysis": {
+            "rms_energy": round(rms_energy, 4),
+            "zero_crossing_rate": round(zero_crossings, 4),
+            "spectral_centroid": round(spectral_centroid, 2),
+            "duration_ms": round(duration_ms)
+        },
+        "pattern_analysis": {
+            "intensity_level": "Strong" if rms_energy > 0.4 else "Moderate" if rms_energy > 0.2 else "Weak",
+            "frequency_content": "High" if zero_crossings > 0.25 else "Mid" if zero_crossings > 0.1 else "Low",
+            "estimated_frequency_hz": round(spectral_centroid, 0),
+            "burst_detection": "Multi-burst" if burst_count > 1 else "Single burst",
+            "burst_count": burst_count,
+            "duration_seconds": round(duration_ms / 1000, 2)
+        },
+        "predicted_conditions": conditions,
+        "recommendations": recs,
+        "urgent_action": urgent
+    }
@@ -0,0 +1,255 @@
+"""
+Job Queue — in-process background jobs for slow generations (e.g. story videos).
+
+``submit`` returns a job id at once; a fixed pool of worker threads runs the
+jobs in FIFO order. The waiting queue is bounded (submit raises QueueFull),
+so a burst can't pile up unbounded work behind a CPU-bound local LLM.
+Finished jobs stay in a result store for JOB_RESULT_TTL_SECONDS so clients can
+poll (``get``) or wait for completion (``wait`` / ``wait_async``).
+
+Submitting with a ``key`` that matches a queued or running job returns that
+job instead of queueing a duplicate. ``run`` queues any other callable under
+the same worker limit (e.g. a streamed generation feeding an open response).
+"""
+import os
+import time
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+JOB_MAX_STORED = int(os.getenv("JOB_MAX_STORED", "1000"))
+DURATION_SAMPLES = 200
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class QueueFull(RuntimeError):
+    """Raised by submit when the waiting queue is at capacity."""
+
+
+class Job:
+    def __init__(self, kind: str, args: tuple, kwargs: dict, key: Optional[str],
+                 fn: Optional[Callable[..., Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.fn = fn
+        self.key = key
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.started: Future = Future()
+        self.future: Future = Future()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.started_at is not None:
+            data["queued_ms"] = round((self.started_at - self.submitted_at) * 1000, 1)
+        if self.finished_at is not None:
+            data["run_ms"] = round((self.finished_at - self.started_at) * 1000, 1)
+        if self.status == SUCCEEDED:
+            data["result"] = self.result
+        if self.status == FAILED:
+            data["error"] = self.error
+        return data
+
+
+def _summary(samples: Deque[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"avg_ms": None, "p95_ms": None}
+    ordered = sorted(samples)
+    return {"avg_ms": round(sum(ordered) / len(ordered), 1),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 1)}
+
+
+class JobQueue:
+    def __init__(self, kind: str, fn: Callable[..., Any], workers: int = 2, max_queue: int = 64,
+                 ttl_seconds: float = JOB_RESULT_TTL_SECONDS, max_stored: int = JOB_MAX_STORED):
+        self.kind = kind
+        self.fn = fn
+        self.workers = workers
+        self.ttl_seconds = ttl_seconds
+        self.max_stored = max_stored
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active_keys: Dict[str, Job] = {}
+        self._running = 0
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self._queued_ms: Deque[float] = deque(maxlen=DURATION_SAMPLES)
+        self._run_ms: Deque[float] = deque(maxlen=DURATION_SAMPLES)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"{kind}-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        _registry[kind] = self
+
+    # ── public API ──
+    def submit(self, *args: Any, key: Optional[str] = None, **kwargs: Any) -> Job:
+        return self._submit(None, args, kwargs, key)
+
+    def run(self, fn: Callable[[], Any]) -> Job:
+        """Queue ``fn()`` instead of the queue's function, behind the same workers and queue bound."""
+        return self._submit(fn, (), {}, None)
+
+    def _submit(self, fn: Optional[Callable[..., Any]], args: tuple, kwargs: dict, key: Optional[str]) -> Job:
+        with self._lock:
+            self._evict()
+            existing = self._active_keys.get(key) if key is not None else None
+            if existing is not None:
+                self.deduplicated += 1
+                return existing
+            job = Job(self.kind, args, kwargs, key, fn)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFull(f"{self.kind} queue is full ({self._queue.maxsize} waiting)")
+            self._jobs[job.id] = job
+            if key is not None:
+                self._active_keys[key] = job
+            self.submitted += 1
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """Jobs ahead of a queued job (0 once it is running)."""
+        if job.status != QUEUED:
+            return 0
+        with self._queue.mutex:
+            for i, queued in enumerate(self._queue.queue):
+                if queued is job:
+                    return i
+        return 0
+
+    def wait(self, job: Job, timeout: Optional[float] = None) -> Job:
+        """Block until the job finishes or timeout passes; returns the job either way."""
+        try:
+            job.future.result(timeout=timeout)
+        except Exception:
+            pass
+        return job
+
+    async def wait_async(self, job: Job, timeout: Optional[float] = None) -> Job:
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), timeout=timeout)
+        except Exception:
+            pass
+        return job
+
+    async def wait_change_async(self, job: Job, timeout: Optional[float] = None) -> Job:
+        """Wait until a queued job starts or a running job finishes (or timeout passes)."""
+        signal = job.started if job.status == QUEUED else job.future
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(signal)), timeout=timeout)
+        except Exception:
+            pass
+        return job
+
+    def shutdown(self) -> None:
+        """Ask idle workers to exit; queued jobs are abandoned (workers are daemon threads)."""
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "stored": len(self._jobs),
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "rejected": self.rejected,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "queued": _summary(self._queued_ms),
+                "run": _summary(self._run_ms),
+            }
+
+    # ── internals ──
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                job.status = RUNNING
+                job.started_at = time.time()
+                self._running += 1
+            job.started.set_result(None)
+            try:
+                job.result = (job.fn or self.fn)(*job.args, **job.kwargs)
+                status = SUCCEEDED
+            except Exception as e:
+                logger.exception("%s job %s failed", self.kind, job.id)
+                job.error = str(e)
+                status = FAILED
+            with self._lock:
+                job.finished_at = time.time()
+                job.status = status
+                self._running -= 1
+                if status == SUCCEEDED:
+                    self.succeeded += 1
+                else:
+                    self.failed += 1
+                self._queued_ms.append((job.started_at - job.submitted_at) * 1000)
+                self._run_ms.append((job.finished_at - job.started_at) * 1000)
+                if job.key is not None and self._active_keys.get(job.key) is job:
+                    del self._active_keys[job.key]
+                job.args = job.kwargs = job.fn = None
+            job.future.set_result(job.result)
+
+    def _evict(self) -> None:
+        """Drop finished jobs past their TTL, and the oldest finished ones over max_stored. Caller holds the lock."""
+        now = time.time()
+        expired = [jid for jid, job in self._jobs.items()
+                   if job.done and now - job.finished_at > self.ttl_seconds]
+        for jid in expired:
+            del self._jobs[jid]
+        if len(self._jobs) > self.max_stored:
+            for jid in [jid for jid, job in self._jobs.items() if job.done][:len(self._jobs) - self.max_stored]:
+                del self._jobs[jid]
+
+
+_registry: Dict[str, JobQueue] = {}
+
+
+def job_queue_stats() -> Dict[str, Dict[str, Any]]:
+    return {kind: jobs.stats() for kind, jobs in _registry.items()}
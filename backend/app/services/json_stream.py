@@ -0,0 +1,203 @@
+"""
+JSON Stream — incremental, tolerant JSON parsing for streamed LLM replies.
+
+Feed the reply chunk by chunk as the model writes it. The parser:
+- skips anything before the first '{' or '[' (prose, a ```json fence) and
+  anything after the top-level value closes
+- reports each value at a watched path the moment it closes, e.g. every
+  ``scenes[i]`` object or ``key_findings`` item, so callers can act on it
+  while the rest is still being generated
+- keeps the partially built object, so a truncated reply still yields every
+  element that did complete (``result``)
+
+Paths are tuples of keys and list indexes; "*" in a watch pattern matches
+any key or index: ("scenes", "*") watches each scene.
+"""
+import json
+import logging
+from typing import Any, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Path = Tuple[Any, ...]
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_LITERAL_CHARS = set("0123456789+-.eEtruefalsn")
+
+
+class _Frame:
+    __slots__ = ("container", "path", "key", "expect_key")
+
+    def __init__(self, container: Any, path: Path):
+        self.container = container
+        self.path = path
+        self.key: Optional[str] = None
+        self.expect_key = isinstance(container, dict)
+
+
+class IncrementalJSONParser:
+    def __init__(self, watch: Iterable[Path] = (), start: str = "{["):
+        # start: characters that may open the top-level value ("{" skips a stray "[" in leading prose)
+        self.watch = [tuple(p) for p in watch]
+        self.start = start
+        self.root: Any = None
+        self.done = False
+        self._stack: List[_Frame] = []
+        self._string: Optional[List[str]] = None
+        self._escape: Optional[str] = None  # "" after a backslash, "uXXXX" while reading \\u
+        self._surrogates = False  # the current string has a \\uD800-\\uDFFF escape
+        self._literal: List[str] = []
+        self._events: List[Tuple[Path, Any]] = []
+
+    # ── public API ──
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        """Consume a chunk; returns (path, value) for each watched value it completed."""
+        for c in chunk:
+            if self.done:
+                break
+            self._char(c)
+        events, self._events = self._events, []
+        return events
+
+    def finish(self) -> List[Tuple[Path, Any]]:
+        """End of input: keeps a number/literal the reply was cut off after."""
+        if self._literal and self._stack:
+            self._flush_literal()
+        events, self._events = self._events, []
+        return events
+
+    @property
+    def result(self) -> Any:
+        """The top-level value: complete once ``done``, otherwise everything closed so far."""
+        return self.root
+
+    # ── internals ──
+    def _char(self, c: str) -> None:
+        if self._string is not None:
+            self._string_char(c)
+            return
+        if self._literal:
+            if c in _LITERAL_CHARS:
+                self._literal.append(c)
+                return
+            self._flush_literal()
+        if not self._stack:
+            # Before the top-level value: skip prose and code fences
+            if c in self.start:
+                self._open({} if c == "{" else [])
+            return
+        if c in " \t\r\n":
+            return
+        if c in "{[":
+            self._open({} if c == "{" else [])
+        elif c in "}]":
+            self._close()
+        elif c == '"':
+            self._string = []
+        elif c == ":":
+            self._stack[-1].expect_key = False
+        elif c == ",":
+            self._stack[-1].expect_key = isinstance(self._stack[-1].container, dict)
+        elif c in _LITERAL_CHARS:
+            self._literal.append(c)
+        # anything else (comments, stray prose) is ignored
+
+    def _string_char(self, c: str) -> None:
+        if self._escape is not None:
+            if self._escape == "" and c != "u":
+                self._string.append(_ESCAPES.get(c, c))
+                self._escape = None
+            else:
+                self._escape += c
+                if len(self._escape) == 5:
+                    try:
+                        code = int(self._escape[1:], 16)
+                    except ValueError:
+                        code = None
+                    if code is not None:
+                        self._string.append(chr(code))
+                        self._surrogates |= 0xD800 <= code <= 0xDFFF
+                    self._escape = None
+            return
+        if c == "\\":
+            self._escape = ""
+        elif c == '"':
+            text, self._string = "".join(self._string), None
+            if self._surrogates:
+                # Join escaped pairs (emoji arrive as "\\ud83d\\ude00"); a lone half becomes U+FFFD
+                text = text.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+                self._surrogates = False
+            frame = self._stack[-1]
+            if frame.expect_key:
+                frame.key = text
+                frame.expect_key = False
+            else:
+                self._value(text)
+        else:
+            self._string.append(c)
+
+    def _flush_literal(self) -> None:
+        text, self._literal = "".join(self._literal), []
+        try:
+            value = json.loads(text)
+        except ValueError:
+            return
+        self._value(value)
+
+    def _child_path(self) -> Optional[Path]:
+        frame = self._stack[-1]
+        if isinstance(frame.container, list):
+            return frame.path + (len(frame.container),)
+        return frame.path + (frame.key,) if frame.key is not None else None
+
+    def _attach(self, value: Any) -> Optional[Path]:
+        frame = self._stack[-1]
+        path = self._child_path()
+        if isinstance(frame.container, list):
+            frame.container.append(value)
+        elif frame.key is not None:
+            frame.container[frame.key] = value
+            frame.key = None
+        else:
+            return None
+        return path
+
+    def _value(self, value: Any) -> None:
+        """A scalar finished inside the current container."""
+        path = self._attach(value)
+        if path is not None:
+            self._completed(path, value)
+
+    def _open(self, container: Any) -> None:
+        if not self._stack:
+            self.root = container
+            self._stack.append(_Frame(container, ()))
+            return
+        path = self._attach(container)
+        # Containers are attached as soon as they open, so partial children survive truncation
+        self._stack.append(_Frame(container, path if path is not None else self._stack[-1].path + ("?",)))
+
+    def _close(self) -> None:
+        frame = self._stack.pop()
+        if not self._stack:
+            self.done = True
+        self._completed(frame.path, frame.container)
+
+    def _completed(self, path: Path, value: Any) -> None:
+        for pattern in self.watch:
+            if len(pattern) == len(path) and all(p == "*" or p == q for p, q in zip(pattern, path)):
+                self._events.append((path, value))
+                break
+
+
+def parse_json_tolerant(text: str, start: str = "{[") -> Any:
+    """
+    The first JSON object/array in ``text`` (fenced, wrapped in prose or cut
+    off). Raises ValueError if there is none.
+    """
+    parser = IncrementalJSONParser(start=start)
+    parser.feed(text)
+    parser.finish()
+    if parser.root is None:
+        raise ValueError("No JSON value in text")
+    return parser.root
@@ -0,0 +1,289 @@
+"""
+Async LLM Client — non-blocking Gemini / OpenAI calls for the async handlers.
+
+Talks to the providers' REST APIs over one pooled httpx.AsyncClient, so a
+single worker can keep hundreds of requests in flight without tying up the
+event loop or a thread per call. Each provider has:
+- a semaphore capping concurrent requests (GEMINI_MAX_CONCURRENCY / OPENAI_MAX_CONCURRENCY)
+- a default deadline (LLM_TIMEOUT_SECONDS); callers may pass a tighter one
+
+Base URLs are configurable (GEMINI_BASE_URL / OPENAI_BASE_URL), so the layer
+can be pointed at a local stub server.
+"""
+import os
+import json
+import time
+import base64
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+# Make httpx optional
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+
+IMAGE_MIME = {"jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif",
+              "bmp": "image/bmp", "webp": "image/webp", "tiff": "image/tiff"}
+
+
+class LLMError(RuntimeError):
+    """Raised when a provider call fails (HTTP error, bad payload or no provider)."""
+
+
+class LLMTimeout(LLMError):
+    """Raised when a call misses its deadline, including time spent queued on the semaphore."""
+
+
+class _Provider:
+    name = "base"
+
+    def __init__(self, api_key: str, model: str, base_url: str, max_concurrency: int):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def semaphore(self) -> asyncio.Semaphore:
+        # Semaphores bind to the loop they're first used on
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    def build_request(self, prompt: str, system: Optional[str],
+                      images: Sequence[Tuple[bytes, str]]) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        raise NotImplementedError
+
+    def parse_response(self, payload: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def build_stream_request(self, prompt: str, system: Optional[str],
+                             images: Sequence[Tuple[bytes, str]]) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        raise NotImplementedError
+
+    def parse_stream_event(self, payload: Dict[str, Any]) -> str:
+        """Text delta carried by one server-sent event."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"model": self.model, "base_url": self.base_url, "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight, "calls": self.calls, "errors": self.errors, "timeouts": self.timeouts}
+
+
+class GeminiProvider(_Provider):
+    name = "gemini"
+
+    def build_request(self, prompt, system, images):
+        parts: List[Dict[str, Any]] = [{"text": prompt}]
+        for data, mime in images:
+            parts.append({"inline_data": {"mime_type": mime, "data": base64.b64encode(data).decode("ascii")}})
+        body: Dict[str, Any] = {"contents": [{"role": "user", "parts": parts}]}
+        if system:
+            body["system_instruction"] = {"parts": [{"text": system}]}
+        url = f"{self.base_url}/v1beta/models/{self.model}:generateContent"
+        return url, {"x-goog-api-key": self.api_key}, body
+
+    def parse_response(self, payload):
+        try:
+            parts = payload["candidates"][0]["content"]["parts"]
+        except (KeyError, IndexError, TypeError):
+            raise LLMError(f"Gemini returned no candidates: {str(payload)[:200]}")
+        return "".join(p.get("text", "") for p in parts)
+
+    def build_stream_request(self, prompt, system, images):
+        url, headers, body = self.build_request(prompt, system, images)
+        return url.replace(":generateContent", ":streamGenerateContent") + "?alt=sse", headers, body
+
+    def parse_stream_event(self, payload):
+        # The closing chunk may carry only finishReason/usage metadata
+        parts = ((payload.get("candidates") or [{}])[0].get("content") or {}).get("parts") or []
+        return "".join(p.get("text", "") for p in parts)
+
+
+class OpenAIProvider(_Provider):
+    name = "openai"
+
+    def build_request(self, prompt, system, images):
+        if images:
+            content: Any = [{"type": "text", "text": prompt}] + [
+                {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"}}
+                for data, mime in images
+            ]
+        else:
+            content = prompt
+        messages = ([{"role": "system", "content": system}] if system else []) + [{"role": "user", "content": content}]
+        url = f"{self.base_url}/v1/chat/completions"
+        return url, {"Authorization": f"Bearer {self.api_key}"}, {"model": self.model, "messages": messages}
+
+    def parse_response(self, payload):
+        try:
+            return payload["choices"][0]["message"]["content"] or ""
+        except (KeyError, IndexError, TypeError):
+            raise LLMError(f"OpenAI returned no choices: {str(payload)[:200]}")
+
+    def build_stream_request(self, prompt, system, images):
+        url, headers, body = self.build_request(prompt, system, images)
+        return url, headers, {**body, "stream": True}
+
+    def parse_stream_event(self, payload):
+        choices = payload.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content") or ""
+
+
+class AsyncLLMClient:
+    def __init__(self):
+        self.providers: Dict[str, _Provider] = {}
+        gemini_key = os.getenv("GEMINI_API_KEY")
+        openai_key = os.getenv("OPENAI_API_KEY")
+        if gemini_key:
+            self.providers["gemini"] = GeminiProvider(
+                gemini_key, os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+                os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com"),
+                int(os.getenv("GEMINI_MAX_CONCURRENCY", "32")),
+            )
+        if openai_key:
+            self.providers["openai"] = OpenAIProvider(
+                openai_key, os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+                os.getenv("OPENAI_BASE_URL", "https://api.openai.com"),
+                int(os.getenv("OPENAI_MAX_CONCURRENCY", "32")),
+            )
+        self._client = None
+        self._client_loop = None
+
+    @property
+    def available(self) -> bool:
+        return HTTPX_AVAILABLE and bool(self.providers)
+
+    def provider_names(self) -> List[str]:
+        """Configured providers in preference order (Gemini first, as in LLMService)."""
+        return [name for name in ("gemini", "openai") if name in self.providers]
+
+    def _http(self) -> "httpx.AsyncClient":
+        # One pooled client per event loop; connections are reused across calls
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def generate(self, prompt: str, system: Optional[str] = None,
+                       images: Sequence[Tuple[bytes, str]] = (), provider: Optional[str] = None,
+                       timeout: Optional[float] = None) -> str:
+        """
+        Text completion from ``provider`` (default: first configured). ``images`` are
+        (bytes, mime type) pairs. ``timeout`` bounds queueing plus the HTTP call.
+        """
+        p, deadline = self._resolve(provider, timeout)
+        url, headers, body = p.build_request(prompt, system, images)
+        await self._acquire(p, deadline)
+        try:
+            remaining = max(deadline - time.monotonic(), 0.001)
+            response = await self._http().post(url, headers=headers, json=body, timeout=remaining)
+            if response.status_code >= 400:
+                p.errors += 1
+                raise LLMError(f"{p.name}: HTTP {response.status_code}: {response.text[:200]}")
+            try:
+                payload = response.json()
+            except ValueError:
+                p.errors += 1
+                raise LLMError(f"{p.name}: response was not JSON")
+            return p.parse_response(payload)
+        except httpx.TimeoutException:
+            p.timeouts += 1
+            raise LLMTimeout(f"{p.name}: no response within deadline")
+        except httpx.HTTPError as e:
+            p.errors += 1
+            raise LLMError(f"{p.name}: {e}")
+        finally:
+            self._release(p)
+
+    async def stream(self, prompt: str, system: Optional[str] = None,
+                     images: Sequence[Tuple[bytes, str]] = (), provider: Optional[str] = None,
+                     timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Like ``generate`` but yields text deltas as the provider emits them
+        (server-sent events). The deadline covers the whole stream.
+        """
+        p, deadline = self._resolve(provider, timeout)
+        url, headers, body = p.build_stream_request(prompt, system, images)
+        await self._acquire(p, deadline)
+        try:
+            remaining = max(deadline - time.monotonic(), 0.001)
+            async with self._http().stream("POST", url, headers=headers, json=body, timeout=remaining) as response:
+                if response.status_code >= 400:
+                    p.errors += 1
+                    detail = (await response.aread())[:200].decode("utf-8", "replace")
+                    raise LLMError(f"{p.name}: HTTP {response.status_code}: {detail}")
+                async for line in response.aiter_lines():
+                    if time.monotonic() > deadline:
+                        raise httpx.ReadTimeout("stream deadline exceeded")
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if not data or data == "[DONE]":
+                        continue
+                    try:
+                        delta = p.parse_stream_event(json.loads(data))
+                    except ValueError:
+                        continue
+                    if delta:
+                        yield delta
+        except httpx.TimeoutException:
+            p.timeouts += 1
+            raise LLMTimeout(f"{p.name}: stream did not finish within deadline")
+        except httpx.HTTPError as e:
+            p.errors += 1
+            raise LLMError(f"{p.name}: {e}")
+        finally:
+            self._release(p)
+
+    def _resolve(self, provider: Optional[str], timeout: Optional[float]) -> Tuple[_Provider, float]:
+        if not HTTPX_AVAILABLE:
+            raise LLMError("httpx is not installed")
+        name = provider or next(iter(self.provider_names()), None)
+        if name is None or name not in self.providers:
+            raise LLMError(f"LLM provider '{name}' is not configured")
+        return self.providers[name], time.monotonic() + (timeout if timeout is not None else LLM_TIMEOUT_SECONDS)
+
+    async def _acquire(self, p: _Provider, deadline: float) -> None:
+        try:
+            await asyncio.wait_for(p.semaphore().acquire(), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            p.timeouts += 1
+            raise LLMTimeout(f"{p.name}: timed out waiting for a free slot ({p.max_concurrency} in flight)")
+        p.in_flight += 1
+        p.calls += 1
+
+    def _release(self, p: _Provider) -> None:
+        p.in_flight -= 1
+        p.semaphore().release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"available": self.available, "providers": {n: p.stats() for n, p in self.providers.items()}}
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Singleton instance
+llm_client = AsyncLLMClient()
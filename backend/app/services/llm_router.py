@@ -0,0 +1,334 @@
+"""
+LLM Router — sends each prompt to the fastest healthy provider, with hedging
+and circuit breakers.
+
+Routes (in preference order): Gemini and OpenAI through the async client,
+then local Ollama. Per route the router keeps:
+- latency: an EWMA (seeded with a prior, so untried routes rank sensibly) and
+  a p95 over the last LLM_LATENCY_SAMPLES successes
+- a circuit breaker: once at least LLM_BREAKER_MIN_CALLS of the last
+  LLM_BREAKER_WINDOW calls are in and the error rate reaches
+  LLM_BREAKER_ERROR_RATE, the route is skipped for LLM_BREAKER_COOLDOWN_SECONDS;
+  after that one probe call decides whether it closes again
+
+A request starts on the best-ranked route. If it hasn't answered within that
+route's p95 (clamped to LLM_HEDGE_MIN_MS..LLM_HEDGE_MAX_MS), the next route is
+started too and the first good answer wins; failures fail over immediately.
+When every route fails the caller's fallback (the offline templates) is used.
+``stream`` runs one client route as a stream, with its outcome recorded on the
+same breaker and latency stats.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .llm_client import llm_client, LLMError, LLMTimeout, LLM_TIMEOUT_SECONDS
+from .ollama_manager import ollama_manager, OLLAMA_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "500"))
+LLM_HEDGE_MAX_MS = float(os.getenv("LLM_HEDGE_MAX_MS", "8000"))
+# Used until a route has enough samples for a p95
+LLM_HEDGE_DEFAULT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_MS", "3000"))
+LLM_LATENCY_SAMPLES = int(os.getenv("LLM_LATENCY_SAMPLES", "100"))
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+LLM_ROUTER_OLLAMA_MODEL = os.getenv("LLM_ROUTER_OLLAMA_MODEL", "llama3")  # empty disables the route
+
+EWMA_ALPHA = 0.2
+MIN_P95_SAMPLES = 10
+
+# Expected latency (ms) before a route has been measured
+PRIOR_LATENCY_MS = {"gemini": 2000.0, "openai": 3000.0, "ollama": 15000.0}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# (prompt, system, timeout seconds) -> reply text
+RouteCall = Callable[[str, Optional[str], float], Awaitable[str]]
+
+
+class RouteHealth:
+    """Latency statistics and circuit breaker for one route."""
+
+    def __init__(self, prior_ms: float):
+        self.ewma_ms = prior_ms
+        self.samples: Deque[float] = deque(maxlen=LLM_LATENCY_SAMPLES)
+        self.outcomes: Deque[bool] = deque(maxlen=LLM_BREAKER_WINDOW)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.calls = 0
+        self.wins = 0
+        self.failures = 0
+        self.trips = 0
+
+    def p95_ms(self) -> Optional[float]:
+        if len(self.samples) < MIN_P95_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def available(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= LLM_BREAKER_COOLDOWN_SECONDS
+        return not self.probing
+
+    def acquire(self) -> bool:
+        """Claim a call; an open breaker past its cooldown lets exactly one probe through."""
+        if not self.available():
+            return False
+        if self.state != CLOSED:
+            self.state = HALF_OPEN
+            self.probing = True
+        self.calls += 1
+        return True
+
+    def release(self, elapsed_ms: float) -> None:
+        """
+        Call was cancelled (lost a hedge race): no verdict, but it took at least
+        elapsed_ms, so a route that keeps losing drifts down the ranking.
+        """
+        self.probing = False
+        if elapsed_ms > self.ewma_ms:
+            self.ewma_ms += EWMA_ALPHA * (elapsed_ms - self.ewma_ms)
+
+    def record_success(self, ms: float) -> None:
+        self.ewma_ms += EWMA_ALPHA * (ms - self.ewma_ms)
+        self.samples.append(ms)
+        self.outcomes.append(True)
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self.outcomes.clear()
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.outcomes.append(False)
+        self.probing = False
+        if self.state == HALF_OPEN:
+            self._trip()
+            return
+        errors = self.outcomes.count(False)
+        if len(self.outcomes) >= LLM_BREAKER_MIN_CALLS and errors / len(self.outcomes) >= LLM_BREAKER_ERROR_RATE:
+            self._trip()
+
+    def _trip(self) -> None:
+        if self.state != OPEN:
+            self.trips += 1
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.p95_ms()
+        errors = self.outcomes.count(False)
+        return {
+            "state": self.state,
+            "ewma_ms": round(self.ewma_ms, 1),
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "error_rate": round(errors / len(self.outcomes), 3) if self.outcomes else 0.0,
+            "calls": self.calls,
+            "wins": self.wins,
+            "failures": self.failures,
+            "trips": self.trips,
+        }
+
+
+class Route:
+    def __init__(self, name: str, call: RouteCall, prior_ms: float):
+        self.name = name
+        self.call = call
+        self.health = RouteHealth(prior_ms)
+
+    def hedge_delay(self) -> float:
+        p95 = self.health.p95_ms()
+        ms = LLM_HEDGE_DEFAULT_MS if p95 is None else min(max(p95, LLM_HEDGE_MIN_MS), LLM_HEDGE_MAX_MS)
+        return ms / 1000.0
+
+
+class LLMRouter:
+    def __init__(self):
+        self.routes: Dict[str, Route] = {}
+        self.requests = 0
+        self.hedged = 0
+        self.fallbacks = 0
+
+    def register(self, name: str, call: RouteCall, prior_ms: Optional[float] = None) -> None:
+        self.routes[name] = Route(name, call, prior_ms if prior_ms is not None else PRIOR_LATENCY_MS.get(name, 5000.0))
+
+    @property
+    def available(self) -> bool:
+        return bool(self.routes)
+
+    def ranked(self) -> List[Route]:
+        """Routes that may take a call now, fastest (by EWMA) first."""
+        usable = [r for r in self.routes.values() if r.health.available()]
+        return sorted(usable, key=lambda r: r.health.ewma_ms)
+
+    def preferred(self, among: Optional[List[str]] = None) -> Optional[str]:
+        """Best-ranked route name, optionally restricted to ``among``."""
+        for route in self.ranked():
+            if among is None or route.name in among:
+                return route.name
+        return None
+
+    async def _attempt(self, route: Route, prompt: str, system: Optional[str],
+                       parse: Callable[[str], Any], deadline: float) -> Any:
+        started = time.perf_counter()
+        try:
+            value = parse(await route.call(prompt, system, max(deadline - time.monotonic(), 0.001)))
+        except asyncio.CancelledError:
+            route.health.release((time.perf_counter() - started) * 1000)
+            raise
+        except Exception:
+            route.health.record_failure()
+            raise
+        route.health.record_success((time.perf_counter() - started) * 1000)
+        return value
+
+    async def generate(self, prompt: str, system: Optional[str] = None,
+                       parse: Callable[[str], Any] = lambda text: text,
+                       fallback: Optional[Callable[[], Any]] = None,
+                       timeout: Optional[float] = None, exclude: Iterable[str] = ()) -> Tuple[Any, str]:
+        """
+        (parse(reply), route name) from the first route to answer. A reply that
+        ``parse`` rejects counts as that route failing. If every route fails or
+        the deadline passes, returns (fallback(), "mock"), or raises LLMError
+        when no fallback is given. Routes in ``exclude`` (e.g. one that just
+        failed a stream) aren't tried.
+        """
+        self.requests += 1
+        deadline = time.monotonic() + (timeout if timeout is not None else LLM_TIMEOUT_SECONDS)
+        candidates = [r for r in self.ranked() if r.name not in exclude]
+        pending: Dict["asyncio.Future", Route] = {}
+        errors: List[str] = []
+
+        def launch() -> Optional[Route]:
+            while candidates:
+                route = candidates.pop(0)
+                if route.health.acquire():
+                    pending[asyncio.ensure_future(self._attempt(route, prompt, system, parse, deadline))] = route
+                    return route
+            return None
+
+        last = launch()
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    errors.append("deadline exceeded")
+                    break
+                wait = min(remaining, last.hedge_delay()) if candidates and last else remaining
+                done, _ = await asyncio.wait(list(pending), timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than this route's p95: race the next one
+                    hedge = launch()
+                    if hedge is not None:
+                        self.hedged += 1
+                        last = hedge
+                        logger.info("LLM hedge: %s after %.0f ms", hedge.name, wait * 1000)
+                    continue
+                for task in done:
+                    route = pending.pop(task)
+                    try:
+                        value = task.result()
+                    except Exception as e:
+                        errors.append(str(e) if isinstance(e, LLMError) else f"{route.name}: {e}")
+                        replacement = launch()
+                        last = replacement or last
+                        continue
+                    route.health.wins += 1
+                    return value, route.name
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if fallback is None:
+            raise (LLMTimeout if "deadline exceeded" in errors else LLMError)(
+                "; ".join(errors) or "no healthy LLM route")
+        self.fallbacks += 1
+        print(f"⚠️ LLM Router: all routes failed ({'; '.join(errors) or 'none healthy'}); using templates")
+        return fallback(), "mock"
+
+    async def stream(self, name: str, prompt: str, system: Optional[str] = None,
+                     parse: Optional[Callable[[str], Any]] = None,
+                     timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        llm_client.stream on client route ``name``. An error, timeout or a full
+        reply that ``parse`` rejects counts as the route failing, a finished one
+        as a success taking the whole stream's time; a stream the caller stops
+        reading only adds its elapsed time. Raises LLMError when the route's
+        breaker won't take the call.
+        """
+        route = self.routes.get(name)
+        if route is None or not route.health.acquire():
+            raise LLMError(f"{name}: route unavailable")
+        self.requests += 1
+        started = time.perf_counter()
+        parts: List[str] = []
+        try:
+            async for chunk in llm_client.stream(prompt, system=system, provider=name, timeout=timeout):
+                parts.append(chunk)
+                yield chunk
+            if parse is not None:
+                parse("".join(parts))
+        except Exception:
+            route.health.record_failure()
+            raise
+        except BaseException:
+            # GeneratorExit / cancellation: the caller left, no verdict on the route
+            route.health.release((time.perf_counter() - started) * 1000)
+            raise
+        route.health.record_success((time.perf_counter() - started) * 1000)
+        route.health.wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "fallbacks": self.fallbacks,
+            "order": [r.name for r in self.ranked()],
+            "routes": {name: r.health.stats() for name, r in self.routes.items()},
+        }
+
+
+def _client_route(provider: str) -> RouteCall:
+    async def call(prompt: str, system: Optional[str], timeout: float) -> str:
+        return await llm_client.generate(prompt, system=system, provider=provider, timeout=timeout)
+    return call
+
+
+async def _ollama_route(prompt: str, system: Optional[str], timeout: float) -> str:
+    if ollama_manager.reachable is False:
+        raise LLMError(f"ollama: not reachable ({ollama_manager.last_error})")
+    messages = ([{"role": "system", "content": system}] if system else []) + [{"role": "user", "content": prompt}]
+    # The blocking client can't be interrupted; on timeout its thread finishes in the background
+    response = await asyncio.wait_for(
+        asyncio.to_thread(ollama_manager.chat, model=LLM_ROUTER_OLLAMA_MODEL, messages=messages, format="json"),
+        timeout=timeout,
+    )
+    return response["message"]["content"]
+
+
+def build_default_router() -> LLMRouter:
+    router = LLMRouter()
+    if llm_client.available:
+        for name in llm_client.provider_names():
+            router.register(name, _client_route(name))
+    if OLLAMA_AVAILABLE and LLM_ROUTER_OLLAMA_MODEL:
+        # Reachability is checked per call (the manager's health check tracks it), not at import
+        router.register("ollama", _ollama_route)
+    if router.routes:
+        print(f"✅ LLM Router: {' → '.join(router.routes)} (hedged, with circuit breakers)")
+    return router
+
+
+# Singleton instance
+llm_router = build_default_router()
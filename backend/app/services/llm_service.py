@@ -1,7 +1,108 @@
 import os
+import re
 import json
+import time
+import asyncio
 import google.generativeai as genai
 
+from .llm_client import llm_client, LLMError, LLM_TIMEOUT_SECONDS
+from .llm_router import llm_router
+from .result_cache import ResultCache, make_cache_key
+from .single_flight import SingleFlight
+from .translation_memory import (translation_memory, batch_translation_prompt, parse_batch_translation,
+                                 base_language, source_hash, LLM_MULTILANG_BATCH, SOURCE_LANGUAGE,
+                                 SUPPORTED_LANGUAGES)
+
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_BYTES = int(os.getenv("LLM_CACHE_MEMORY_BYTES", str(16 * 1024 * 1024)))
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "")
+
+# Explanations for identical (risk, diseases, medications, age bracket, gender, language)
+# are interchangeable, so they're shared across patients
+explanation_cache = ResultCache(max_bytes=LLM_CACHE_MEMORY_BYTES, disk_dir=LLM_CACHE_DIR,
+                                ttl_seconds=LLM_CACHE_TTL_SECONDS)
+
+explanation_flight = SingleFlight("llm-explanation")
+translation_flight = SingleFlight("llm-batch-translation")
+
+AGE_BRACKETS = ((12, "child"), (17, "teen"), (39, "adult 18-39"), (59, "adult 40-59"))
+
+
+def age_bracket(age) -> str:
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return "unknown"
+    for upper, label in AGE_BRACKETS:
+        if age <= upper:
+            return label
+    return "senior 60+"
+
+
+def explanation_fingerprint(diagnosis, patient, lang) -> dict:
+    """Canonical form of everything the explanation prompt depends on."""
+    def names(items):
+        return sorted({str(i.get('name', '')).strip().lower() for i in items if i.get('name')})
+
+    return {
+        "risk": str(diagnosis['risk_level']).upper(),
+        "diseases": names(diagnosis.get('diseases', [])),
+        "medications": names(diagnosis.get('treatment_plan', {}).get('medications', [])),
+        "age_bracket": age_bracket(patient['demographics'].get('age')),
+        "gender": str(patient['demographics'].get('gender') or "unknown").strip().lower(),
+        "lang": (lang or "en").strip().lower(),
+    }
+
+
+class JSONStringField:
+    """
+    Pulls one string field's text out of a JSON reply while it is still
+    streaming, so the explanation can be shown before the object closes.
+    """
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, field):
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buf = ""
+        self._state = "seek"  # seek -> value -> done
+
+    def feed(self, chunk):
+        """Decoded field text that became available with this chunk."""
+        if self._state == "done":
+            return ""
+        self._buf += chunk
+        if self._state == "seek":
+            match = self._start.search(self._buf)
+            if not match:
+                return ""
+            self._buf = self._buf[match.end():]
+            self._state = "value"
+
+        buf, i, out = self._buf, 0, []
+        while i < len(buf):
+            c = buf[i]
+            if c == '"':
+                self._state = "done"
+                break
+            if c == '\\':
+                # Escapes split across chunks wait for the rest
+                if i + 1 >= len(buf) or (buf[i + 1] == 'u' and i + 6 > len(buf)):
+                    break
+                if buf[i + 1] == 'u':
+                    try:
+                        out.append(chr(int(buf[i + 2:i + 6], 16)))
+                    except ValueError:
+                        pass
+                    i += 6
+                else:
+                    out.append(self.ESCAPES.get(buf[i + 1], buf[i + 1]))
+                    i += 2
+                continue
+            out.append(c)
+            i += 1
+        self._buf = buf[i:]
+        return "".join(out)
+
 # Make OpenAI optional
 try:
     from openai import OpenAI
@@ -31,36 +132,185 @@ class LLMService:
         
         # 1. If we have keys, use Real AI
         if self.gemini_key or self.openai_key:
-            return self._call_real_llm(diagnosis_result, patient_data, target_lang)
+            fingerprint = explanation_fingerprint(diagnosis_result, patient_data, target_lang)
+            key = make_cache_key("llm-explanation", b"", **fingerprint)
+            cached = explanation_cache.get(key)
+            if cached is not None:
+                return cached
+            return explanation_flight.do(key, self._generate_sync, diagnosis_result, patient_data,
+                                         target_lang, fingerprint, key)
         
         # 2. Fallback: Smart Mock
         return self._smart_mock_response(diagnosis_result, target_lang)
 
-    def _call_real_llm(self, diagnosis, patient, lang):
-        prompt = f"""
+    async def analyze_and_translate_async(self, diagnosis_result, patient_data, target_lang="en", timeout=None):
+        """
+        Non-blocking analyze_and_translate for async handlers: routed across the
+        healthy providers (Gemini, OpenAI, local Ollama) instead of the one picked
+        at startup, falling back to the templates when none answers.
+        """
+        if not (self.gemini_key or self.openai_key or llm_router.available):
+            return self._smart_mock_response(diagnosis_result, target_lang)
+        fingerprint = explanation_fingerprint(diagnosis_result, patient_data, target_lang)
+        key = make_cache_key("llm-explanation", b"", **fingerprint)
+        cached = explanation_cache.get(key)
+        if cached is not None:
+            return cached
+        # Identical diagnoses arriving together share one upstream call
+        return await explanation_flight.do_async(
+            key, lambda: self._generate_async(diagnosis_result, patient_data, target_lang, fingerprint, key, timeout)
+        )
+
+    async def stream_explanation(self, diagnosis_result, patient_data, target_lang="en", timeout=None):
+        """
+        Streaming analyze_and_translate. Yields ("delta", text) pieces of the
+        explanation as the LLM writes them, then ("result", dict) with the full
+        reply. The result is authoritative: if the stream fails after deltas were
+        sent it is the offline template; before any, the other healthy routes are
+        tried first. Cache hits, mock mode and SDK-only setups yield just the result.
+        """
+        if not (self.gemini_key or self.openai_key or llm_router.available):
+            yield "result", self._smart_mock_response(diagnosis_result, target_lang)
+            return
+        fingerprint = explanation_fingerprint(diagnosis_result, patient_data, target_lang)
+        key = make_cache_key("llm-explanation", b"", **fingerprint)
+        cached = explanation_cache.get(key)
+        if cached is not None:
+            yield "result", cached
+            return
+        # Stream from the fastest healthy cloud route; otherwise let the router answer in one piece.
+        # Batch mode translates a finished English text, so there's nothing to stream for other languages.
+        provider = llm_router.preferred(llm_client.provider_names()) if llm_client.available else None
+        if self._batched(target_lang):
+            provider = None
+        if provider is None:
+            yield "result", await self.analyze_and_translate_async(diagnosis_result, patient_data, target_lang, timeout)
+            return
+
+        field = JSONStringField("explanation")
+        parts = []
+        sent = False
+        deadline = time.monotonic() + (timeout if timeout is not None else LLM_TIMEOUT_SECONDS)
+        try:
+            async for chunk in llm_router.stream(provider, self._build_prompt(fingerprint),
+                                                 system="You are a medical translator.", parse=self._parse_json,
+                                                 timeout=timeout):
+                parts.append(chunk)
+                text = field.feed(chunk)
+                if text:
+                    sent = True
+                    yield "delta", text
+            result = self._parse_json("".join(parts))
+        except (LLMError, ValueError) as e:
+            print(f"LLM Error: {e}")
+            if sent:
+                # Deltas are already on screen; the template replaces them
+                yield "result", self._smart_mock_response(diagnosis_result, target_lang)
+            else:
+                # Nothing sent yet: fail over to the other healthy routes within the same deadline
+                yield "result", await self._generate_async(
+                    diagnosis_result, patient_data, target_lang, fingerprint, key,
+                    max(deadline - time.monotonic(), 0.001), exclude=(provider,))
+            return
+        explanation_cache.put(key, result)
+        yield "result", result
+
+    def _generate_sync(self, diagnosis, patient, lang, fingerprint, key):
+        result = self._call_real_llm(diagnosis, patient, lang, fingerprint)
+        if not result.pop("_fallback", False):
+            explanation_cache.put(key, result)
+        return result
+
+    async def _generate_async(self, diagnosis, patient, lang, fingerprint, key, timeout=None, exclude=()):
+        if not llm_router.available:
+            return await asyncio.to_thread(self._generate_sync, diagnosis, patient, lang, fingerprint, key)
+        if self._batched(lang):
+            return await self._translate_from_english(diagnosis, patient, lang, key, timeout)
+
+        result, route = await llm_router.generate(
+            self._build_prompt(fingerprint), system="You are a medical translator.", parse=self._parse_json,
+            fallback=lambda: self._smart_mock_response(diagnosis, lang), timeout=timeout, exclude=exclude,
+        )
+        if route != "mock":
+            explanation_cache.put(key, result)
+        return result
+
+    @staticmethod
+    def _batched(lang):
+        base = base_language(lang)
+        return LLM_MULTILANG_BATCH and base != SOURCE_LANGUAGE and base in SUPPORTED_LANGUAGES
+
+    async def _translate_from_english(self, diagnosis, patient, lang, key, timeout=None):
+        """
+        Batch mode: the English explanation (cached and coalesced like any other)
+        plus its translation from the translation memory, which is filled for all
+        supported languages by a single LLM call.
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else LLM_TIMEOUT_SECONDS)
+        english = await self.analyze_and_translate_async(diagnosis, patient, SOURCE_LANGUAGE, timeout)
+        english_key = make_cache_key("llm-explanation", b"", **explanation_fingerprint(diagnosis, patient, SOURCE_LANGUAGE))
+        if explanation_cache.get(english_key) is None:
+            # English came from the templates; use the matching template
+            return self._smart_mock_response(diagnosis, lang)
+
+        translated = translation_memory.get(english, lang)
+        if translated is None:
+            translations = await translation_flight.do_async(
+                source_hash(english),
+                lambda: self._translate_all(english, max(deadline - time.monotonic(), 0.001)),
+            )
+            translated = translations.get(base_language(lang))
+        if translated is None:
+            return self._smart_mock_response(diagnosis, lang)
+        explanation_cache.put(key, translated)
+        return translated
+
+    async def _translate_all(self, english, timeout):
+        missing = translation_memory.missing(english)
+        if missing:
+            translations, route = await llm_router.generate(
+                batch_translation_prompt(english, missing), system="You are a medical translator.",
+                parse=lambda text: parse_batch_translation(text, english, missing), fallback=dict, timeout=timeout,
+            )
+            if translations:
+                translation_memory.put_batch(english, translations)
+            print(f"🌐 Batch-translated explanation into {', '.join(translations) or 'no languages'} via {route}")
+        return {lang: translation_memory.get(english, lang) for lang in SUPPORTED_LANGUAGES}
+
+    def _build_prompt(self, fp):
+        # Built only from the cache fingerprint so a cached reply is exactly what this prompt asks for
+        return f"""
         You are an empathetic AI Doctor acting as a village health worker. 
         
         Patient Data:
-        - Age: {patient['demographics']['age']}
-        - Gender: {patient['demographics']['gender']}
-        - Symptoms: {patient['symptoms']}
-        - Risk Level: {diagnosis['risk_level']}
-        - Detected: {', '.join([d['name'] for d in diagnosis['diseases']])}
-        - Treatment: {', '.join([m['name'] for m in diagnosis['treatment_plan']['medications']])}
+        - Age group: {fp['age_bracket']}
+        - Gender: {fp['gender']}
+        - Risk Level: {fp['risk']}
+        - Detected: {', '.join(fp['diseases'])}
+        - Treatment: {', '.join(fp['medications'])}
 
         Task:
-        1. Explain the diagnosis clearly in {lang} language.
+        1. Explain the diagnosis clearly in {fp['lang']} language.
         2. Provide 3 specific diet/lifestyle tips relevant to Indian culture.
         3. Explain the medication simply (e.g., "Take the white pill after food").
         
         Return ONLY a JSON object with keys: "explanation", "diet_tips", "medication_guide".
         """
+
+    @staticmethod
+    def _parse_json(text):
+        result = json.loads(text.replace('```json', '').replace('```', ''))
+        if not isinstance(result, dict):
+            raise ValueError("LLM reply is not a JSON object")
+        return result
+
+    def _call_real_llm(self, diagnosis, patient, lang, fingerprint=None):
+        prompt = self._build_prompt(fingerprint or explanation_fingerprint(diagnosis, patient, lang))
         
         try:
             if self.gemini_key:
                 response = self.model.generate_content(prompt)
-                text = response.text.replace('```json', '').replace('```', '')
-                return json.loads(text)
+                return self._parse_json(response.text)
             elif self.openai_key:
                 response = self.client.chat.completions.create(
                     model="gpt-3.5-turbo",
@@ -71,7 +321,8 @@ class LLMService:
                 return json.loads(text)
         except Exception as e:
             print(f"LLM Error: {e}")
-            return self._smart_mock_response(diagnosis, lang)
+            # Flagged so the template isn't cached in place of a real explanation
+            return {**self._smart_mock_response(diagnosis, lang), "_fallback": True}
 
     def _smart_mock_response(self, diagnosis, lang):
         """
@@ -0,0 +1,216 @@
+"""
+Ollama Manager — one shared Ollama client for every local-LLM caller.
+
+- a single ``ollama.Client`` (one HTTP connection pool) instead of the
+  module-level default client per call
+- every request carries ``keep_alive`` (OLLAMA_KEEP_ALIVE) so the model stays
+  resident between stories
+- ``start()`` launches a background thread that loads the model right away and
+  then health-checks Ollama every OLLAMA_HEALTH_INTERVAL_SECONDS, reloading the
+  model if it was evicted, so a cold load never lands on a user request
+- ``available`` (server reachable) and ``ready`` (model resident) replace the
+  per-service ``ollama.list()`` probes at import time
+"""
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+try:
+    import httpx
+    import ollama
+    OLLAMA_AVAILABLE = True
+except ImportError:
+    OLLAMA_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST") or None
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_HEALTH_INTERVAL_SECONDS = float(os.getenv("OLLAMA_HEALTH_INTERVAL_SECONDS", "60"))
+OLLAMA_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_CONNECT_TIMEOUT_SECONDS", "2"))
+
+# A preload slower than this was a cold load from disk
+COLD_LOAD_MS = 1000
+
+
+def _keep_alive(value: str) -> Any:
+    """'30m' stays a duration string; '-1' / '600' become numbers (seconds, negative = forever)."""
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _unreachable(e: Exception) -> bool:
+    """Connection refused / connect timeout, as opposed to an error from a running server."""
+    return isinstance(e, (ConnectionError, httpx.ConnectTimeout))
+
+
+def _same_model(a: str, b: str) -> bool:
+    """'llama3' matches 'llama3:latest'."""
+    norm = lambda m: m if ":" in m else f"{m}:latest"
+    return norm(a) == norm(b)
+
+
+class OllamaManager:
+    def __init__(self, model: str = OLLAMA_MODEL, host: Optional[str] = OLLAMA_HOST,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE, interval: float = OLLAMA_HEALTH_INTERVAL_SECONDS):
+        self.model = model
+        self.keep_alive = _keep_alive(keep_alive)
+        self.interval = interval
+        self.client = None
+        if OLLAMA_AVAILABLE:
+            # Generations may take minutes; only connecting is bounded
+            self.client = ollama.Client(host=host, timeout=httpx.Timeout(None, connect=OLLAMA_CONNECT_TIMEOUT_SECONDS))
+        self.reachable: Optional[bool] = None
+        self.loaded = False
+        self.loading = False
+        self.last_check: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.load_ms: Optional[float] = None
+        self.loads = 0
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ── readiness ──
+    @property
+    def available(self) -> bool:
+        """Ollama answered the last probe or call (probes once if nothing has checked yet)."""
+        if self.reachable is None:
+            self.probe()
+        return bool(self.reachable)
+
+    @property
+    def ready(self) -> bool:
+        """The model is resident, so the next request starts generating at once."""
+        return bool(self.reachable) and self.loaded
+
+    def probe(self) -> bool:
+        """Cheap reachability check; also records whether the model is currently loaded."""
+        if self.client is None:
+            self.reachable = False
+            return False
+        try:
+            running = self.client.ps()
+            self.loaded = any(_same_model(m["model"], self.model) for m in running["models"])
+            self._set_reachable(True)
+        except Exception as e:
+            self.loaded = False
+            self._set_reachable(False, str(e))
+        self.last_check = time.time()
+        return bool(self.reachable)
+
+    def preload(self) -> bool:
+        """Load the model (an empty generate) and refresh its keep_alive; a no-op cost once resident."""
+        if self.client is None:
+            return False
+        self.loading = True
+        started = time.perf_counter()
+        try:
+            self.client.generate(model=self.model, prompt="", keep_alive=self.keep_alive)
+        except Exception as e:
+            self.loaded = False
+            self._set_reachable(not _unreachable(e), str(e))
+            logger.warning("Ollama preload of %s failed: %s", self.model, e)
+            return False
+        finally:
+            self.loading = False
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if not self.loaded or elapsed_ms > COLD_LOAD_MS:
+            self.loads += 1
+            self.load_ms = round(elapsed_ms, 1)
+            print(f"🔥 Ollama: {self.model} loaded in {self.load_ms:.0f} ms (keep_alive={self.keep_alive})")
+        self.loaded = True
+        self._set_reachable(True)
+        return True
+
+    def check(self) -> None:
+        """One health-check round: probe, then (re)load and re-pin the model."""
+        if self.probe():
+            self.preload()
+
+    # ── background loop ──
+    def start(self) -> None:
+        """Preload now and keep the model warm from a daemon thread (idempotent)."""
+        if self.client is None or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Ollama health check failed")
+            self._stop.wait(self.interval)
+
+    # ── calls ──
+    def chat(self, model: Optional[str] = None, stream: bool = False, **kwargs: Any) -> Any:
+        """``ollama.chat`` on the shared client with the manager's model and keep_alive as defaults."""
+        if self.client is None:
+            raise RuntimeError("ollama package not installed")
+        kwargs.setdefault("keep_alive", self.keep_alive)
+        with self._lock:
+            self.calls += 1
+        try:
+            response = self.client.chat(model=model or self.model, stream=stream, **kwargs)
+        except Exception as e:
+            self._call_failed(e)
+            raise
+        return self._watch_stream(response) if stream else response
+
+    def _watch_stream(self, chunks: Iterator[Any]) -> Iterator[Any]:
+        try:
+            yield from chunks
+        except Exception as e:
+            self._call_failed(e)
+            raise
+
+    def _call_failed(self, e: Exception) -> None:
+        with self._lock:
+            self.errors += 1
+        if _unreachable(e):
+            # Callers fall back right away until the next health check finds Ollama again
+            self.loaded = False
+            self._set_reachable(False, str(e))
+
+    def _set_reachable(self, reachable: bool, error: Optional[str] = None) -> None:
+        if reachable != self.reachable:
+            if reachable:
+                print(f"✅ Ollama: reachable (model {self.model})")
+            else:
+                print(f"⚠️ Ollama: not available - {error}")
+        self.reachable = reachable
+        if error is not None:
+            self.last_error = error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "keep_alive": self.keep_alive,
+            "available": bool(self.reachable),
+            "ready": self.ready,
+            "loading": self.loading,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+            "loads": self.loads,
+            "last_load_ms": self.load_ms,
+            "calls": self.calls,
+            "errors": self.errors,
+            "health_interval_seconds": self.interval,
+        }
+
+
+# Singleton instance
+ollama_manager = OllamaManager()
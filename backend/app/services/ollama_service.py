@@ -1,16 +1,22 @@
-import ollama
+from typing import Dict, Iterator, Tuple
+
+from .ollama_manager import ollama_manager
+from .single_flight import SingleFlight
+from .story_cache import farm_story_cache
+from .translation_memory import (translation_memory, batch_translation_prompt, parse_batch_translation,
+                                 base_language, source_hash, LANGUAGE_NAMES, LLM_MULTILANG_BATCH,
+                                 SOURCE_LANGUAGE, SUPPORTED_LANGUAGES)
+
+farm_story_flight = SingleFlight("farm-story")
 
 class OllamaService:
     def __init__(self):
-        self.model = "llama3"  # or mistral
-        try:
-            # Test if Ollama is running
-            ollama.list()
-            self.available = True
-            print("✅ Ollama Service: Connected to local LLM")
-        except Exception as e:
-            self.available = False
-            print(f"⚠️ Ollama Service: Not available - {str(e)}")
+        # Shared client; the manager preloads the model and keeps it resident
+        self.model = ollama_manager.model
+
+    @property
+    def available(self) -> bool:
+        return ollama_manager.available
     
     def generate_farm_story(self, medical_diagnosis: dict, language: str = "en") -> str:
         """
@@ -19,24 +25,126 @@ class OllamaService:
         """
         if not self.available:
             return self._fallback_story(medical_diagnosis, language)
-        
+        if LLM_MULTILANG_BATCH and base_language(language) in SUPPORTED_LANGUAGES:
+            return self._batched_farm_story(medical_diagnosis, language)
         try:
-            # Create prompt for farm story generation
-            language_names = {
-                "en": "English",
-                "hi": "Hindi (हिंदी)",
-                "te": "Telugu (తెలుగు)",
-                "ta": "Tamil (தமிழ்)",
-                "kn": "Kannada (ಕನ್ನಡ)",
-                "ml": "Malayalam (മലയാളം)"
-            }
-            lang_name = language_names.get(language, "English")
-            
-            diseases = ', '.join([d['name'] for d in medical_diagnosis.get('diseases', [])])
-            risk_level = medical_diagnosis.get('risk_level', 'medium')
-            treatment = ', '.join([m['name'] for m in medical_diagnosis.get('treatment_plan', {}).get('medications', [])])
-            
-            prompt = f"""You are a village elder (Uncle ji) in rural India. A farmer has come to you for health advice.
+            return self._cached_story(medical_diagnosis, language)
+        except Exception as e:
+            print(f"❌ Ollama story generation error: {str(e)}")
+            return self._fallback_story(medical_diagnosis, language)
+
+    def _cached_story(self, medical_diagnosis: dict, language: str) -> str:
+        """
+        A stored variant for the diagnosis fingerprint, or a new generation that is
+        then stored. Concurrent misses for the same fingerprint share one generation.
+        Raises if Ollama fails, so fallback stories are never cached.
+        """
+        key = farm_story_cache.key(medical_diagnosis, language)
+        story = farm_story_cache.get(key)
+        if story is None:
+            story = farm_story_flight.do(key, self._chat_story, medical_diagnosis, language)
+            farm_story_cache.add(key, story)
+        return story
+
+    def prewarm_farm_story(self, medical_diagnosis: dict, language: str, variants: int) -> int:
+        """Generate stories until the fingerprint has ``variants`` stored; returns how many were added."""
+        if not self.available:
+            return 0
+        batched = LLM_MULTILANG_BATCH and base_language(language) in SUPPORTED_LANGUAGES
+        key = farm_story_cache.key(medical_diagnosis, SOURCE_LANGUAGE if batched else language)
+        added = 0
+        for _ in range(max(0, variants - farm_story_cache.count(key))):
+            farm_story_cache.add(key, self._chat_story(medical_diagnosis, SOURCE_LANGUAGE if batched else language))
+            added += 1
+        if batched and base_language(language) != SOURCE_LANGUAGE:
+            # Fill the translation memory for the stored English variants
+            for _ in range(farm_story_cache.count(key)):
+                self._batched_farm_story(medical_diagnosis, language)
+        return added
+
+    def _batched_farm_story(self, medical_diagnosis: dict, language: str) -> str:
+        """English story for the diagnosis, then its translation from the translation memory."""
+        try:
+            english = self._cached_story(medical_diagnosis, SOURCE_LANGUAGE)
+        except Exception as e:
+            print(f"❌ Ollama story generation error: {str(e)}")
+            return self._fallback_story(medical_diagnosis, language)
+
+        story = translation_memory.get(english, language)
+        if story is None:
+            translations = farm_story_flight.do(f"translate-{source_hash(english)}", self._translate_story, english)
+            story = translations.get(base_language(language))
+        return story or self._fallback_story(medical_diagnosis, language)
+
+    def _translate_story(self, english: str) -> Dict[str, str]:
+        missing = translation_memory.missing(english)
+        if missing:
+            try:
+                response = ollama_manager.chat(
+                    model=self.model,
+                    messages=[{'role': 'user', 'content': batch_translation_prompt(english, missing)}],
+                    format='json'
+                )
+                translations = parse_batch_translation(response['message']['content'], english, missing)
+                translation_memory.put_batch(english, translations)
+                print(f"🌐 Farm story translated into {', '.join(LANGUAGE_NAMES[l] for l in translations)}")
+            except Exception as e:
+                print(f"❌ Ollama story translation error: {str(e)}")
+        return {lang: translation_memory.get(english, lang) for lang in SUPPORTED_LANGUAGES}
+
+    def _chat_story(self, medical_diagnosis: dict, language: str) -> str:
+        prompt, lang_name = self._farm_story_prompt(medical_diagnosis, language)
+        response = ollama_manager.chat(
+            model=self.model,
+            messages=[{'role': 'user', 'content': prompt}]
+        )
+        print(f"✅ Farm story generated in {lang_name}")
+        return response['message']['content']
+
+    def stream_farm_story(self, medical_diagnosis: dict, language: str = "en") -> Iterator[str]:
+        """
+        Same story as generate_farm_story, yielded piece by piece as Ollama writes it.
+        Yields the fallback story if Ollama is down or fails before the first token;
+        a failure after it re-raises, so the caller can tell the story was cut off.
+        """
+        if not self.available:
+            yield self._fallback_story(medical_diagnosis, language)
+            return
+        if LLM_MULTILANG_BATCH and base_language(language) in SUPPORTED_LANGUAGES:
+            # Served from the translation memory as a whole
+            yield self.generate_farm_story(medical_diagnosis, language)
+            return
+        key = farm_story_cache.key(medical_diagnosis, language)
+        cached = farm_story_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        try:
+            prompt, lang_name = self._farm_story_prompt(medical_diagnosis, language)
+            for chunk in ollama_manager.chat(model=self.model, messages=[{'role': 'user', 'content': prompt}], stream=True):
+                text = chunk['message']['content']
+                if text:
+                    parts.append(text)
+                    yield text
+            print(f"✅ Farm story streamed in {lang_name}")
+            farm_story_cache.add(key, "".join(parts))
+        except Exception as e:
+            print(f"❌ Ollama story streaming error: {str(e)}")
+            if parts:
+                raise
+            yield self._fallback_story(medical_diagnosis, language)
+
+    def _farm_story_prompt(self, medical_diagnosis: dict, language: str) -> Tuple[str, str]:
+        """(prompt, language name) for the farm story."""
+        # Create prompt for farm story generation
+        lang_name = LANGUAGE_NAMES.get(language, "English")
+        
+        diseases = ', '.join([d['name'] for d in medical_diagnosis.get('diseases', [])])
+        risk_level = medical_diagnosis.get('risk_level', 'medium')
+        treatment = ', '.join([m['name'] for m in medical_diagnosis.get('treatment_plan', {}).get('medications', [])])
+        
+        prompt = f"""You are a village elder (Uncle ji) in rural India. A farmer has come to you for health advice.
 
 Medical Diagnosis:
 - Health Problem: {diseases or 'General checkup'}
@@ -65,20 +173,8 @@ Example (English): "Bhai, your sugar is high, jaise tyohaar mein mithai zyada kh
 ak sabzi, dahi. Avoid: white chawal, aloo, mithai, cold drinks. Walk 2 km daily like going to the field."
 
 Now create a similar story in {lang_name}:"""
+        return prompt, lang_name
 
-            response = ollama.chat(
-                model=self.model,
-                messages=[{'role': 'user', 'content': prompt}]
-            )
-            
-            story = response['message']['content']
-            print(f"✅ Farm story generated in {lang_name}")
-            return story
-            
-        except Exception as e:
-            print(f"❌ Ollama story generation error: {str(e)}")
-            return self._fallback_story(medical_diagnosis, language)
-    
     def _fallback_story(self, diagnosis: dict, language: str) -> str:
         """Fallback story when Ollama is not available"""
         stories = {
@@ -115,7 +211,7 @@ Severity: [number]/10
 Advice: [simple advice using farm analogies]
 """
 
-            response = ollama.chat(
+            response = ollama_manager.chat(
                 model=self.model,
                 messages=[{'role': 'user', 'content': prompt}]
             )
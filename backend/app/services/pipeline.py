@@ -0,0 +1,236 @@
+"""
+Stage Pipeline — a small DAG executor for request pipelines such as /api/diagnose.
+
+Each stage names the stages it depends on; a stage starts as soon as all of
+its dependencies have finished, so independent stages (e.g. two LLM calls)
+overlap instead of adding up. Blocking functions run in a shared thread pool.
+Stages can carry a timeout and a fallback: on timeout or error the fallback's
+value is used and the rest of the pipeline carries on. A timed-out blocking
+stage can't be interrupted, so its thread keeps a pool worker until the call
+returns; ``stage_pool_stats`` counts these abandoned calls.
+"""
+import os
+import time
+import asyncio
+import inspect
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "16"))
+# Threads for streamed generators, which hold one for a whole response
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "16"))
+# Items a streamed generator may run ahead of its consumer
+ITERATE_BUFFER = int(os.getenv("ITERATE_BUFFER", "8"))
+# How often a producer blocked on a full buffer checks whether the consumer left
+STOP_POLL_SECONDS = 0.25
+
+# Shared by all pipelines; LLM/SDK calls spend most of their time waiting on the network
+stage_pool = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline-stage")
+# Kept apart so slow stream clients can't starve short stages (e.g. the fusion model)
+stream_pool = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="stream-producer")
+
+# Blocking stage calls still running after their caller timed out or was cancelled
+_stats_lock = threading.Lock()
+_abandoned: Dict[str, int] = {}
+_abandoned_total: Dict[str, int] = {}
+_streams = {"running": 0, "total": 0}
+
+
+def _abandon(stage: str, future: Future) -> None:
+    def finished(_: Future) -> None:
+        with _stats_lock:
+            _abandoned[stage] -= 1
+
+    with _stats_lock:
+        _abandoned[stage] = _abandoned.get(stage, 0) + 1
+        _abandoned_total[stage] = _abandoned_total.get(stage, 0) + 1
+        running = sum(_abandoned.values())
+    logger.warning("Stage '%s' abandoned while running; %d/%d pool workers held by abandoned calls",
+                   stage, running, PIPELINE_WORKERS)
+    future.add_done_callback(finished)
+
+
+def stage_pool_stats() -> Dict[str, Any]:
+    """Pool sizes, streamed generators producing, and abandoned blocking calls (still running / total) per stage."""
+    with _stats_lock:
+        return {
+            "workers": PIPELINE_WORKERS,
+            "stream_workers": STREAM_WORKERS,
+            "streams": dict(_streams),
+            "abandoned_running": sum(_abandoned.values()),
+            "abandoned": {name: {"running": _abandoned[name], "total": total}
+                          for name, total in _abandoned_total.items()},
+        }
+
+
+async def iterate_in_thread(gen_fn: Callable[..., Iterator[Any]], *args: Any, max_buffered: int = ITERATE_BUFFER,
+                            start: Optional[Callable[[Callable[[], None]], Any]] = None) -> AsyncIterator[Any]:
+    """
+    Async iterator over a blocking generator, which runs on the stream pool at most
+    ``max_buffered`` items ahead of the consumer. When the consumer stops early
+    (timeout, cancellation, client disconnect, ``aclose()``), the generator is
+    closed at its next item, so its ``finally`` blocks run and no more work is done.
+    ``start`` runs the producer somewhere else instead, e.g. a JobQueue's ``run``
+    so the stream shares that queue's worker limit; it may raise (QueueFull).
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    credits = threading.Semaphore(max(1, max_buffered))
+    stop = threading.Event()
+    end = object()
+    failure: List[BaseException] = []
+
+    def pump() -> None:
+        if stop.is_set():
+            return  # the consumer left while this was still waiting for a thread
+        with _stats_lock:
+            _streams["running"] += 1
+            _streams["total"] += 1
+        gen = None
+        try:
+            gen = gen_fn(*args)
+            for item in gen:
+                while not credits.acquire(timeout=STOP_POLL_SECONDS):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            if gen is not None:
+                gen.close()
+            with _stats_lock:
+                _streams["running"] -= 1
+            if not stop.is_set():
+                loop.call_soon_threadsafe(queue.put_nowait, end)
+
+    (start or stream_pool.submit)(pump)
+    try:
+        while True:
+            item = await queue.get()
+            if item is end:
+                break
+            credits.release()
+            yield item
+        if failure:
+            raise failure[0]  # whatever the generator raised
+    finally:
+        stop.set()
+
+
+class StageFailed(RuntimeError):
+    """Raised when a stage without a fallback fails or times out."""
+
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+    # Called with the same kwargs as fn when fn raises or times out
+    fallback: Optional[Callable[..., Any]] = None
+
+
+class StagePipeline:
+    def __init__(self, *stages: Stage, inputs: Tuple[str, ...] = ()):
+        self.inputs = tuple(inputs)
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage '{stage.name}'")
+            self.stages[stage.name] = stage
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        state: Dict[str, int] = {}
+
+        def visit(name: str) -> None:
+            if name in self.inputs:
+                return
+            if name not in self.stages:
+                raise ValueError(f"Unknown dependency '{name}'")
+            if state.get(name) == 1:
+                raise ValueError(f"Cycle through stage '{name}'")
+            if state.get(name) == 2:
+                return
+            state[name] = 1
+            for dep in self.stages[name].deps:
+                visit(dep)
+            state[name] = 2
+
+        for name in self.stages:
+            visit(name)
+
+    async def _call(self, stage: Stage, fn: Callable[..., Any], kwargs: Dict[str, Any]) -> Any:
+        if inspect.iscoroutinefunction(fn):
+            return await fn(**kwargs)
+        future = stage_pool.submit(lambda: fn(**kwargs))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # wait_for timed out or the request went away; a running thread can't be stopped
+            if not future.cancel():
+                _abandon(stage.name, future)
+            raise
+
+    async def _run_stage(self, stage: Stage, ctx: Dict[str, Any], tasks: Dict[str, "asyncio.Task"],
+                         report: Dict[str, Dict[str, Any]]) -> Any:
+        if stage.deps:
+            await asyncio.gather(*(tasks[d] for d in stage.deps))
+        kwargs = {d: ctx[d] for d in stage.deps}
+        started = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(self._call(stage, stage.fn, kwargs), timeout=stage.timeout)
+            status = "ok"
+        except Exception as e:
+            if stage.fallback is None:
+                raise StageFailed(stage.name, e) from e
+            kind = "timed out" if isinstance(e, asyncio.TimeoutError) else f"failed ({e})"
+            print(f"⚠️ Pipeline stage '{stage.name}' {kind}; using fallback")
+            value = stage.fallback(**kwargs)
+            status = "timeout" if isinstance(e, asyncio.TimeoutError) else "fallback"
+
+        ctx[stage.name] = value
+        report[stage.name] = {"status": status, "ms": round((time.perf_counter() - started) * 1000, 1)}
+        return value
+
+    async def run(self, **inputs: Any) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """
+        Run every stage; ``inputs`` are available as zero-cost dependencies.
+        Returns (results by stage name, per-stage status/timing report).
+        """
+        missing = set(self.inputs) - set(inputs)
+        if missing:
+            raise ValueError(f"Missing pipeline input(s): {', '.join(sorted(missing))}")
+        ctx: Dict[str, Any] = dict(inputs)
+        report: Dict[str, Dict[str, Any]] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        done = asyncio.get_running_loop().create_future()
+        done.set_result(None)
+        for name in inputs:
+            tasks[name] = done
+        for name, stage in self.stages.items():
+            tasks[name] = asyncio.ensure_future(self._run_stage(stage, ctx, tasks, report))
+
+        stage_tasks = [tasks[name] for name in self.stages]
+        try:
+            await asyncio.gather(*stage_tasks)
+        except BaseException:
+            for task in stage_tasks:
+                task.cancel()
+            raise
+        return {name: ctx[name] for name in self.stages}, report
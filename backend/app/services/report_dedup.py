@@ -0,0 +1,331 @@
+"""
+Report Dedup — index of analyzed report photos, so a retake of the same
+report reuses its analysis instead of a new Gemini vision call.
+
+Each analyzed (preprocessed: cropped to the page) image is reduced to an ink
+map: the text and lines left by a local adaptive threshold on the grayscale,
+scaled so the long side is REPORT_DEDUP_SIDE. Contrast is normalized first,
+so exposure and uneven lighting barely change it.
+
+Two photos of one page differ by a perspective transform (shift, zoom, small
+rotation, tilt), which global hashes can't see past: a 0.5° rotation or a 1%
+zoom already moves a 64-bit pHash beyond any radius that still separates
+reports. So a lookup aligns the new ink map onto each candidate with an ECC
+homography (coarse to fine, started from the two text bounding boxes) and
+compares them ink pixel by ink pixel, allowing one pixel of slack. It's a
+match when the aligned pages overlap by at least REPORT_DEDUP_MIN_OVERLAP
+and no BLOCK x BLOCK block holds more than REPORT_DEDUP_MAX_BLOCK_INK
+mismatched ink pixels: retakes stay at a few pixels, while most changed
+digits leave a stroke-sized blob. Blurry retakes may miss, which only costs
+a vision call (benchmarks/bench_report_dedup.py measures both sides).
+
+A photo still can't prove that two reports carry the same numbers: digits
+that differ by one short stroke (8 and 6 in some fonts) look alike at phone
+resolution. So matches are scoped to one uploader (patient id, else browser
+session id; uploads with neither aren't deduplicated) and entries expire
+after REPORT_DEDUP_TTL_SECONDS (30 minutes): long enough for retakes, too
+short to hand one patient's analysis of last week's report to this week's. Alignment takes about 0.1 s,
+so only the REPORT_DEDUP_MAX_CANDIDATES most recent uploads in the scope are
+compared.
+
+Entries (ink map, analysis per language) live in a ResultCache under
+REPORT_DEDUP_DIR; the (entry, scope, time) index is an append-only JSONL file
+next to it, compacted at startup.
+"""
+import os
+import json
+import time
+import zlib
+import base64
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .result_cache import ResultCache
+from .translation_memory import base_language
+
+logger = logging.getLogger(__name__)
+
+VAULT_BASE = os.getenv("VAULT_BASE", "./nexus_vault")
+REPORT_DEDUP = os.getenv("REPORT_DEDUP", "1") == "1"
+REPORT_DEDUP_DIR = os.getenv("REPORT_DEDUP_DIR", f"{VAULT_BASE}/report_dedup")
+REPORT_DEDUP_MEMORY_BYTES = int(os.getenv("REPORT_DEDUP_MEMORY_BYTES", str(16 * 1024 * 1024)))
+REPORT_DEDUP_DISK_BYTES = int(os.getenv("REPORT_DEDUP_DISK_BYTES", str(128 * 1024 * 1024)))
+REPORT_DEDUP_TTL_SECONDS = float(os.getenv("REPORT_DEDUP_TTL_SECONDS", "1800"))
+REPORT_DEDUP_MAX_ENTRIES = int(os.getenv("REPORT_DEDUP_MAX_ENTRIES", "5000"))
+REPORT_DEDUP_MAX_CANDIDATES = int(os.getenv("REPORT_DEDUP_MAX_CANDIDATES", "4"))
+# Ink map resolution: printed digits must stay several pixels wide
+REPORT_DEDUP_SIDE = int(os.getenv("REPORT_DEDUP_SIDE", "1600"))
+REPORT_DEDUP_MAX_BLOCK_INK = int(os.getenv("REPORT_DEDUP_MAX_BLOCK_INK", "4"))
+REPORT_DEDUP_MIN_OVERLAP = float(os.getenv("REPORT_DEDUP_MIN_OVERLAP", "0.9"))
+
+BLOCK = 12                  # pixels; about one printed digit
+ADAPTIVE_WINDOW = 21        # pixels; about two text strokes plus their background
+ADAPTIVE_OFFSET = 15        # gray levels darker than the local mean that count as ink
+PAPER_LEVEL = 235.0         # the 90th-percentile gray (paper) is scaled to this
+BOX_PERCENTILES = (1, 99)   # text bounding box, ignoring stray specks
+ALIGN_SCALES = (0.125, 0.25, 0.5)
+ALIGN_ITERATIONS = 60
+ALIGN_EPS = 1e-4
+_SLACK = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+
+
+def ink_map(image: Image.Image, side: int = REPORT_DEDUP_SIDE) -> np.ndarray:
+    """Boolean map of text/line pixels, long side ``side``."""
+    gray = np.asarray(image.convert("L"))
+    scale = side / max(gray.shape)
+    size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+    gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    paper = max(float(np.percentile(gray, 90)), 1.0)
+    gray = np.clip(gray.astype(np.float32) * (PAPER_LEVEL / paper), 0, 255).astype(np.uint8)
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,
+                                 ADAPTIVE_WINDOW, ADAPTIVE_OFFSET) > 0
+
+
+def _text_box(ink: np.ndarray) -> Optional[Tuple[float, float, float, float]]:
+    ys, xs = np.nonzero(ink)
+    if len(xs) < 2:
+        return None
+    (x0, x1), (y0, y1) = np.percentile(xs, BOX_PERCENTILES), np.percentile(ys, BOX_PERCENTILES)
+    return (float(x0), float(y0), float(x1), float(y1)) if x1 > x0 and y1 > y0 else None
+
+
+def _align(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Homography taking ``a`` pixel coordinates to ``b``'s (both on a common
+    canvas), or None if the pages can't be aligned.
+    """
+    box_a, box_b = _text_box(a), _text_box(b)
+    if box_a is None or box_b is None:
+        return None
+    sx = (box_b[2] - box_b[0]) / (box_a[2] - box_a[0])
+    sy = (box_b[3] - box_b[1]) / (box_a[3] - box_a[1])
+    warp = np.array([[sx, 0, box_b[0] - box_a[0] * sx], [0, sy, box_b[1] - box_a[1] * sy], [0, 0, 1]], np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, ALIGN_ITERATIONS, ALIGN_EPS)
+    for scale in ALIGN_SCALES:
+        small_a, small_b = (cv2.GaussianBlur(cv2.resize(m.astype(np.float32), None, fx=scale, fy=scale,
+                                                        interpolation=cv2.INTER_AREA), (0, 0), 1.5)
+                            for m in (a, b))
+        s = np.diag([scale, scale, 1.0]).astype(np.float32)
+        try:
+            _, scaled = cv2.findTransformECC(small_a, small_b, s @ warp @ np.linalg.inv(s),
+                                             cv2.MOTION_HOMOGRAPHY, criteria, None, 1)
+        except cv2.error:
+            return None
+        warp = (np.linalg.inv(s) @ scaled @ s).astype(np.float32)
+    return warp
+
+
+def compare_ink(a: np.ndarray, b: np.ndarray) -> Tuple[int, float]:
+    """
+    (most mismatched ink pixels in any BLOCK² block, share of each page's ink
+    the other one covers) after aligning ``b`` onto ``a``; (-1, 0.0) when they
+    can't be aligned.
+    """
+    h, w = max(a.shape[0], b.shape[0]), max(a.shape[1], b.shape[1])
+    canvas_a, canvas_b = np.zeros((h, w), np.uint8), np.zeros((h, w), np.uint8)
+    canvas_a[:a.shape[0], :a.shape[1]] = a
+    canvas_b[:b.shape[0], :b.shape[1]] = b
+    warp = _align(canvas_a, canvas_b)
+    if warp is None:
+        return -1, 0.0
+    flags = cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP
+    aligned = cv2.warpPerspective(canvas_b.astype(np.float32), warp, (w, h), flags=flags) > 0.5
+    valid = cv2.warpPerspective(np.ones((h, w), np.float32), warp, (w, h), flags=flags) > 0.99
+    valid[a.shape[0]:, :] = False
+    valid[:, a.shape[1]:] = False
+    ink_a = canvas_a > 0
+    overlap = min(np.count_nonzero(ink_a & valid) / max(np.count_nonzero(ink_a), 1),
+                  np.count_nonzero(aligned) / max(np.count_nonzero(b), 1))
+    # One pixel of slack each way for resampling and stroke-width differences
+    near_a = cv2.dilate(canvas_a, _SLACK) > 0
+    near_b = cv2.dilate(aligned.astype(np.uint8), _SLACK) > 0
+    mismatch = ((ink_a & ~near_b) | (aligned & ~near_a)) & valid
+    hb, wb = h // BLOCK * BLOCK, w // BLOCK * BLOCK
+    blocks = mismatch[:hb, :wb].reshape(hb // BLOCK, BLOCK, wb // BLOCK, BLOCK).sum(axis=(1, 3))
+    return int(blocks.max()) if blocks.size else 0, round(float(overlap), 3)
+
+
+@dataclass
+class ReportFingerprint:
+    ink: np.ndarray  # bool, long side REPORT_DEDUP_SIDE
+
+
+def report_fingerprint(image: Image.Image) -> ReportFingerprint:
+    return ReportFingerprint(ink_map(image))
+
+
+@dataclass
+class DedupMatch:
+    entry_id: str
+    block_ink: int    # most mismatched ink pixels in one block
+    overlap: float
+    result: Optional[Dict[str, Any]]  # None if this report wasn't analyzed in the requested language
+
+
+class ReportDedupIndex:
+    def __init__(self, disk_dir: Optional[str] = REPORT_DEDUP_DIR, ttl_seconds: float = REPORT_DEDUP_TTL_SECONDS,
+                 max_entries: int = REPORT_DEDUP_MAX_ENTRIES):
+        self.disk_dir = disk_dir or None
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = ResultCache(max_bytes=REPORT_DEDUP_MEMORY_BYTES,
+                                   disk_dir=os.path.join(disk_dir, "entries") if disk_dir else None,
+                                   disk_max_bytes=REPORT_DEDUP_DISK_BYTES, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._index: Dict[str, Dict[str, Any]] = {}  # entry id -> {"scope", "at"}, oldest first
+        self._scopes: Dict[str, List[str]] = {}      # scope -> entry ids, oldest first
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0  # candidates the ink comparison turned down
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_index()
+
+    # ── public API ──
+    def find(self, fp: ReportFingerprint, language: str, scope: str = "") -> Optional[DedupMatch]:
+        """
+        The closest verified retake of ``fp`` among the latest uploads under
+        ``scope``, with its analysis in ``language`` if stored.
+        """
+        lang = base_language(language)
+        with self._lock:
+            candidates = [eid for eid in self._scopes.get(scope, []) if eid in self._index]
+        best: Optional[DedupMatch] = None
+        for entry_id in reversed(candidates[-REPORT_DEDUP_MAX_CANDIDATES:]):
+            entry = self.entries.get(entry_id)
+            if entry is None or "ink" not in entry:
+                # Expired, evicted or from an older format: forget it at the next compaction
+                with self._lock:
+                    self._index.pop(entry_id, None)
+                continue
+            block_ink, overlap = compare_ink(fp.ink, self._ink(entry))
+            if block_ink < 0 or block_ink > REPORT_DEDUP_MAX_BLOCK_INK or overlap < REPORT_DEDUP_MIN_OVERLAP:
+                with self._lock:
+                    self.rejected += 1
+                continue
+            if best is None or block_ink < best.block_ink:
+                best = DedupMatch(entry_id, block_ink, overlap, entry["results"].get(lang))
+        with self._lock:
+            if best is not None and best.result is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return best
+
+    def store(self, fp: ReportFingerprint, language: str, result: Dict[str, Any],
+              match: Optional[DedupMatch] = None, scope: str = "") -> str:
+        """Save ``result`` for ``language``: on the matched entry if any, else as a new entry."""
+        lang = base_language(language)
+        result = {k: v for k, v in result.items() if k not in ("preprocessing", "dedup")}
+        entry = self.entries.get(match.entry_id) if match is not None else None
+        if entry is not None:
+            entry["results"] = {**entry["results"], lang: result}
+            self.entries.put(match.entry_id, entry)
+            return match.entry_id
+
+        packed = np.packbits(fp.ink).tobytes()
+        h = hashlib.blake2b(scope.encode("utf-8"), digest_size=12)
+        h.update(packed)
+        entry_id = h.hexdigest()
+        self.entries.put(entry_id, {
+            "shape": list(fp.ink.shape),
+            "ink": base64.b64encode(zlib.compress(packed)).decode("ascii"),
+            "results": {lang: result},
+        })
+        record = {"id": entry_id, "scope": scope, "at": time.time()}
+        with self._lock:
+            self._add(record)
+            compact = len(self._index) > self.max_entries
+        self._append(record)
+        if compact:
+            self.compact()
+        return entry_id
+
+    def compact(self) -> None:
+        """Drop expired and overflow entries and rewrite the index file."""
+        cutoff = time.time() - self.ttl_seconds if self.ttl_seconds else 0
+        with self._lock:
+            records = [{"id": eid, **rec} for eid, rec in self._index.items() if rec["at"] >= cutoff]
+            records = records[-self.max_entries:]
+            self._index.clear()
+            self._scopes = {}
+            for record in records:
+                self._add(record)
+        if self.disk_dir:
+            tmp = self._index_path() + ".tmp"
+            with open(tmp, "w") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            os.replace(tmp, self._index_path())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": REPORT_DEDUP,
+                "entries": len(self._index),
+                "scopes": len(self._scopes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected_by_ink_check": self.rejected,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "max_block_ink": REPORT_DEDUP_MAX_BLOCK_INK,
+                "min_overlap": REPORT_DEDUP_MIN_OVERLAP,
+                "max_candidates": REPORT_DEDUP_MAX_CANDIDATES,
+                "ttl_seconds": self.ttl_seconds,
+                "store": self.entries.stats(),
+            }
+
+    # ── index ──
+    @staticmethod
+    def _ink(entry: Dict[str, Any]) -> np.ndarray:
+        h, w = entry["shape"]
+        bits = np.unpackbits(np.frombuffer(zlib.decompress(base64.b64decode(entry["ink"])), dtype=np.uint8))
+        return bits[:h * w].reshape(h, w).astype(bool)
+
+    def _add(self, record: Dict[str, Any]) -> None:
+        """Caller holds the lock."""
+        if record["id"] in self._index:
+            return
+        scope = record.get("scope", "")
+        self._index[record["id"]] = {"scope": scope, "at": record["at"]}
+        self._scopes.setdefault(scope, []).append(record["id"])
+
+    def _index_path(self) -> str:
+        return os.path.join(self.disk_dir, "index.jsonl")
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if not self.disk_dir:
+            return
+        try:
+            with open(self._index_path(), "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning(f"Report dedup index write failed: {e}")
+
+    def _load_index(self) -> None:
+        if not os.path.exists(self._index_path()):
+            return
+        records: List[Dict[str, Any]] = []
+        with open(self._index_path()) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # torn last line after a crash
+        with self._lock:
+            for record in records:
+                self._add(record)
+        self.compact()
+        logger.info(f"Report dedup index loaded: {len(self._index)} reports")
+
+
+# Singleton instance
+report_dedup = ReportDedupIndex()
@@ -0,0 +1,179 @@
+"""
+Report Image — shrink uploaded report photos before they go to Gemini vision.
+
+Phone photos of lab reports are often 3-12 MB at 12+ megapixels, far beyond
+what the model reads: Gemini tiles images at 768 px, and printed report text
+stays legible at ~1600 px on the long side. ``prepare_report_image``:
+
+- applies the EXIF orientation (phones store portrait shots sideways)
+- crops the uniform paper/table margin around the content
+- downsizes so the long side is at most REPORT_IMAGE_MAX_SIDE
+- converts to grayscale when the image has almost no saturated pixels
+  (printed reports), keeping colour for photos of skin, strips or charts
+- re-encodes as JPEG at REPORT_IMAGE_QUALITY
+
+If the result isn't smaller than the upload, the upload is sent unchanged.
+Each call reports bytes before/after and the time spent; ``report_image_stats``
+aggregates them with the model-call latency for preprocessed and raw requests.
+"""
+import io
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from .llm_client import IMAGE_MIME
+from .upload_stage import sniff_format
+
+logger = logging.getLogger(__name__)
+
+REPORT_IMAGE_PREPROCESS = os.getenv("REPORT_IMAGE_PREPROCESS", "1") == "1"
+REPORT_IMAGE_MAX_SIDE = int(os.getenv("REPORT_IMAGE_MAX_SIDE", "1600"))
+REPORT_IMAGE_QUALITY = int(os.getenv("REPORT_IMAGE_QUALITY", "82"))
+# Share of clearly coloured pixels above which colour is kept
+REPORT_IMAGE_COLOR_FRACTION = float(os.getenv("REPORT_IMAGE_COLOR_FRACTION", "0.02"))
+
+SATURATION_THRESHOLD = 60      # HSV saturation (0-255) that counts as coloured
+MARGIN_TOLERANCE = 24          # gray levels a pixel may differ from the border and still be margin
+MARGIN_PAD_FRACTION = 0.02     # kept around the content so text at the edge isn't clipped
+MIN_CROP_FRACTION = 0.05       # crop only when it removes at least this share of the area
+ANALYSIS_SIDE = 512            # colour / margin analysis runs on a thumbnail this size
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+    def pil(self) -> Image.Image:
+        return Image.open(io.BytesIO(self.data))
+
+
+def _is_grayscale(thumb: Image.Image) -> bool:
+    saturation = np.asarray(thumb.convert("HSV"))[..., 1]
+    return float(np.mean(saturation > SATURATION_THRESHOLD)) < REPORT_IMAGE_COLOR_FRACTION
+
+
+def _content_box(thumb: Image.Image) -> Tuple[int, int, int, int]:
+    """Tight bounding box (thumbnail pixels) of whatever differs from the border colour."""
+    gray = np.asarray(thumb.convert("L"), dtype=np.int16)
+    border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    content = np.abs(gray - int(np.median(border))) > MARGIN_TOLERANCE
+    rows = np.flatnonzero(content.any(axis=1))
+    cols = np.flatnonzero(content.any(axis=0))
+    if rows.size == 0 or cols.size == 0:
+        return 0, 0, thumb.width, thumb.height
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+def _padded(box: Tuple[int, int, int, int], size: Tuple[int, int], scale: float) -> Tuple[int, int, int, int]:
+    """``box`` grown by the margin pad, clamped to the thumbnail, in full-size pixels."""
+    w, h = size
+    pad_x, pad_y = int(w * MARGIN_PAD_FRACTION) + 1, int(h * MARGIN_PAD_FRACTION) + 1
+    left, top = max(box[0] - pad_x, 0), max(box[1] - pad_y, 0)
+    right, bottom = min(box[2] + pad_x, w), min(box[3] + pad_y, h)
+    return round(left * scale), round(top * scale), round(right * scale), round(bottom * scale)
+
+
+def prepare_report_image(image_bytes: bytes, max_side: int = REPORT_IMAGE_MAX_SIDE,
+                         quality: int = REPORT_IMAGE_QUALITY) -> PreparedImage:
+    """Downsized, cropped, re-encoded copy of a report photo, or the original if that's smaller."""
+    started = time.perf_counter()
+    original_mime = IMAGE_MIME.get(sniff_format(image_bytes[:64]), "image/jpeg")
+    stats: Dict[str, Any] = {"original_bytes": len(image_bytes), "preprocessed": False}
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        stats["original_size"] = list(img.size)
+        # Only the first frame of a GIF/TIFF is analyzed anyway
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"):
+            background = Image.new("RGB", img.size, "white")
+            rgba = img.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+
+        thumb = img.copy()
+        thumb.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+        scale = img.width / thumb.width
+
+        content = _content_box(thumb)
+        box = _padded(content, thumb.size, scale)
+        kept = (box[2] - box[0]) * (box[3] - box[1]) / (img.width * img.height)
+        cropped = kept < 1 - MIN_CROP_FRACTION
+        if cropped:
+            img = img.crop(box)
+        # Judged on the content only: a coloured table around a printed page doesn't count
+        grayscale = img.mode == "L" or _is_grayscale(thumb.crop(content))
+        if grayscale:
+            img = img.convert("L")
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+        data = out.getvalue()
+        stats.update(size=list(img.size), grayscale=grayscale, cropped=cropped)
+    except Exception as e:
+        logger.warning("Report image preprocessing failed, sending original: %s", e)
+        data = image_bytes
+        stats["error"] = str(e)
+
+    if len(data) < len(image_bytes):
+        stats["preprocessed"] = True
+        mime = "image/jpeg"
+    else:
+        data, mime = image_bytes, original_mime
+    stats["bytes"] = len(data)
+    stats["bytes_saved"] = len(image_bytes) - len(data)
+    stats["preprocess_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return PreparedImage(data, mime, stats)
+
+
+def passthrough_image(image_bytes: bytes) -> PreparedImage:
+    """The upload as-is (preprocessing disabled)."""
+    return PreparedImage(image_bytes, IMAGE_MIME.get(sniff_format(image_bytes[:64]), "image/jpeg"),
+                         {"original_bytes": len(image_bytes), "bytes": len(image_bytes), "bytes_saved": 0,
+                          "preprocessed": False, "preprocess_ms": 0.0})
+
+
+class ReportImageStats:
+    """Running totals of bytes saved and model latency, split by preprocessed vs raw uploads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {key: {"requests": 0, "original_bytes": 0, "bytes": 0, "preprocess_ms": 0.0, "model_ms": 0.0}
+                        for key in ("preprocessed", "raw")}
+
+    def record(self, stats: Dict[str, Any]) -> None:
+        totals = self._totals["preprocessed" if stats.get("preprocessed") else "raw"]
+        with self._lock:
+            totals["requests"] += 1
+            totals["original_bytes"] += stats.get("original_bytes", 0)
+            totals["bytes"] += stats.get("bytes", 0)
+            totals["preprocess_ms"] += stats.get("preprocess_ms", 0.0)
+            totals["model_ms"] += stats.get("model_ms", 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {"enabled": REPORT_IMAGE_PREPROCESS, "max_side": REPORT_IMAGE_MAX_SIDE,
+                                   "quality": REPORT_IMAGE_QUALITY}
+            for key, t in self._totals.items():
+                n = t["requests"]
+                out[key] = {
+                    "requests": n,
+                    "bytes_saved": t["original_bytes"] - t["bytes"],
+                    "avg_bytes": round(t["bytes"] / n) if n else 0,
+                    "avg_preprocess_ms": round(t["preprocess_ms"] / n, 1) if n else 0.0,
+                    "avg_model_ms": round(t["model_ms"] / n, 1) if n else 0.0,
+                }
+            return out
+
+
+# Singleton instance
+report_image_stats = ReportImageStats()
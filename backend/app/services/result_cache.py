@@ -0,0 +1,216 @@
+"""
+Result Cache Service — content-addressed cache for deterministic image endpoints.
+Keys are a blake2b digest of the upload bytes plus endpoint parameters, so a
+re-submitted image is answered without decoding it again.
+
+Two tiers:
+- memory: byte-bounded LRU of result dicts
+- disk (optional, RESULT_CACHE_DIR): byte-bounded LRU of JSON files
+
+Entries never expire unless the cache is created with ``ttl_seconds``.
+"""
+import os
+import json
+import hashlib
+import logging
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_MEMORY_BYTES = int(os.getenv("RESULT_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+RESULT_CACHE_DISK_BYTES = int(os.getenv("RESULT_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+# Stored alongside the value on disk when a TTL is set
+CACHED_AT_FIELD = "__cached_at__"
+
+
+def make_cache_key(namespace: str, data: bytes, **params: Any) -> str:
+    """blake2b over namespace, canonicalised params and the raw bytes."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(namespace.encode("utf-8"))
+    h.update(b"\0")
+    h.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    h.update(b"\0")
+    h.update(data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = RESULT_CACHE_MEMORY_BYTES,
+                 disk_dir: Optional[str] = None, disk_max_bytes: int = RESULT_CACHE_DISK_BYTES,
+                 ttl_seconds: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, cached_at)
+        self._memory_bytes = 0
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()  # key -> file size
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    # ── public API ──
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        expired = False
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._is_expired(entry[2]):
+                    self._memory_bytes -= self._memory.pop(key)[1]
+                    expired = True
+                else:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[0])
+
+        value = self._disk_get(key)
+        cached_at = value.pop(CACHED_AT_FIELD, time.time()) if value is not None else None
+        with self._lock:
+            if value is not None and self._is_expired(cached_at):
+                self._disk_bytes -= self._disk_index.pop(key, 0)
+                expired = True
+                value = None
+            self.expired += expired
+            if value is None:
+                self.misses += 1
+                if cached_at is not None:
+                    self._remove_file(key)
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, value, self._sizeof(value), cached_at)
+        return dict(value)
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        cached_at = time.time()
+        stored = {**value, CACHED_AT_FIELD: cached_at} if self.ttl_seconds else value
+        payload = json.dumps(stored, default=str).encode("utf-8")
+        with self._lock:
+            self._memory_put(key, dict(value), len(payload), cached_at)
+        self._disk_put(key, payload)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_max_bytes": self.max_bytes,
+                "disk_enabled": bool(self.disk_dir),
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "ttl_seconds": self.ttl_seconds,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            keys = list(self._disk_index)
+            self._disk_index.clear()
+            self._disk_bytes = 0
+        for key in keys:
+            self._remove_file(key)
+
+    def _is_expired(self, cached_at: float) -> bool:
+        return bool(self.ttl_seconds) and time.time() - cached_at > self.ttl_seconds
+
+    # ── memory tier ──
+    @staticmethod
+    def _sizeof(value: Dict[str, Any]) -> int:
+        return len(json.dumps(value, default=str).encode("utf-8"))
+
+    def _memory_put(self, key: str, value: Dict[str, Any], size: int, cached_at: float) -> None:
+        if size > self.max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old[1]
+        self._memory[key] = (value, size, cached_at)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_bytes:
+            _, (_, evicted, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted
+
+    # ── disk tier ──
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_disk_index(self) -> None:
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            st = os.stat(os.path.join(self.disk_dir, name))
+            entries.append((st.st_mtime, name[:-5], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+        logger.info(f"Result cache disk tier loaded: {len(self._disk_index)} entries")
+
+    def _disk_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.disk_dir:
+            return None
+        with self._lock:
+            if key not in self._disk_index:
+                return None
+            self._disk_index.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                value = json.loads(f.read())
+            os.utime(self._path(key))
+            return value
+        except (OSError, ValueError) as e:
+            logger.warning(f"Result cache disk read failed for {key}: {e}")
+            with self._lock:
+                self._disk_bytes -= self._disk_index.pop(key, 0)
+            return None
+
+    def _disk_put(self, key: str, payload: bytes) -> None:
+        if not self.disk_dir or len(payload) > self.disk_max_bytes:
+            return
+        tmp = self._path(key) + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning(f"Result cache disk write failed for {key}: {e}")
+            return
+        evict = []
+        with self._lock:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+            self._disk_index[key] = len(payload)
+            self._disk_bytes += len(payload)
+            while self._disk_bytes > self.disk_max_bytes:
+                old_key, size = self._disk_index.popitem(last=False)
+                self._disk_bytes -= size
+                evict.append(old_key)
+        for old_key in evict:
+            self._remove_file(old_key)
+
+    def _remove_file(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+# Singleton instance
+result_cache = ResultCache(disk_dir=RESULT_CACHE_DIR)
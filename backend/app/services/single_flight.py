@@ -0,0 +1,120 @@
+"""
+Single Flight — coalesces identical in-flight calls onto one upstream request.
+
+The first caller for a key (the leader) runs the function; callers that
+arrive with the same key while it is running wait for that result instead of
+issuing their own request. Works for blocking callers in threads (``do``) and
+coroutines (``do_async``), and both kinds share the same in-flight table, so a
+sync and an async request for the same prompt also coalesce.
+
+Nothing is kept after the call finishes; caching is the result cache's job.
+"""
+import copy
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(**fields: Any) -> str:
+    """Stable key for a prompt's inputs."""
+    payload = json.dumps(fields, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self.calls = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        _registry[name] = self
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """(future, is_leader) for key."""
+        with self._lock:
+            self.calls += 1
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return fut, False
+            fut = Future()
+            self._inflight[key] = fut
+            self.upstream_calls += 1
+            return fut, True
+
+    def _finish(self, key: str, fut: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Blocking: run fn or wait for the identical call already in flight."""
+        fut, leader = self._join(key)
+        if not leader:
+            return copy.deepcopy(fut.result())
+        try:
+            result = fn(*args, **kwargs)
+            self._settle(fut, result=result)
+            return result
+        except BaseException as e:
+            self._settle(fut, error=e)
+            raise
+        finally:
+            self._finish(key, fut)
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Async: await fn() or the identical call already in flight. The shared call
+        runs as its own task and every caller awaits it shielded, so a caller that
+        times out or is cancelled leaves the call (and the other callers) alone.
+        """
+        fut, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._task_done(key, fut, t))
+        result = await asyncio.shield(asyncio.wrap_future(fut))
+        return result if leader else copy.deepcopy(result)
+
+    def _task_done(self, key: str, fut: Future, task: "asyncio.Future") -> None:
+        if task.cancelled():
+            # Only on loop shutdown; waiters get an error, not their own cancellation
+            self._settle(fut, error=RuntimeError(f"{self.name}: shared call cancelled"))
+        elif task.exception() is not None:
+            self._settle(fut, error=task.exception())
+        else:
+            self._settle(fut, result=task.result())
+        self._finish(key, fut)
+
+    @staticmethod
+    def _settle(fut: Future, result: Any = None, error: BaseException = None) -> None:
+        if fut.done():
+            return
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "upstream_calls": self.upstream_calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._inflight),
+                "saved_ratio": round(self.coalesced / self.calls, 3) if self.calls else 0.0,
+            }
+
+
+_registry: Dict[str, SingleFlight] = {}
+
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: group.stats() for name, group in _registry.items()}
@@ -0,0 +1,128 @@
+"""
+Story Cache — disk-backed cache of generated farm stories and story-video
+scripts, keyed by a canonical diagnosis fingerprint (disease set, risk level,
+prescribed medications, language).
+
+Each key holds up to STORY_CACHE_VARIANTS generated variants, served
+round-robin so repeat visitors don't always hear the same story. Storage is
+a ResultCache: a byte-bounded memory LRU in front of a byte-bounded disk LRU
+under STORY_CACHE_DIR (default VAULT_BASE/story_cache), so entries survive
+restarts and the least recently served ones are evicted first.
+
+``top_fingerprints`` ranks the diagnoses seen in the audit log; the prewarm
+job fills their variants during off-peak hours (STORY_PREWARM_HOURS).
+"""
+import os
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .result_cache import ResultCache
+from .single_flight import fingerprint
+from .translation_memory import base_language
+
+logger = logging.getLogger(__name__)
+
+VAULT_BASE = os.getenv("VAULT_BASE", "./nexus_vault")
+STORY_CACHE_DIR = os.getenv("STORY_CACHE_DIR", f"{VAULT_BASE}/story_cache")
+STORY_CACHE_MEMORY_BYTES = int(os.getenv("STORY_CACHE_MEMORY_BYTES", str(8 * 1024 * 1024)))
+STORY_CACHE_DISK_BYTES = int(os.getenv("STORY_CACHE_DISK_BYTES", str(64 * 1024 * 1024)))
+STORY_CACHE_VARIANTS = int(os.getenv("STORY_CACHE_VARIANTS", "3"))
+# "start-end" in local hours, end exclusive; may wrap midnight ("22-5")
+STORY_PREWARM_HOURS = os.getenv("STORY_PREWARM_HOURS", "1-5")
+STORY_PREWARM_TOP = int(os.getenv("STORY_PREWARM_TOP", "20"))
+STORY_PREWARM_LANGUAGES = [l.strip() for l in os.getenv("STORY_PREWARM_LANGUAGES", "en,hi,te").split(",") if l.strip()]
+
+
+def diagnosis_fingerprint(diagnosis: Dict[str, Any], language: str) -> Dict[str, Any]:
+    """Canonical (disease set, risk level, medications, language) for a diagnosis dict."""
+    return {
+        "diseases": sorted({str(d.get("name", "")).strip().lower() for d in diagnosis.get("diseases", []) if d.get("name")}),
+        "risk": str(diagnosis.get("risk_level", "medium")).strip().upper(),
+        # The stories name the treatment, so a cached one must not reach a patient on other medicines
+        "medications": sorted({str(m.get("name", "")).strip().lower()
+                               for m in diagnosis.get("treatment_plan", {}).get("medications", []) if m.get("name")}),
+        "language": base_language(language),
+    }
+
+
+def in_prewarm_window(now: Optional[datetime] = None, hours: str = STORY_PREWARM_HOURS) -> bool:
+    try:
+        start, end = (int(h) for h in hours.split("-"))
+    except ValueError:
+        return False
+    hour = (now or datetime.now()).hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def top_fingerprints(audit_logs: Iterable[Dict[str, Any]], limit: int = STORY_PREWARM_TOP) -> List[Tuple[Dict[str, Any], int]]:
+    """
+    Most frequent (disease set, risk level, medications) in the audit log, as
+    (representative diagnosis dict, count), most common first. The diagnosis
+    carries the treatment plan's medications so prewarmed stories name the same
+    treatment as a live request with that fingerprint.
+    """
+    counts: Counter = Counter()
+    examples: Dict[Tuple, Dict[str, Any]] = {}
+    for entry in audit_logs:
+        diagnosis = {
+            "diseases": [{"name": d.get("name")} for d in entry.get("diseases", []) if d.get("name")],
+            "risk_level": entry.get("risk", "medium"),
+            "treatment_plan": {"medications": [{"name": m.get("name")} for m in entry.get("medications", [])
+                                               if m.get("name")]},
+        }
+        fp = diagnosis_fingerprint(diagnosis, "en")
+        key = (tuple(fp["diseases"]), fp["risk"], tuple(fp["medications"]))
+        counts[key] += 1
+        examples.setdefault(key, diagnosis)
+    return [(examples[key], count) for key, count in counts.most_common(limit)]
+
+
+class StoryCache:
+    def __init__(self, name: str, disk_dir: Optional[str] = STORY_CACHE_DIR,
+                 max_bytes: int = STORY_CACHE_MEMORY_BYTES, disk_max_bytes: int = STORY_CACHE_DISK_BYTES,
+                 variants: int = STORY_CACHE_VARIANTS):
+        self.name = name
+        self.variants = variants
+        self._cache = ResultCache(max_bytes=max_bytes, disk_dir=os.path.join(disk_dir, name) if disk_dir else None,
+                                  disk_max_bytes=disk_max_bytes)
+        self._lock = threading.Lock()
+        self._next: Dict[str, int] = {}
+        self.served = 0
+        self.stored = 0
+
+    def key(self, diagnosis: Dict[str, Any], language: str) -> str:
+        return fingerprint(kind=self.name, **diagnosis_fingerprint(diagnosis, language))
+
+    def count(self, key: str) -> int:
+        entry = self._cache.get(key)
+        return len(entry["variants"]) if entry is not None else 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Next variant for key in round-robin order, or None on a miss."""
+        entry = self._cache.get(key)
+        if entry is None or not entry.get("variants"):
+            return None
+        with self._lock:
+            i = self._next.get(key, 0) % len(entry["variants"])
+            self._next[key] = i + 1
+            self.served += 1
+        return entry["variants"][i]
+
+    def add(self, key: str, story: Any) -> None:
+        """Store a newly generated variant; past the limit the oldest is replaced."""
+        with self._lock:
+            entry = self._cache.get(key) or {"variants": []}
+            variants = [v for v in entry["variants"] if v != story] + [story]
+            self._cache.put(key, {"variants": variants[-self.variants:]})
+            self.stored += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"variants_per_key": self.variants, "served": self.served, "stored": self.stored, **self._cache.stats()}
+
+
+# Singleton instances
+farm_story_cache = StoryCache("farm-story")
+story_video_cache = StoryCache("story-video")
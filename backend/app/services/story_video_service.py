@@ -1,16 +1,28 @@
-import ollama
-import json
+import os
+import re
+import time
+from typing import Any, Generator, Iterator, Optional, Tuple
+
+from .json_stream import IncrementalJSONParser
+from .ollama_manager import ollama_manager
+from .single_flight import SingleFlight
+from .story_cache import story_video_cache
+from .translation_memory import LANGUAGE_NAMES
+
+STORY_SCENES = 5
+# A streamed script still being written after this is finished from the template
+STORY_VIDEO_STREAM_TIMEOUT = float(os.getenv("STORY_VIDEO_STREAM_TIMEOUT", "120"))
+
+story_video_flight = SingleFlight("story-video")
 
 class StoryVideoService:
     def __init__(self):
-        self.model = "llama3"
-        try:
-            ollama.list()
-            self.available = True
-            print("✅ Story Video Service: Connected to Ollama")
-        except Exception as e:
-            self.available = False
-            print(f"⚠️ Story Video Service: Ollama not available - {str(e)}")
+        # Shared client; the manager preloads the model and keeps it resident
+        self.model = ollama_manager.model
+
+    @property
+    def available(self) -> bool:
+        return ollama_manager.available
     
     def generate_story_video(self, diagnosis: dict, language: str = "en") -> dict:
         """
@@ -19,27 +31,117 @@ class StoryVideoService:
         """
         if not self.available:
             return self._fallback_story(diagnosis, language)
-        
+        key = story_video_cache.key(diagnosis, language)
+        cached = story_video_cache.get(key)
+        if cached is not None:
+            return cached
+        return story_video_flight.do(key, self._generate_story_video, diagnosis, language)
+
+    def prewarm_story_video(self, diagnosis: dict, language: str, variants: int) -> int:
+        """Generate scripts until the fingerprint has ``variants`` stored; returns how many were added."""
+        if not self.available:
+            return 0
+        key = story_video_cache.key(diagnosis, language)
+        before = story_video_cache.count(key)
+        for _ in range(max(0, variants - before)):
+            self._generate_story_video(diagnosis, language)
+        return story_video_cache.count(key) - before
+
+    def _generate_story_video(self, diagnosis: dict, language: str) -> dict:
+        story = None
+        for kind, value in self._generate_stream(diagnosis, language):
+            if kind == "story":
+                story = value
+        return story
+
+    def stream_story_video(self, diagnosis: dict, language: str = "en",
+                           timeout: Optional[float] = STORY_VIDEO_STREAM_TIMEOUT) -> Iterator[Tuple[str, Any]]:
+        """
+        Story generation as a stream: ("scene", scene) as soon as each scene's JSON
+        object closes, then ("story", full story). Scenes the model didn't finish
+        (truncated or malformed reply) are filled in from the template, so the
+        scenes already sent stay valid; so are the rest once ``timeout`` passes.
+        """
+        if self.available:
+            cached = story_video_cache.get(story_video_cache.key(diagnosis, language))
+            if cached is not None:
+                for scene in cached["scenes"]:
+                    yield "scene", scene
+                yield "story", cached
+                return
+        deadline = time.monotonic() + timeout if timeout else None
+        yield from self._generate_stream(diagnosis, language, deadline)
+
+    def _generate_stream(self, diagnosis: dict, language: str,
+                         deadline: Optional[float] = None) -> Iterator[Tuple[str, Any]]:
+        """A new generation (cache not consulted); complete model-written scripts are stored."""
+        diseases = diagnosis.get('diseases', [])
+        disease_name = diseases[0].get('name', 'Health Issue') if diseases else 'Health Issue'
+        template = self._create_template_story(disease_name, diagnosis.get('severity', 5), language)
+        if not self.available:
+            for scene in template["scenes"]:
+                yield "scene", scene
+            yield "story", template
+            return
+
+        result, generated = yield from self._stream_scenes(disease_name, language, template, deadline)
+        if generated == STORY_SCENES:
+            # Only scripts the model wrote in full are kept; template-filled ones are retried next time
+            story_video_cache.add(story_video_cache.key(diagnosis, language), result)
+        yield "story", result
+
+    def _stream_scenes(self, disease_name: str, language: str, template: dict,
+                       deadline: Optional[float] = None) -> Generator[Tuple[str, Any], None, Tuple[dict, int]]:
+        """Yields ("scene", scene) for each scene; returns (story, number of scenes the model wrote)."""
+        parser = IncrementalJSONParser(watch=[("scenes", "*")], start="{")
+        scenes = []
         try:
-            # Extract diagnosis info
-            diseases = diagnosis.get('diseases', [])
-            disease_name = diseases[0]['name'] if diseases else 'Health Issue'
-            severity = diagnosis.get('severity', 5)
-            risk_level = diagnosis.get('risk_level', 'medium')
-            
-            # Language configurations
-            language_names = {
-                "en": "English",
-                "hi": "Hindi (हिंदी)",
-                "te": "Telugu (తెలుగు)",
-                "ta": "Tamil (தமிழ்)",
-                "kn": "Kannada (ಕನ್ನಡ)",
-                "ml": "Malayalam (മലയാളം)"
-            }
-            lang_name = language_names.get(language, "English")
-            
-            # Create prompt for story generation
-            prompt = f"""You are a village storyteller (kathavachak) in rural India. Create a 45-second animated story to explain {disease_name} to an uneducated farmer.
+            prompt = self._story_prompt(disease_name, language)
+            for chunk in ollama_manager.chat(model=self.model, messages=[{'role': 'user', 'content': prompt}], stream=True):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError("story video generation timed out")
+                for _, scene in parser.feed(chunk['message']['content']):
+                    scene = self._clean_scene(scene, len(scenes), template)
+                    if scene is not None and len(scenes) < STORY_SCENES:
+                        scenes.append(scene)
+                        yield "scene", scene
+            parser.finish()
+        except Exception as e:
+            print(f"❌ Story generation error: {str(e)}")
+
+        story = parser.result if isinstance(parser.result, dict) else {}
+        generated = len(scenes)
+        if len(scenes) < STORY_SCENES:
+            print(f"⚠️ Story JSON had {len(scenes)}/{STORY_SCENES} complete scenes; filling in from template")
+            for scene in template["scenes"][len(scenes):]:
+                scenes.append(scene)
+                yield "scene", scene
+        result = {
+            "title": story.get("title") if isinstance(story.get("title"), str) else template["title"],
+            "duration": sum(s.get("duration", 9) for s in scenes),
+            "language": language,
+            "scenes": scenes,
+        }
+        print(f"✅ Story video generated: {result['title']}")
+        return result, generated
+
+    @staticmethod
+    def _clean_scene(scene: Any, index: int, template: dict) -> Optional[dict]:
+        """A streamed scene with its narration, missing fields taken from the template scene."""
+        if not isinstance(scene, dict) or not isinstance(scene.get("narration"), str) or not scene["narration"].strip():
+            return None
+        defaults = template["scenes"][min(index, STORY_SCENES - 1)]
+        cleaned = {**defaults, **{k: v for k, v in scene.items() if v is not None}, "id": index + 1}
+        # Models write "9s" or "9 seconds" as often as 9
+        match = re.match(r"\s*(\d+(?:\.\d+)?)", str(cleaned.get("duration", "")))
+        cleaned["duration"] = round(float(match.group(1))) if match else defaults.get("duration", 9)
+        return cleaned
+
+    def _story_prompt(self, disease_name: str, language: str) -> str:
+        lang_name = LANGUAGE_NAMES.get(language, "English")
+        
+        # Create prompt for story generation
+        prompt = f"""You are a village storyteller (kathavachak) in rural India. Create a 45-second animated story to explain {disease_name} to an uneducated farmer.
 
 REQUIREMENTS:
 - Language: {lang_name}
@@ -107,45 +209,8 @@ Return ONLY a valid JSON in this EXACT format:
 }}
 
 IMPORTANT: Return ONLY the JSON, no other text!"""
+        return prompt
 
-            # Call Ollama to generate story
-            response = ollama.chat(
-                model=self.model,
-                messages=[{'role': 'user', 'content': prompt}]
-            )
-            
-            story_text = response['message']['content']
-            
-            # Parse JSON from response
-            try:
-                # Try to extract JSON from markdown code blocks
-                if '```json' in story_text:
-                    json_start = story_text.index('```json') + 7
-                    json_end = story_text.index('```', json_start)
-                    story_text = story_text[json_start:json_end].strip()
-                elif '```' in story_text:
-                    json_start = story_text.index('```') + 3
-                    json_end = story_text.index('```', json_start)
-                    story_text = story_text[json_start:json_end].strip()
-                
-                story = json.loads(story_text)
-                
-                # Validate structure
-                if 'scenes' not in story or len(story['scenes']) != 5:
-                    raise ValueError("Invalid story structure")
-                
-                print(f"✅ Story video generated: {story['title']}")
-                return story
-                
-            except Exception as e:
-                print(f"⚠️ JSON parsing error: {str(e)}")
-                # Fallback to template
-                return self._create_template_story(disease_name, severity, language)
-                
-        except Exception as e:
-            print(f"❌ Story generation error: {str(e)}")
-            return self._create_template_story(disease_name if 'disease_name' in locals() else 'Health Issue', severity if 'severity' in locals() else 5, language)
-    
     def _create_template_story(self, disease: str, severity: int, language: str) -> dict:
         """Create template story when AI generation fails"""
         
@@ -0,0 +1,128 @@
+"""
+Translation Memory — translations keyed by (source text hash, language).
+
+Used by the multi-language batch mode: one canonical English text is generated,
+every supported language is produced from it in a single batched LLM call, and
+each translation is stored here. A language switch, or another diagnosis whose
+canonical text came out the same, is then served without a new generation.
+
+Backed by a ResultCache (memory LRU plus optional TRANSLATION_MEMORY_DIR on disk).
+"""
+import os
+import json
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from .result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_MEMORY_BYTES = int(os.getenv("TRANSLATION_MEMORY_BYTES", str(16 * 1024 * 1024)))
+TRANSLATION_MEMORY_DIR = os.getenv("TRANSLATION_MEMORY_DIR", "")
+# Multi-language batch mode for LLMService explanations and OllamaService farm stories
+LLM_MULTILANG_BATCH = os.getenv("LLM_MULTILANG_BATCH", "0") == "1"
+
+SOURCE_LANGUAGE = "en"
+SUPPORTED_LANGUAGES = ("en", "hi", "te", "ta", "kn", "ml")
+LANGUAGE_NAMES = {
+    "en": "English",
+    "hi": "Hindi (हिंदी)",
+    "te": "Telugu (తెలుగు)",
+    "ta": "Tamil (தமிழ்)",
+    "kn": "Kannada (ಕನ್ನಡ)",
+    "ml": "Malayalam (മലയാളം)",
+}
+
+
+def base_language(lang: Optional[str]) -> str:
+    """'hi-IN' -> 'hi'."""
+    return (lang or SOURCE_LANGUAGE).strip().lower().split("-")[0]
+
+
+def source_hash(source: Any) -> str:
+    """Stable hash of a source text (a string or a JSON-able structure)."""
+    payload = json.dumps(source, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def batch_translation_prompt(source: Any, languages: Iterable[str]) -> str:
+    """Prompt asking for ``source`` in all ``languages`` at once, as one JSON object."""
+    targets = ", ".join(f"{LANGUAGE_NAMES.get(l, l)} ({l})" for l in languages)
+    return f"""Translate the English health advice below into each of these languages: {targets}.
+
+Rules:
+- Use simple everyday words that a village patient understands.
+- Keep medicine names and numbers unchanged.
+- If the text is JSON, keep its structure and keys exactly and translate only the string values.
+
+Return ONLY a JSON object whose keys are the language codes and whose values are the translations.
+
+Text:
+{json.dumps(source, ensure_ascii=False)}"""
+
+
+def _same_shape(source: Any, value: Any) -> bool:
+    if isinstance(source, dict):
+        return isinstance(value, dict) and all(k in value and _same_shape(v, value[k]) for k, v in source.items())
+    if isinstance(source, list):
+        return isinstance(value, list)
+    if isinstance(source, str):
+        return isinstance(value, str) and bool(value.strip())
+    return True
+
+
+def parse_batch_translation(text: str, source: Any, languages: Iterable[str]) -> Dict[str, Any]:
+    """
+    Translations from a batched reply, keeping only languages whose value has the
+    source's shape. Raises ValueError if the reply isn't a JSON object or has none.
+    """
+    payload = json.loads(text.replace('```json', '').replace('```', ''))
+    if not isinstance(payload, dict):
+        raise ValueError("Batch translation reply is not a JSON object")
+    translations = {}
+    for lang in languages:
+        value = payload.get(lang)
+        if isinstance(source, str) and isinstance(value, dict):
+            # Some models wrap plain text as {"text": ...}
+            value = next(iter(value.values()), None)
+        if _same_shape(source, value):
+            translations[lang] = value
+    if not translations:
+        raise ValueError("Batch translation reply had no usable language")
+    return translations
+
+
+class TranslationMemory:
+    def __init__(self, max_bytes: int = TRANSLATION_MEMORY_BYTES, disk_dir: Optional[str] = TRANSLATION_MEMORY_DIR):
+        self._cache = ResultCache(max_bytes=max_bytes, disk_dir=disk_dir)
+        self.batches = 0
+
+    @staticmethod
+    def _key(digest: str, lang: str) -> str:
+        return f"tm-{digest}-{lang}"
+
+    def get(self, source: Any, lang: str) -> Optional[Any]:
+        if base_language(lang) == SOURCE_LANGUAGE:
+            return source
+        entry = self._cache.get(self._key(source_hash(source), base_language(lang)))
+        return entry["value"] if entry is not None else None
+
+    def put(self, source: Any, lang: str, value: Any) -> None:
+        self._cache.put(self._key(source_hash(source), base_language(lang)), {"value": value})
+
+    def put_batch(self, source: Any, translations: Dict[str, Any]) -> None:
+        self.batches += 1
+        for lang, value in translations.items():
+            self.put(source, lang, value)
+
+    def missing(self, source: Any, languages: Iterable[str] = SUPPORTED_LANGUAGES) -> List[str]:
+        """Target languages (excluding the source language) not yet translated."""
+        return [l for l in languages if l != SOURCE_LANGUAGE and self.get(source, l) is None]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"batches": self.batches, **self._cache.stats()}
+
+
+# Singleton instance
+translation_memory = TranslationMemory()
@@ -0,0 +1,455 @@
+"""
+Triage Rule Engine — declarative clinical-intelligence rulebook compiled at load time.
+
+The rulebook (app/rules/triage_rules.json, or TRIAGE_RULES_PATH; YAML if PyYAML
+is installed) is compiled into:
+- an Aho-Corasick automaton per text field, so every symptom/history phrase is
+  matched in one pass over the text
+- a threshold table (field, op, value/ref) evaluated as NumPy comparisons over a
+  (rows, fields) matrix, so one patient and a 100k-row spreadsheet share a path
+- ordered rule lists (red flags, referrals, prevention, triage) over named atoms
+
+The file is re-read when its mtime changes, so rules can be edited without a restart.
+"""
+import os
+import json
+import time
+import logging
+import threading
+import operator
+import numpy as np
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Make YAML rulebooks optional
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "rules", "triage_rules.json")
+TRIAGE_RULES_PATH = os.getenv("TRIAGE_RULES_PATH", DEFAULT_RULES_PATH)
+RELOAD_CHECK_SECONDS = 1.0
+
+# Numeric inputs and derived values available to thresholds and message templates
+FIELDS = ["age", "temp", "heart_rate", "o2", "last_temp", "systolic", "diastolic",
+          "shock_index", "map", "pulse_pressure", "base_fever", "sirs_score"]
+FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+       "==": operator.eq, "!=": operator.ne}
+
+
+class RulebookError(ValueError):
+    """Raised when a rulebook fails to parse or references unknown names."""
+
+
+# ──────── Keyword automaton ────────
+class KeywordAutomaton:
+    """Aho-Corasick automaton mapping phrases to atom ids (case-insensitive substring match)."""
+
+    def __init__(self, phrases: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[frozenset] = [frozenset()]
+        outputs: List[set] = [set()]
+        for atom, patterns in phrases.items():
+            for pattern in patterns:
+                node = 0
+                for ch in pattern.lower():
+                    nxt = self._goto[node].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[node][ch] = nxt
+                        self._goto.append({})
+                        self._fail.append(0)
+                        outputs.append(set())
+                    node = nxt
+                outputs[node].add(atom)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                outputs[nxt] |= outputs[self._fail[nxt]]
+        self._out = [frozenset(o) for o in outputs]
+
+    def find(self, text: str) -> set:
+        """Atom ids whose phrases occur anywhere in ``text``."""
+        found = set()
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for ch in (text or "").lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found |= out[node]
+        return found
+
+
+# ──────── Compiled rulebook ────────
+class _Condition:
+    """{"all": [...], "any": [...]} over atom columns."""
+
+    def __init__(self, spec: Dict[str, List[str]], atom_index: Dict[str, int]):
+        try:
+            self.all = np.array([atom_index[a] for a in spec.get("all", [])], dtype=np.intp)
+            self.any = np.array([atom_index[a] for a in spec.get("any", [])], dtype=np.intp)
+        except KeyError as e:
+            raise RulebookError(f"Unknown atom {e} in condition {spec}")
+
+    def evaluate(self, atoms: np.ndarray) -> np.ndarray:
+        result = np.ones(atoms.shape[0], dtype=bool)
+        if len(self.all):
+            result &= atoms[:, self.all].all(axis=1)
+        if len(self.any):
+            result &= atoms[:, self.any].any(axis=1)
+        return result
+
+
+class CompiledRulebook:
+    def __init__(self, spec: Dict[str, Any]):
+        self.version = str(spec.get("version", "unversioned"))
+        fever = spec.get("fever_threshold", {})
+        self.fever_default = float(fever.get("default", 38.0))
+        self.fever_elderly_age = float(fever.get("elderly_age", 65))
+        self.fever_elderly = float(fever.get("elderly", 37.5))
+        self.trend = spec.get("trend", {})
+
+        symptom_phrases = spec.get("symptom_phrases", {})
+        history_phrases = spec.get("history_phrases", {})
+        self.symptom_automaton = KeywordAutomaton({f"symptom:{k}": v for k, v in symptom_phrases.items()})
+        self.history_automaton = KeywordAutomaton({f"history:{k}": v for k, v in history_phrases.items()})
+
+        # Atom columns: phrases, thresholds, band levels, score atoms, then has_red_flags
+        atoms = [f"symptom:{k}" for k in symptom_phrases] + [f"history:{k}" for k in history_phrases]
+        self.thresholds = spec.get("thresholds", [])
+        atoms += [t["atom"] for t in self.thresholds]
+        self.bands = spec.get("bands", {})
+        for name, band in self.bands.items():
+            atoms += [f"{name}:{b['status']}" for b in band["bands"]] + [f"{name}:abnormal"]
+        self.scores = spec.get("scores", {})
+        for score in self.scores.values():
+            atoms += list(score.get("atoms", {}))
+        atoms.append("has_red_flags")
+        self.atoms = atoms
+        self.atom_index = {a: i for i, a in enumerate(atoms)}
+        if len(self.atom_index) != len(atoms):
+            raise RulebookError("Duplicate atom names in rulebook")
+
+        self._compile_thresholds()
+        self._score_criteria = {
+            name: [_Condition(c, self.atom_index) for c in score["criteria"]] for name, score in self.scores.items()
+        }
+        for name in self.scores:
+            if name not in FIELD_INDEX:
+                raise RulebookError(f"Score '{name}' is not a known field")
+
+        self.red_flags = [(_Condition(r["when"], self.atom_index), r["message"]) for r in spec.get("red_flags", [])]
+        referrals = spec.get("referrals", {})
+        self.referral_default = referrals.get("default", "General Physician")
+        self.referral_rules = [(_Condition(r["when"], self.atom_index), r) for r in referrals.get("rules", [])]
+        prevention = spec.get("prevention", {})
+        self.prevention_base = list(prevention.get("base", []))
+        self.prevention_rules = [(_Condition(r["when"], self.atom_index), r["add"]) for r in prevention.get("rules", [])]
+        triage = spec.get("triage", {})
+        self.triage_default = int(triage.get("default", 5))
+        self.triage_rules = [(_Condition(r["when"], self.atom_index), int(r["level"])) for r in triage.get("rules", [])]
+
+    def _compile_thresholds(self) -> None:
+        n = len(self.thresholds)
+        self._t_field = np.empty(n, dtype=np.intp)
+        self._t_ref = np.full(n, -1, dtype=np.intp)
+        self._t_value = np.zeros(n, dtype=np.float64)
+        self._t_atom = np.empty(n, dtype=np.intp)
+        groups: Dict[str, List[int]] = {}
+        for i, t in enumerate(self.thresholds):
+            if t["field"] not in FIELD_INDEX or ("ref" in t and t["ref"] not in FIELD_INDEX):
+                raise RulebookError(f"Unknown field in threshold {t}")
+            if t["op"] not in OPS:
+                raise RulebookError(f"Unknown operator in threshold {t}")
+            self._t_field[i] = FIELD_INDEX[t["field"]]
+            if "ref" in t:
+                self._t_ref[i] = FIELD_INDEX[t["ref"]]
+            else:
+                self._t_value[i] = float(t["value"])
+            self._t_atom[i] = self.atom_index[t["atom"]]
+            groups.setdefault(t["op"], []).append(i)
+        self._t_groups = {op: np.array(cols, dtype=np.intp) for op, cols in groups.items()}
+
+    # ── vectorised core ──
+    def base_fever(self, age: np.ndarray) -> np.ndarray:
+        return np.where(age < self.fever_elderly_age, self.fever_default, self.fever_elderly)
+
+    def evaluate_matrix(self, values: np.ndarray, symptom_texts: Sequence[str],
+                        history_texts: Sequence[str]) -> Dict[str, Any]:
+        """
+        Evaluate every rule for R patients. ``values`` is an (R, len(FIELDS))
+        float matrix with NaN for missing inputs; base_fever and sirs_score
+        columns are filled in here.
+        """
+        rows = values.shape[0]
+        values[:, FIELD_INDEX["base_fever"]] = self.base_fever(values[:, FIELD_INDEX["age"]])
+        atoms = np.zeros((rows, len(self.atoms)), dtype=bool)
+
+        # Spreadsheets repeat the same free text a lot; scan each distinct string once
+        for automaton, texts in ((self.symptom_automaton, symptom_texts), (self.history_automaton, history_texts)):
+            seen: Dict[str, np.ndarray] = {}
+            for r in range(rows):
+                text = texts[r]
+                cols = seen.get(text)
+                if cols is None:
+                    cols = np.array([self.atom_index[a] for a in automaton.find(text)], dtype=np.intp)
+                    seen[text] = cols
+                if len(cols):
+                    atoms[r, cols] = True
+
+        if len(self.thresholds):
+            lhs = values[:, self._t_field]
+            rhs = np.where(self._t_ref >= 0, values[:, np.maximum(self._t_ref, 0)], self._t_value)
+            with np.errstate(invalid="ignore"):
+                for op, cols in self._t_groups.items():
+                    atoms[:, self._t_atom[cols]] = OPS[op](lhs[:, cols], rhs[:, cols])
+
+        band_results = {}
+        for name, band in self.bands.items():
+            belows = np.array([b["below"] for b in band["bands"]], dtype=np.float64)
+            v = values[:, FIELD_INDEX[band["field"]]]
+            idx = np.searchsorted(belows, v, side="right")
+            idx[np.isnan(v)] = len(belows)
+            band_results[name] = idx
+            for k, b in enumerate(band["bands"]):
+                atoms[:, self.atom_index[f"{name}:{b['status']}"]] = idx == k
+            atoms[:, self.atom_index[f"{name}:abnormal"]] = idx < len(belows)
+
+        for name, criteria in self._score_criteria.items():
+            score = np.zeros(rows, dtype=np.int64)
+            for cond in criteria:
+                score += cond.evaluate(atoms)
+            values[:, FIELD_INDEX[name]] = score
+            for atom, minimum in self.scores[name].get("atoms", {}).items():
+                atoms[:, self.atom_index[atom]] = score >= minimum
+
+        flag_hits = np.column_stack([c.evaluate(atoms) for c, _ in self.red_flags]) if self.red_flags \
+            else np.zeros((rows, 0), dtype=bool)
+        referral_hits = [c.evaluate(atoms) for c, _ in self.referral_rules]
+        has_flags = flag_hits.any(axis=1)
+        for hits, (_, rule) in zip(referral_hits, self.referral_rules):
+            if "red_flag" in rule:
+                has_flags |= hits
+        atoms[:, self.atom_index["has_red_flags"]] = has_flags
+
+        triage = np.full(rows, self.triage_default, dtype=np.int64)
+        for cond, level in self.triage_rules:
+            triage = np.where(cond.evaluate(atoms), np.minimum(triage, level), triage)
+
+        return {
+            "atoms": atoms,
+            "bands": band_results,
+            "flag_hits": flag_hits,
+            "referral_hits": referral_hits,
+            "prevention_hits": [c.evaluate(atoms) for c, _ in self.prevention_rules],
+            "triage": triage,
+        }
+
+    # ── per-row assembly ──
+    @staticmethod
+    def _template_value(v: float):
+        if np.isnan(v):
+            return 0
+        return int(v) if float(v).is_integer() else float(v)
+
+    def row_details(self, result: Dict[str, Any], values: np.ndarray, r: int) -> Dict[str, Any]:
+        """Red flags, referral, rule-outs, prevention and band labels for row r."""
+        ctx = {name: self._template_value(values[r, i]) for name, i in FIELD_INDEX.items()}
+        band_labels = {}
+        for name, band in self.bands.items():
+            k = result["bands"][name][r]
+            chosen = band["bands"][k] if k < len(band["bands"]) else band["default"]
+            band_labels[name] = chosen
+            ctx[f"{name}_level"] = chosen["level"]
+            ctx[f"{name}_status"] = chosen["status"]
+
+        red_flags = [msg.format(**ctx) for k, (_, msg) in enumerate(self.red_flags) if result["flag_hits"][r, k]]
+        referral = self.referral_default
+        rule_outs: List[str] = []
+        for hits, (_, rule) in zip(result["referral_hits"], self.referral_rules):
+            if not hits[r]:
+                continue
+            if "referral" in rule:
+                referral = rule["referral"]
+            if "rule_outs" in rule:
+                rule_outs = list(rule["rule_outs"])
+            rule_outs += rule.get("add_rule_outs", [])
+            if "red_flag" in rule:
+                red_flags.append(rule["red_flag"].format(**ctx))
+
+        prevention = list(self.prevention_base)
+        for hits, (_, add) in zip(result["prevention_hits"], self.prevention_rules):
+            if hits[r]:
+                prevention += add
+
+        return {"red_flags": red_flags, "referral": referral, "rule_outs": rule_outs,
+                "prevention": prevention, "bands": band_labels}
+
+    def temporal_trend(self, temp: float, last_temp: Optional[float]) -> str:
+        delta = float(self.trend.get("delta", 0.5))
+        if last_temp:
+            if temp > last_temp + delta:
+                return self.trend.get("worsening", "Worsening")
+            if temp < last_temp - delta:
+                return self.trend.get("improving", "Improving")
+        return self.trend.get("stable", "Stable")
+
+
+# ──────── Derived vitals ────────
+def parse_bp(bp: Optional[str]) -> Tuple[float, float]:
+    """'120/80' -> (120.0, 80.0); NaNs when absent or malformed."""
+    if bp and '/' in bp:
+        try:
+            sys_val, dia_val = map(int, bp.split('/'))
+            return float(sys_val), float(dia_val)
+        except ValueError:
+            pass
+    return np.nan, np.nan
+
+
+def parse_bp_column(bp: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorised parse_bp over a column of strings; malformed entries become NaN."""
+    arr = np.asarray(bp, dtype=str)
+    parts = np.char.partition(arr, "/")
+    sys_s = np.char.strip(parts[..., 0])
+    dia_s = np.char.strip(parts[..., 2])
+    valid = (parts[..., 1] == "/") & np.char.isdigit(sys_s) & np.char.isdigit(dia_s)
+    systolic = np.full(arr.shape, np.nan)
+    diastolic = np.full(arr.shape, np.nan)
+    systolic[valid] = sys_s[valid].astype(np.float64)
+    diastolic[valid] = dia_s[valid].astype(np.float64)
+    return systolic, diastolic
+
+
+def derive_vitals(heart_rate: np.ndarray, systolic: np.ndarray, diastolic: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Shock index, MAP and pulse pressure as column operations. Like the original
+    handler, they are only reported when both BP and a non-zero heart rate are
+    present; otherwise they are 0.
+    """
+    have = ~np.isnan(systolic) & ~np.isnan(diastolic) & ~np.isnan(heart_rate) & (heart_rate != 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pulse_pressure = np.where(have, systolic - diastolic, 0.0)
+        map_val = np.where(have, (systolic + 2 * diastolic) / 3, 0.0)
+        shock_index = np.where(have & (systolic > 0), heart_rate / systolic, 0.0)
+    return {"shock_index": shock_index, "map": map_val, "pulse_pressure": pulse_pressure}
+
+
+def _nan_if_falsy(v) -> float:
+    return float(v) if v else np.nan
+
+
+# ──────── Engine with hot reload ────────
+class TriageEngine:
+    def __init__(self, path: str = TRIAGE_RULES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self.loaded_at = None
+        self.rulebook = self._load()
+
+    def _read_spec(self) -> Dict[str, Any]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            if self.path.endswith((".yaml", ".yml")):
+                if not YAML_AVAILABLE:
+                    raise RulebookError("PyYAML is not installed; use a .json rulebook")
+                return yaml.safe_load(f)
+            return json.load(f)
+
+    def _load(self) -> CompiledRulebook:
+        mtime = os.path.getmtime(self.path)
+        rulebook = CompiledRulebook(self._read_spec())
+        self._mtime = mtime
+        self.loaded_at = time.time()
+        logger.info(f"Triage rulebook v{rulebook.version} compiled: {len(rulebook.atoms)} atoms")
+        return rulebook
+
+    def reload(self) -> Dict[str, Any]:
+        """Recompile from disk; the old rulebook stays active if the new one is invalid."""
+        with self._lock:
+            self.rulebook = self._load()
+        return self.info()
+
+    def current(self) -> CompiledRulebook:
+        """The active rulebook, recompiled first if the file changed on disk."""
+        now = time.monotonic()
+        if now - self._checked_at >= RELOAD_CHECK_SECONDS:
+            self._checked_at = now
+            try:
+                if os.path.getmtime(self.path) != self._mtime:
+                    self.reload()
+                    print(f"🔄 Triage rulebook reloaded (v{self.rulebook.version})")
+            except Exception as e:
+                logger.error(f"Triage rulebook reload failed, keeping v{self.rulebook.version}: {e}")
+                self._mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else self._mtime
+        return self.rulebook
+
+    def info(self) -> Dict[str, Any]:
+        rb = self.rulebook
+        return {
+            "version": rb.version,
+            "path": self.path,
+            "atoms": len(rb.atoms),
+            "thresholds": len(rb.thresholds),
+            "red_flag_rules": len(rb.red_flags),
+            "referral_rules": len(rb.referral_rules),
+            "loaded_at": self.loaded_at,
+        }
+
+    def evaluate(self, age: int, temp: float, symptoms: str, history: str = "",
+                 last_temp: Optional[float] = None, heart_rate: Optional[int] = None,
+                 bp: Optional[str] = None, o2: Optional[int] = None) -> Dict[str, Any]:
+        """Single-patient triage; one automaton pass per text and one threshold-table pass."""
+        rb = self.current()
+        systolic, diastolic = parse_bp(bp)
+        hr = _nan_if_falsy(heart_rate)
+        derived = derive_vitals(np.array([hr]), np.array([systolic]), np.array([diastolic]))
+
+        values = np.full((1, len(FIELDS)), np.nan)
+        for name, v in (("age", float(age)), ("temp", float(temp)), ("heart_rate", hr),
+                        ("o2", _nan_if_falsy(o2)), ("last_temp", _nan_if_falsy(last_temp)),
+                        ("systolic", systolic), ("diastolic", diastolic)):
+            values[0, FIELD_INDEX[name]] = v
+        for name, col in derived.items():
+            values[0, FIELD_INDEX[name]] = col[0]
+
+        result = rb.evaluate_matrix(values, [symptoms], [history])
+        details = rb.row_details(result, values, 0)
+        atoms = result["atoms"][0]
+        sirs_score = int(values[0, FIELD_INDEX["sirs_score"]])
+        return {
+            "triage_level": int(result["triage"][0]),
+            "base_fever": float(values[0, FIELD_INDEX["base_fever"]]),
+            "has_fever": bool(atoms[rb.atom_index["fever"]]) if "fever" in rb.atom_index else False,
+            "shock_index": float(derived["shock_index"][0]),
+            "map": float(derived["map"][0]),
+            "pulse_pressure": int(derived["pulse_pressure"][0]) if derived["map"][0] else 0.0,
+            "sirs_score": sirs_score,
+            "sirs_alert": bool(atoms[rb.atom_index["sirs_alert"]]) if "sirs_alert" in rb.atom_index else False,
+            "red_flags": details["red_flags"],
+            "temporal_trend": rb.temporal_trend(temp, last_temp),
+            "rule_outs": details["rule_outs"],
+            "prevention": details["prevention"],
+            "referral": details["referral"],
+        }
+
+
+# Singleton instance
+triage_engine = TriageEngine()
@@ -0,0 +1,238 @@
+"""
+TTS Backends — pluggable speech synthesizers and latency-aware selection.
+
+- GTTSBackend: Google Translate TTS over the network (best voices, needs WAN)
+- EspeakBackend: espeak-ng run locally (robotic but offline and fast); its
+  WAV output is encoded to MP3 with ffmpeg when installed, so it can share
+  the audio cache and the MP3 stream with gTTS
+
+Each backend learns its synthesis latency per character (EWMA over real
+calls) and sits out TTS_BACKEND_COOLDOWN_SECONDS after a failure.
+``TTSBackendSelector.choose`` orders the backends for one request: the
+first in TTS_BACKENDS priority whose predicted latency fits
+TTS_LATENCY_BUDGET_MS, then the rest fastest first, so a slow or dead
+network falls through to the offline engine.
+"""
+import os
+import re
+import time
+import shutil
+import logging
+import subprocess
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from .tts_cache import normalize_text
+
+try:
+    from gtts import gTTS
+    GTTS_AVAILABLE = True
+except ImportError:
+    GTTS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Priority order (best voice first)
+TTS_BACKENDS = [b.strip() for b in os.getenv("TTS_BACKENDS", "gtts,espeak").split(",") if b.strip()]
+TTS_LATENCY_BUDGET_MS = float(os.getenv("TTS_LATENCY_BUDGET_MS", "3000"))
+TTS_BACKEND_COOLDOWN_SECONDS = float(os.getenv("TTS_BACKEND_COOLDOWN_SECONDS", "60"))
+ESPEAK_BIN = os.getenv("ESPEAK_BIN") or shutil.which("espeak-ng") or shutil.which("espeak") or "espeak-ng"
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+ESPEAK_TIMEOUT_SECONDS = 30
+
+EWMA_ALPHA = 0.2
+MP3 = "audio/mpeg"
+WAV = "audio/wav"
+
+# Sentence ends: . ! ? and the Devanagari danda / double danda, followed by whitespace
+_SENTENCE_END = re.compile(r"(?<=[.!?।॥])\s+|\n+")
+
+
+def split_sentences(text: str, max_chars: int = 200) -> List[str]:
+    """
+    Sentences to synthesize one by one. Fragments too short to sound natural on
+    their own are joined to the previous sentence; sentences over max_chars are
+    cut at the last comma or space before the limit.
+    """
+    sentences: List[str] = []
+    for part in _SENTENCE_END.split(text):
+        part = normalize_text(part)
+        while len(part) > max_chars:
+            cut = max(part.rfind(",", 0, max_chars), part.rfind(" ", 0, max_chars))
+            cut = cut + 1 if cut > 0 else max_chars
+            sentences.append(part[:cut].strip())
+            part = part[cut:].strip()
+        if not part:
+            continue
+        if sentences and (len(part) < 12 or len(sentences[-1]) < 12) and len(sentences[-1]) + len(part) < max_chars:
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
+
+
+def strip_id3(audio: bytes) -> bytes:
+    """MP3 frames without a leading ID3v2 tag, so clips can be concatenated into one stream."""
+    if len(audio) < 10 or audio[:3] != b"ID3":
+        return audio
+    size = (audio[6] << 21) | (audio[7] << 14) | (audio[8] << 7) | audio[9]
+    footer = 10 if audio[5] & 0x10 else 0
+    return audio[10 + size + footer:]
+
+
+def join_mp3(clips: Sequence[bytes]) -> bytes:
+    """One playable MP3 from several: the first clip's tag is kept, the others' dropped."""
+    return b"".join(clip if i == 0 else strip_id3(clip) for i, clip in enumerate(clips))
+
+
+class TTSBackend:
+    """Base class: subclasses set name/prior_ms_per_char/languages and implement _synthesize."""
+    name = "base"
+    offline = False
+    prior_ms_per_char = 10.0
+    languages: Dict[str, str] = {}  # base language -> engine voice / language code
+
+    def __init__(self):
+        self.ms_per_char = self.prior_ms_per_char
+        self.calls = 0
+        self.failures = 0
+        self.failed_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    # ── capability ──
+    @property
+    def installed(self) -> bool:
+        return False
+
+    @property
+    def mime_type(self) -> str:
+        return MP3
+
+    @property
+    def available(self) -> bool:
+        cooling = self.failed_at is not None and time.time() - self.failed_at < TTS_BACKEND_COOLDOWN_SECONDS
+        return self.installed and not cooling
+
+    def supports(self, lang: str) -> bool:
+        return lang in self.languages
+
+    def voice(self, lang: str) -> str:
+        """Cache / response voice name; the same text in another voice is a different clip."""
+        return f"{self.name}-{self.languages.get(lang, lang)}"
+
+    def predict_ms(self, chars: int) -> float:
+        return self.ms_per_char * max(chars, 1)
+
+    # ── synthesis ──
+    def synthesize(self, text: str, lang: str) -> bytes:
+        started = time.perf_counter()
+        try:
+            audio = self._synthesize(text, lang)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+                self.failed_at = time.time()
+                self.last_error = str(e)
+            logger.warning("TTS backend %s failed: %s", self.name, e)
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.calls += 1
+            self.failed_at = None
+            self.ms_per_char += EWMA_ALPHA * (elapsed_ms / max(len(text), 1) - self.ms_per_char)
+        return audio
+
+    def _synthesize(self, text: str, lang: str) -> bytes:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "installed": self.installed,
+            "available": self.available,
+            "offline": self.offline,
+            "mime_type": self.mime_type,
+            "ms_per_char": round(self.ms_per_char, 2),
+            "calls": self.calls,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class GTTSBackend(TTSBackend):
+    name = "gtts"
+    prior_ms_per_char = 8.0
+    languages = {l: l for l in ("en", "hi", "te", "ta", "kn", "ml", "bn", "gu", "mr")}
+
+    @property
+    def installed(self) -> bool:
+        return GTTS_AVAILABLE
+
+    def voice(self, lang: str) -> str:
+        # Same voice name as before backends existed, so earlier cached clips still match
+        return f"gTTS-{lang}"
+
+    def _synthesize(self, text: str, lang: str) -> bytes:
+        import io
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang, slow=False).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class EspeakBackend(TTSBackend):
+    name = "espeak"
+    offline = True
+    prior_ms_per_char = 0.5
+    languages = {"en": "en-us", "hi": "hi", "te": "te", "ta": "ta", "kn": "kn", "ml": "ml",
+                 "bn": "bn", "gu": "gu", "mr": "mr"}
+
+    @property
+    def installed(self) -> bool:
+        return shutil.which(ESPEAK_BIN) is not None
+
+    @property
+    def mime_type(self) -> str:
+        return MP3 if shutil.which(FFMPEG_BIN) else WAV
+
+    def _synthesize(self, text: str, lang: str) -> bytes:
+        # Text goes on stdin so a sentence starting with "-" isn't read as an option
+        proc = subprocess.run([ESPEAK_BIN, "-v", self.languages[lang], "--stdout", "--stdin"],
+                              input=text.encode("utf-8"), capture_output=True, timeout=ESPEAK_TIMEOUT_SECONDS)
+        if proc.returncode != 0 or not proc.stdout:
+            raise RuntimeError(f"espeak failed: {proc.stderr.decode(errors='ignore')[:200]}")
+        if self.mime_type == WAV:
+            return proc.stdout
+        proc = subprocess.run(
+            [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+             "-f", "mp3", "-b:a", "48k", "pipe:1"],
+            input=proc.stdout, capture_output=True, timeout=ESPEAK_TIMEOUT_SECONDS,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg could not encode speech: {proc.stderr.decode(errors='ignore')[:200]}")
+        return proc.stdout
+
+
+BACKEND_TYPES = {cls.name: cls for cls in (GTTSBackend, EspeakBackend)}
+
+
+class TTSBackendSelector:
+    def __init__(self, names: Sequence[str] = TTS_BACKENDS, budget_ms: float = TTS_LATENCY_BUDGET_MS):
+        self.backends: List[TTSBackend] = [BACKEND_TYPES[n]() for n in names if n in BACKEND_TYPES]
+        self.budget_ms = budget_ms
+
+    def get(self, name: str) -> Optional[TTSBackend]:
+        return next((b for b in self.backends if b.name == name), None)
+
+    def choose(self, text: str, lang: str, mime_types: Sequence[str] = (MP3, WAV)) -> List[TTSBackend]:
+        """
+        Backends to try for this text, in order: the highest-priority one expected
+        to finish within the latency budget, then the others fastest first.
+        """
+        usable = [b for b in self.backends if b.available and b.supports(lang) and b.mime_type in mime_types]
+        within = [b for b in usable if b.predict_ms(len(text)) <= self.budget_ms]
+        first = within[:1]
+        rest = sorted((b for b in usable if b not in first), key=lambda b: b.predict_ms(len(text)))
+        return first + rest
+
+    def stats(self) -> Dict[str, Any]:
+        return {"budget_ms": self.budget_ms, "backends": {b.name: b.stats() for b in self.backends}}
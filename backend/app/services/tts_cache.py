@@ -0,0 +1,180 @@
+"""
+TTS Cache — content-addressed cache of synthesized speech.
+
+Keys are a blake2b digest of (normalized text, language, voice), so the same
+phrase is synthesized once no matter how its whitespace or Unicode form
+arrived. Two tiers, both LRU and byte-bounded:
+- memory: hot set of recently played clips (TTS_CACHE_MEMORY_BYTES)
+- disk: one audio file per key under TTS_CACHE_DIR (TTS_CACHE_DISK_BYTES),
+  so cached phrases survive restarts and play without network access
+
+Audio for a given text doesn't go stale, so entries never expire.
+"""
+import os
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+VAULT_BASE = os.getenv("VAULT_BASE", "./nexus_vault")
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", f"{VAULT_BASE}/tts_cache")
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+
+
+def normalize_text(text: str) -> str:
+    """NFC, whitespace collapsed and trimmed: the form that is synthesized and hashed."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def tts_cache_key(text: str, language: str, voice: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    for part in (normalize_text(text), language, voice):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class AudioCache:
+    def __init__(self, max_bytes: int = TTS_CACHE_MEMORY_BYTES, disk_dir: Optional[str] = TTS_CACHE_DIR,
+                 disk_max_bytes: int = TTS_CACHE_DISK_BYTES, suffix: str = ".mp3"):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()  # key -> file size
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    # ── public API ──
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return audio
+        audio = self._disk_get(key)
+        with self._lock:
+            if audio is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, audio)
+        return audio
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._memory or key in self._disk_index
+
+    def put(self, key: str, audio: bytes) -> None:
+        with self._lock:
+            self._memory_put(key, audio)
+        self._disk_put(key, audio)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_max_bytes": self.max_bytes,
+                "disk_enabled": bool(self.disk_dir),
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+    # ── memory tier ──
+    def _memory_put(self, key: str, audio: bytes) -> None:
+        """Caller holds the lock."""
+        if len(audio) > self.max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # ── disk tier ──
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + self.suffix)
+
+    def _load_disk_index(self) -> None:
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(self.suffix):
+                continue
+            st = os.stat(os.path.join(self.disk_dir, name))
+            entries.append((st.st_mtime, name[:-len(self.suffix)], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+        logger.info(f"TTS cache disk tier loaded: {len(self._disk_index)} clips")
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        with self._lock:
+            if key not in self._disk_index:
+                return None
+            self._disk_index.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+            os.utime(self._path(key))
+            return audio
+        except OSError as e:
+            logger.warning(f"TTS cache disk read failed for {key}: {e}")
+            with self._lock:
+                self._disk_bytes -= self._disk_index.pop(key, 0)
+            return None
+
+    def _disk_put(self, key: str, audio: bytes) -> None:
+        if not self.disk_dir or len(audio) > self.disk_max_bytes:
+            return
+        tmp = self._path(key) + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(audio)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning(f"TTS cache disk write failed for {key}: {e}")
+            return
+        evict = []
+        with self._lock:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+            self._disk_index[key] = len(audio)
+            self._disk_bytes += len(audio)
+            while self._disk_bytes > self.disk_max_bytes:
+                old_key, size = self._disk_index.popitem(last=False)
+                self._disk_bytes -= size
+                evict.append(old_key)
+        for old_key in evict:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+
+# Singleton instance
+tts_cache = AudioCache()
@@ -1,5 +1,19 @@
 import os
 import base64
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+from .tts_backends import TTSBackendSelector, split_sentences, join_mp3, strip_id3, MP3, WAV
+from .tts_cache import tts_cache, tts_cache_key
+
+PREWARM_MAX_CONSECUTIVE_FAILURES = 3
+# Streaming TTS: sentences synthesized ahead of the one being sent, per request
+TTS_STREAM_PARALLELISM = int(os.getenv("TTS_STREAM_PARALLELISM", "3"))
+TTS_SENTENCE_MAX_CHARS = int(os.getenv("TTS_SENTENCE_MAX_CHARS", "200"))
+# Shared by all requests, so concurrent ones can't open unbounded synthesis calls
+tts_pool = ThreadPoolExecutor(max_workers=int(os.getenv("TTS_SYNTH_WORKERS", "8")), thread_name_prefix="tts-synth")
+
 try:
     from google.cloud import texttospeech
     GOOGLE_TTS_AVAILABLE = True
@@ -7,90 +21,199 @@ except ImportError:
     GOOGLE_TTS_AVAILABLE = False
     print("⚠️ google-cloud-texttospeech not installed")
 
+# (audio, voice, mime type, served from cache)
+Clip = Tuple[Optional[bytes], str, str, bool]
+
+
 class CloudTTSService:
-    """Google Cloud Text-to-Speech service for high-quality multi-language voice"""
-    
+    """
+    Multi-language text-to-speech over pluggable backends (gTTS online, espeak-ng
+    offline), chosen per request by availability and learned latency. Audio is
+    made and cached per sentence, so template sentences play from the cache even
+    with no backend reachable.
+    """
+
     def __init__(self):
-        self.client = None
-        
-        if not GOOGLE_TTS_AVAILABLE:
-            print("⚠️ Cloud TTS: Library not available, using fallback")
-            return
-            
-        api_key = os.getenv("GEMINI_API_KEY")
-        
-        if api_key:
-            try:
-                # Google Cloud TTS requires service account or ADC
-                # For Gemini API key, we'll use a workaround with gTTS instead
-                # which is simpler and works with any Google API
-                from gtts import gTTS
-                self.use_gtts = True
-                print("✅ Cloud TTS: Using gTTS (Google Text-to-Speech)")
-            except ImportError:
-                print("⚠️ Cloud TTS: gTTS not available, using browser fallback")
-                self.use_gtts = False
+        self.backends = TTSBackendSelector()
+        installed = [b.name for b in self.backends.backends if b.installed]
+        if installed:
+            print(f"✅ TTS: backends {' → '.join(installed)} (selected by availability and latency)")
         else:
-            print("⚠️ Cloud TTS: No API key, using browser fallback")
-            self.use_gtts = False
-    
+            print("⚠️ TTS: no synthesis backend installed, serving cached clips only")
+
     def synthesize_speech(self, text: str, language_code: str = "en") -> dict:
         """
-        Convert text to speech using gTTS
-        
+        Convert text to speech
+
         Args:
             text: Text to convert to speech
             language_code: Language code (e.g., 'te-IN', 'hi-IN', 'en-IN')
-            
+
         Returns:
             dict with audio_content (base64) and success status
         """
-        if not hasattr(self, 'use_gtts') or not self.use_gtts:
-            return {"success": False, "error": "TTS not available"}
-        
         try:
-            # Import gTTS
-            from gtts import gTTS
-            import io
-            
-            # Extract base language code (e.g., 'te' from 'te-IN')
-            lang = language_code.split('-')[0]
-            
-            # gTTS language mapping
-            lang_map = {
-                'te': 'te',  # Telugu
-                'hi': 'hi',  # Hindi
-                'ta': 'ta',  # Tamil
-                'kn': 'kn',  # Kannada
-                'ml': 'ml',  # Malayalam
-                'en': 'en',  # English
-                'bn': 'bn',  # Bengali
-                'gu': 'gu',  # Gujarati
-                'mr': 'mr',  # Marathi
-            }
-            
-            tts_lang = lang_map.get(lang, 'en')
-            
-            # Generate speech
-            tts = gTTS(text=text, lang=tts_lang, slow=False)
-            
-            # Save to bytes buffer
-            audio_buffer = io.BytesIO()
-            tts.write_to_fp(audio_buffer)
-            audio_buffer.seek(0)
-            
-            # Encode to base64
-            audio_base64 = base64.b64encode(audio_buffer.read()).decode('utf-8')
-            
-            print(f"✅ gTTS: Synthesized {len(text)} chars in {tts_lang}")
-            
-            return {
-                "success": True,
-                "audio_content": audio_base64,
-                "language": language_code,
-                "voice_name": f"gTTS-{tts_lang}"
-            }
-            
+            audio, voice, mime_type, cached = self.synthesize_audio(text, language_code)
         except Exception as e:
             print(f"❌ TTS Error: {e}")
             return {"success": False, "error": str(e)}
+        if audio is None:
+            return {"success": False, "error": "TTS not available"}
+
+        # Encode to base64
+        audio_base64 = base64.b64encode(audio).decode('utf-8')
+
+        return {
+            "success": True,
+            "audio_content": audio_base64,
+            "language": language_code,
+            "voice_name": voice,
+            "mime_type": mime_type,
+            "cached": cached
+        }
+
+    def synthesize_audio(self, text: str, language_code: str = "en") -> Clip:
+        """
+        Audio for the whole text: its sentences synthesized in parallel (or taken
+        from the cache) and joined into one MP3. Without an MP3 backend, falls back
+        to one WAV for the whole text. Audio is None if nothing can speak it;
+        raises if every backend tried failed.
+        """
+        lang = self._tts_language(language_code)
+        sentences = split_sentences(text, TTS_SENTENCE_MAX_CHARS)
+        if not sentences:
+            return None, "", MP3, False
+        clips, error = [], None
+        for future in [tts_pool.submit(self._clip, s, lang) for s in sentences]:
+            try:
+                clips.append(future.result())
+            except Exception as e:
+                error = e
+                clips.append((None, "", MP3, False))
+        if all(audio is not None for audio, _, _, _ in clips):
+            return (join_mp3([audio for audio, _, _, _ in clips]), clips[0][1], MP3,
+                    all(cached for _, _, _, cached in clips))
+        # No MP3 voice for some sentence: a WAV backend speaks the whole text instead
+        clip = self._clip(" ".join(sentences), lang, mime_types=(WAV,))
+        if clip[0] is None and error is not None:
+            raise error
+        return clip
+
+    def _clip(self, sentence: str, lang: str, mime_types: Sequence[str] = (MP3,)) -> Clip:
+        """One sentence: a cached clip (best voice first), else the selected backends in order."""
+        if MP3 in mime_types:
+            for backend in self.backends.backends:
+                if backend.supports(lang) and backend.mime_type == MP3:
+                    audio = tts_cache.get(tts_cache_key(sentence, lang, backend.voice(lang)))
+                    if audio is not None:
+                        return audio, backend.voice(lang), MP3, True
+        error = None
+        for backend in self.backends.choose(sentence, lang, mime_types):
+            try:
+                audio = backend.synthesize(sentence, lang)
+            except Exception as e:
+                error = e
+                continue
+            if backend.mime_type == MP3:
+                tts_cache.put(tts_cache_key(sentence, lang, backend.voice(lang)), audio)
+            print(f"✅ TTS ({backend.name}): Synthesized {len(sentence)} chars in {lang}")
+            return audio, backend.voice(lang), backend.mime_type, False
+        if error is not None:
+            raise error
+        return None, "", MP3, False
+
+    def stream_speech(self, text: str, language_code: str = "en",
+                      parallelism: int = TTS_STREAM_PARALLELISM) -> Iterator[bytes]:
+        """
+        MP3 audio for ``text`` sentence by sentence, in order. Up to ``parallelism``
+        sentences are synthesized ahead on the shared pool, so playback can start
+        after the first one. Each sentence is cached on its own. Raises if the first
+        sentence can't be synthesized; a later failed sentence is skipped.
+        """
+        lang = self._tts_language(language_code)
+        sentences = iter(split_sentences(text, TTS_SENTENCE_MAX_CHARS))
+        pending: Deque = deque()
+
+        def submit_next() -> None:
+            sentence = next(sentences, None)
+            if sentence is not None:
+                pending.append(tts_pool.submit(self._clip, sentence, lang))
+
+        for _ in range(max(1, parallelism)):
+            submit_next()
+        first = True
+        try:
+            while pending:
+                future = pending.popleft()
+                try:
+                    audio, _, _, _ = future.result()
+                    if audio is None:
+                        raise RuntimeError("TTS not available")
+                except Exception as e:
+                    if first:
+                        raise
+                    print(f"❌ TTS stream: skipped a sentence: {e}")
+                    continue
+                finally:
+                    submit_next()
+                yield audio if first else strip_id3(audio)
+                first = False
+        finally:
+            # Client went away: drop sentences not started yet
+            for future in pending:
+                future.cancel()
+
+    def prewarm(self, phrases: Iterable[Tuple[str, str]]) -> Dict[str, int]:
+        """
+        Cache the best (first online) backend's voice for every sentence of the
+        (text, language_code) phrases; stops early if that backend keeps failing.
+        Offline backends are fast enough not to need it.
+        """
+        counts = {"synthesized": 0, "cached": 0, "failed": 0}
+        failures = 0
+        for text, language_code in phrases:
+            lang = self._tts_language(language_code)
+            backend = next((b for b in self.backends.backends
+                            if not b.offline and b.installed and b.supports(lang) and b.mime_type == MP3), None)
+            if backend is None:
+                continue
+            for sentence in split_sentences(text, TTS_SENTENCE_MAX_CHARS):
+                key = tts_cache_key(sentence, lang, backend.voice(lang))
+                if key in tts_cache:
+                    counts["cached"] += 1
+                    continue
+                try:
+                    tts_cache.put(key, backend.synthesize(sentence, lang))
+                    counts["synthesized"] += 1
+                    failures = 0
+                except Exception as e:
+                    counts["failed"] += 1
+                    failures += 1
+                    print(f"❌ TTS prewarm error: {e}")
+                    if failures >= PREWARM_MAX_CONSECUTIVE_FAILURES:
+                        print(f"⚠️ TTS prewarm: {backend.name} unreachable, stopping")
+                        return counts
+        return counts
+
+    def stats(self) -> dict:
+        return {**self.backends.stats(), "cache": tts_cache.stats()}
+
+    @staticmethod
+    def _tts_language(language_code: str) -> str:
+        # Extract base language code (e.g., 'te' from 'te-IN')
+        lang = language_code.split('-')[0]
+
+        # Supported language mapping
+        lang_map = {
+            'te': 'te',  # Telugu
+            'hi': 'hi',  # Hindi
+            'ta': 'ta',  # Tamil
+            'kn': 'kn',  # Kannada
+            'ml': 'ml',  # Malayalam
+            'en': 'en',  # English
+            'bn': 'bn',  # Bengali
+            'gu': 'gu',  # Gujarati
+            'mr': 'mr',  # Marathi
+        }
+
+        return lang_map.get(lang, 'en')
@@ -0,0 +1,181 @@
+"""
+Upload Stage — shared, bounded ingestion for image (and CSV/NDJSON) upload endpoints.
+
+Reads only the header first, sniffs the magic bytes and image dimensions, and
+rejects oversized or non-image uploads before the body is pulled into memory
+or handed to a decoder. The returned ``bytes`` object is passed to decoders
+without further copies (``np.frombuffer`` / ``io.BytesIO`` share its buffer).
+"""
+import os
+import struct
+import logging
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+HEADER_BYTES = 64 * 1024
+CHUNK_BYTES = 256 * 1024
+MB = 1024 * 1024
+
+# Global cap applied to the raw request body before multipart parsing
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(50 * MB)))
+
+IMAGE_FORMATS = frozenset({"jpeg", "png", "gif", "bmp", "webp", "tiff"})
+TABLE_FORMATS = frozenset({"csv", "ndjson"})
+
+
+class UploadRejected(ValueError):
+    """Raised when an upload fails the size or format checks."""
+
+
+@dataclass(frozen=True)
+class UploadLimit:
+    max_bytes: int
+    max_pixels: int = 40_000_000
+    formats: FrozenSet[str] = IMAGE_FORMATS
+
+
+UPLOAD_LIMITS: Dict[str, UploadLimit] = {
+    "diagnose": UploadLimit(max_bytes=15 * MB),
+    "analyze-report": UploadLimit(max_bytes=20 * MB),
+    "anemia-eye-scanner": UploadLimit(max_bytes=10 * MB, max_pixels=24_000_000),
+    "vein-finder": UploadLimit(max_bytes=10 * MB, max_pixels=24_000_000),
+    "risk-projection": UploadLimit(max_bytes=10 * MB, max_pixels=24_000_000),
+    "xray-analyze": UploadLimit(max_bytes=40 * MB, max_pixels=64_000_000),
+    "prescription": UploadLimit(max_bytes=10 * MB),
+    "bulk-triage": UploadLimit(max_bytes=MAX_REQUEST_BYTES, formats=TABLE_FORMATS),
+}
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Identify the image container from its magic bytes."""
+    if head[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:2] == b"BM":
+        return "bmp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+
+def sniff_table_format(head: bytes) -> Optional[str]:
+    """CSV or NDJSON from the first non-blank character of a UTF-8 text upload."""
+    try:
+        text = head.decode("utf-8-sig", errors="strict" if len(head) < HEADER_BYTES else "ignore").lstrip()
+    except UnicodeDecodeError:
+        return None
+    if not text or "\x00" in text:
+        return None
+    if text[0] == "{":
+        return "ndjson"
+    first_line = text.split("\n", 1)[0]
+    return "csv" if "," in first_line else None
+
+
+def _jpeg_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    i = 2
+    n = len(head)
+    while i + 9 <= n:
+        if head[i] != 0xFF:
+            i += 1
+            continue
+        marker = head[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h, w = struct.unpack(">HH", head[i + 5:i + 9])
+            return w, h
+        seg_len = struct.unpack(">H", head[i + 2:i + 4])[0]
+        i += 2 + seg_len
+    return None
+
+
+def image_dimensions(head: bytes, kind: str) -> Optional[Tuple[int, int]]:
+    """(width, height) parsed from the header alone, or None if not available."""
+    try:
+        if kind == "png" and len(head) >= 24:
+            return struct.unpack(">II", head[16:24])
+        if kind == "gif" and len(head) >= 10:
+            return struct.unpack("<HH", head[6:10])
+        if kind == "bmp" and len(head) >= 26:
+            w, h = struct.unpack("<ii", head[18:26])
+            return abs(w), abs(h)
+        if kind == "webp" and len(head) >= 30:
+            chunk = head[12:16]
+            if chunk == b"VP8 ":
+                w, h = struct.unpack("<HH", head[26:30])
+                return w & 0x3FFF, h & 0x3FFF
+            if chunk == b"VP8L":
+                bits = int.from_bytes(head[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+        if kind == "jpeg":
+            return _jpeg_dimensions(head)
+    except struct.error:
+        return None
+    return None
+
+
+def check_header(head: bytes, limit: UploadLimit) -> str:
+    """Validate format and declared dimensions; returns the sniffed format."""
+    if limit.formats == TABLE_FORMATS:
+        # Text only: a CSV whose first column is "BMI" must not sniff as a BMP
+        kind = sniff_table_format(head)
+    else:
+        kind = sniff_format(head)
+    if kind is None or kind not in limit.formats:
+        if limit.formats == TABLE_FORMATS:
+            raise UploadRejected("Unsupported file type - please upload a CSV or NDJSON file")
+        raise UploadRejected("Unsupported file type - please upload a JPEG, PNG or WEBP image")
+    dims = image_dimensions(head, kind)
+    if dims is not None:
+        w, h = dims
+        if w == 0 or h == 0:
+            raise UploadRejected("Image header reports zero width or height")
+        if w * h > limit.max_pixels:
+            raise UploadRejected(f"Image too large ({w}x{h}); limit is {limit.max_pixels // 1_000_000} megapixels")
+    return kind
+
+
+async def read_upload(file: UploadFile, endpoint: str) -> bytes:
+    """
+    Read an upload under the byte/format limits configured for ``endpoint``.
+    Raises UploadRejected before buffering the body when any check fails.
+    """
+    limit = UPLOAD_LIMITS[endpoint]
+    if file.size is not None and file.size > limit.max_bytes:
+        raise UploadRejected(f"File too large ({file.size} bytes); limit is {limit.max_bytes // MB} MB")
+
+    head = await file.read(HEADER_BYTES)
+    check_header(head, limit)
+
+    if file.size is not None:
+        # Size already bounded: one exact-size read from the spooled file
+        await file.seek(0)
+        return await file.read()
+
+    chunks = [head]
+    total = len(head)
+    while True:
+        chunk = await file.read(CHUNK_BYTES)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > limit.max_bytes:
+            raise UploadRejected(f"File too large; limit is {limit.max_bytes // MB} MB")
+        chunks.append(chunk)
+    return b"".join(chunks)
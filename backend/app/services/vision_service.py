@@ -1,10 +1,15 @@
 import os
-import json
-import re
-import base64
+import asyncio
 import google.generativeai as genai
-from PIL import Image
-import io
+import time
+
+from typing import Any, AsyncIterator, Optional, Tuple
+
+from .json_stream import IncrementalJSONParser
+from .llm_client import llm_client, LLMError
+from .report_image import (PreparedImage, prepare_report_image, passthrough_image,
+                           report_image_stats, REPORT_IMAGE_PREPROCESS)
+from .report_dedup import DedupMatch, ReportFingerprint, report_dedup, report_fingerprint, REPORT_DEDUP
 
 class VisionService:
     def __init__(self):
@@ -17,8 +22,11 @@ class VisionService:
         else:
             print("⚠️ Vision Service: No Gemini API Key found")
     
-    async def analyze_medical_report(self, image_bytes: bytes, language: str = "en") -> dict:
+    async def analyze_medical_report(self, image_bytes: bytes, language: str = "en", scope: str = "") -> dict:
         """
+        ``scope`` (patient or session id) limits which earlier uploads a retake
+        may reuse the analysis of; with no scope the upload isn't deduplicated.
+
         FAST APPROACH: Use Gemini 2.5 Flash directly for vision + analysis
         Gemini 2.5 Flash is multimodal - it can see images AND analyze them!
         No more slow Ollama llava needed!
@@ -27,17 +35,46 @@ class VisionService:
         try:
             print("📸 Analyzing image with Gemini 2.5 Flash (fast multimodal)...")
             
-            # Convert image bytes to PIL Image for Gemini
-            pil_image = Image.open(io.BytesIO(image_bytes))
+            prompt = self._report_prompt(language)
+            image = await self._prepare_image(image_bytes)
+            fp, match = await self._find_duplicate(image, language, scope)
+            if match is not None and match.result is not None:
+                return self._duplicate_report(match, image)
+
+            started = time.perf_counter()
+            if self.api_key and "gemini" in llm_client.providers and llm_client.available:
+                # Non-blocking REST call; the upload bytes go over as inline data
+                text = await llm_client.generate(prompt, images=[(image.data, image.mime_type)], provider="gemini")
+            else:
+                # SDK fallback runs off the event loop
+                response = await asyncio.to_thread(self.model.generate_content, [prompt, image.pil()])
+                text = response.text
+            self._record_latency(image, started)
+            
+            print(f"✅ Gemini vision response received ({len(text)} chars)")
+            result, complete = self._parse_report_json(text)
+            result["preprocessing"] = image.stats
+            if complete:
+                await self._store_report(fp, language, result, match, scope)
             
-            language_names = {
-                "en": "English", "hi": "Hindi", "te": "Telugu",
-                "ta": "Tamil", "kn": "Kannada", "ml": "Malayalam"
-            }
-            lang_name = language_names.get(language, "English")
+            print(f"✅ Analysis complete! Report: {result.get('report_type')}, Severity: {result.get('severity')}/10")
+            return result
             
-            # Single prompt: Gemini sees the image AND analyzes it
-            prompt = f"""You are a village doctor (Vaidya) in India helping rural patients understand medical reports.
+        except Exception as e:
+            error_msg = str(e)
+            print(f"❌ Vision analysis error: {error_msg}")
+            return self._error_result(error_msg)
+
+    @staticmethod
+    def _report_prompt(language: str) -> str:
+        language_names = {
+            "en": "English", "hi": "Hindi", "te": "Telugu",
+            "ta": "Tamil", "kn": "Kannada", "ml": "Malayalam"
+        }
+        lang_name = language_names.get(language, "English")
+        
+        # Single prompt: Gemini sees the image AND analyzes it
+        prompt = f"""You are a village doctor (Vaidya) in India helping rural patients understand medical reports.
 
 Look at this medical report/image carefully and analyze it:
 
@@ -61,58 +98,158 @@ Return ONLY valid JSON (no markdown, no code blocks):
     "avoid_foods": ["food 1", "food 2", "food 3"],
     "action_needed": "what patient should do next"
 }}"""
+        return prompt
 
-            # Send image + prompt to Gemini (multimodal call)
-            response = self.model.generate_content([prompt, pil_image])
-            text = response.text
-            
-            print(f"✅ Gemini vision response received ({len(text)} chars)")
-            
-            # Parse JSON from response
-            # Try extracting from code blocks first
-            json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', text, re.DOTALL)
-            if json_match:
-                result = json.loads(json_match.group(1))
-            else:
-                # Try parsing the whole response as JSON
-                # Clean up any leading/trailing non-JSON content
-                text_clean = text.strip()
-                if text_clean.startswith('{'):
-                    result = json.loads(text_clean)
-                else:
-                    # Find JSON object in text
-                    json_start = text_clean.find('{')
-                    json_end = text_clean.rfind('}') + 1
-                    if json_start >= 0 and json_end > json_start:
-                        result = json.loads(text_clean[json_start:json_end])
-                    else:
-                        # Fallback: create structured response from text
-                        result = {
-                            "report_type": "Medical Report",
-                            "key_findings": [text[:200]],
-                            "severity": 5,
-                            "severity_analogy": "Needs doctor review",
-                            "explanation": text[:500],
-                            "eat_foods": ["bajra roti", "palak", "dahi", "moong dal"],
-                            "avoid_foods": ["chawal", "mithai", "tel"],
-                            "action_needed": "Consult doctor"
-                        }
-            
-            print(f"✅ Analysis complete! Report: {result.get('report_type')}, Severity: {result.get('severity')}/10")
-            return result
-            
+    async def stream_medical_report(self, image_bytes: bytes, language: str = "en",
+                                    scope: str = "") -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming analyze_medical_report: ("finding", text) for each key_findings
+        item as soon as the model closes it, then ("report", full result).
+        Without the async Gemini client the whole analysis arrives at once.
+        """
+        if not (self.api_key and "gemini" in llm_client.providers and llm_client.available):
+            result = await self.analyze_medical_report(image_bytes, language, scope)
+            for finding in result.get("key_findings", []):
+                yield "finding", finding
+            yield "report", result
+            return
+
+        print("📸 Streaming image analysis with Gemini 2.5 Flash...")
+        parser = IncrementalJSONParser(watch=[("key_findings", "*")], start="{")
+        parts = []
+        image = await self._prepare_image(image_bytes)
+        fp, match = await self._find_duplicate(image, language, scope)
+        if match is not None and match.result is not None:
+            result = self._duplicate_report(match, image)
+            for finding in result.get("key_findings", []):
+                yield "finding", finding
+            yield "report", result
+            return
+        complete = True
+        started = time.perf_counter()
+        try:
+            async for chunk in llm_client.stream(self._report_prompt(language), images=[(image.data, image.mime_type)],
+                                                 provider="gemini"):
+                parts.append(chunk)
+                for _, finding in parser.feed(chunk):
+                    if isinstance(finding, str):
+                        yield "finding", finding
+            parser.finish()
+        except LLMError as e:
+            print(f"❌ Vision analysis error: {str(e)}")
+            if parser.result is None:
+                yield "report", self._error_result(str(e))
+                return
+            complete = False
+        self._record_latency(image, started)
+        # A reply cut off mid-object still keeps every field that closed
+        result = {**self._complete_report(parser.result, "".join(parts)), "preprocessing": image.stats}
+        # Only a fully parsed analysis is worth handing to retakes
+        if complete and self._parsed_object(parser):
+            await self._store_report(fp, language, result, match, scope)
+        yield "report", result
+
+    @staticmethod
+    async def _prepare_image(image_bytes: bytes) -> PreparedImage:
+        """The upload shrunk for the model (off the event loop), with its byte and timing stats."""
+        if not REPORT_IMAGE_PREPROCESS:
+            return passthrough_image(image_bytes)
+        image = await asyncio.to_thread(prepare_report_image, image_bytes)
+        s = image.stats
+        if s["preprocessed"]:
+            print(f"🗜️ Report image: {s['original_bytes'] // 1024} KB → {s['bytes'] // 1024} KB "
+                  f"({s.get('original_size')} → {s.get('size')}, gray={s.get('grayscale')}, "
+                  f"cropped={s.get('cropped')}) in {s['preprocess_ms']:.0f} ms")
+        return image
+
+    @staticmethod
+    async def _find_duplicate(image: PreparedImage, language: str, scope: str
+                              ) -> Tuple[Optional[ReportFingerprint], Optional[DedupMatch]]:
+        """Fingerprint of the prepared image and its verified near-duplicate, if one was analyzed before."""
+        if not REPORT_DEDUP or not scope:
+            return None, None
+
+        def lookup():
+            fp = report_fingerprint(image.pil())
+            return fp, report_dedup.find(fp, language, scope)
+
+        try:
+            return await asyncio.to_thread(lookup)
         except Exception as e:
-            error_msg = str(e)
-            print(f"❌ Vision analysis error: {error_msg}")
-            
-            # If Gemini multimodal fails, return helpful error
-            return {
-                "report_type": "Analysis Error",
-                "key_findings": [f"Could not analyze: {error_msg[:100]}"],
-                "severity": 0,
-                "severity_analogy": "Analysis could not be completed",
-                "explanation": f"Image analysis failed. Please try again or describe your report manually. Error: {error_msg[:200]}",
-                "eat_foods": ["bajra roti", "palak sabzi", "dahi", "moong dal"],
-                "avoid_foods": ["processed food", "excessive sugar", "fried items"],
-                "action_needed": "Please try uploading again or consult a doctor directly"
-            }
+            print(f"⚠️ Report dedup lookup failed: {e}")
+            return None, None
+
+    @staticmethod
+    def _duplicate_report(match: DedupMatch, image: PreparedImage) -> dict:
+        print(f"♻️ Report retake matched {match.entry_id} (worst block {match.block_ink} ink px, "
+              f"overlap {match.overlap}) - reusing analysis")
+        dedup = {"hit": True, "entry": match.entry_id, "block_ink": match.block_ink, "overlap": match.overlap}
+        return {**match.result, "preprocessing": image.stats, "dedup": dedup}
+
+    @staticmethod
+    async def _store_report(fp: Optional[ReportFingerprint], language: str, result: dict,
+                            match: Optional[DedupMatch], scope: str) -> None:
+        if fp is None:
+            return
+        try:
+            entry_id = await asyncio.to_thread(report_dedup.store, fp, language, result, match, scope)
+            result["dedup"] = {"hit": False, "entry": entry_id}
+        except Exception as e:
+            print(f"⚠️ Report dedup store failed: {e}")
+
+    @staticmethod
+    def _record_latency(image: PreparedImage, started: float) -> None:
+        image.stats["model_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        image.stats["total_ms"] = round(image.stats["preprocess_ms"] + image.stats["model_ms"], 1)
+        report_image_stats.record(image.stats)
+
+    @classmethod
+    def _complete_report(cls, parsed: Any, text: str) -> dict:
+        """Parsed reply with any fields a truncated reply never reached filled in."""
+        if not isinstance(parsed, dict) or not parsed:
+            return cls._text_report(text)
+        return {**cls._text_report(""), "key_findings": [], **parsed}
+
+    @staticmethod
+    def _error_result(error_msg: str) -> dict:
+        # If Gemini multimodal fails, return helpful error
+        return {
+            "report_type": "Analysis Error",
+            "key_findings": [f"Could not analyze: {error_msg[:100]}"],
+            "severity": 0,
+            "severity_analogy": "Analysis could not be completed",
+            "explanation": f"Image analysis failed. Please try again or describe your report manually. Error: {error_msg[:200]}",
+            "eat_foods": ["bajra roti", "palak sabzi", "dahi", "moong dal"],
+            "avoid_foods": ["processed food", "excessive sugar", "fried items"],
+            "action_needed": "Please try uploading again or consult a doctor directly"
+        }
+
+    @classmethod
+    def _parse_report_json(cls, text: str) -> Tuple[dict, bool]:
+        """
+        The JSON object pulled out of the model reply (bare, fenced, embedded in
+        prose or cut off), and whether the reply held a complete object.
+        """
+        parser = IncrementalJSONParser(start="{")
+        parser.feed(text)
+        parser.finish()
+        return cls._complete_report(parser.result, text), cls._parsed_object(parser)
+
+    @staticmethod
+    def _parsed_object(parser: IncrementalJSONParser) -> bool:
+        """The reply closed a non-empty JSON object (not prose, not cut off)."""
+        return parser.done and isinstance(parser.result, dict) and bool(parser.result)
+
+    @staticmethod
+    def _text_report(text: str) -> dict:
+        # Fallback: create structured response from text
+        return {
+            "report_type": "Medical Report",
+            "key_findings": [text[:200]],
+            "severity": 5,
+            "severity_analogy": "Needs doctor review",
+            "explanation": text[:500],
+            "eat_foods": ["bajra roti", "palak", "dahi", "moong dal"],
+            "avoid_foods": ["chawal", "mithai", "tel"],
+            "action_needed": "Consult doctor"
+        }
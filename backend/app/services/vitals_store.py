@@ -0,0 +1,310 @@
+"""
+Vitals Store — compact per-patient time series for glucose, heart rate, BP,
+SpO2 and temperature.
+
+Each patient is an append-only array of (timestamp, 6 vitals) with NaN for
+unmeasured values, mirrored to a fixed-record binary file under
+VAULT_BASE/vitals so history survives restarts. Alongside the raw samples the
+store keeps, per vital:
+- prefix sums of count, t, v, t*t and t*v, so the moving average and the
+  least-squares slope over the last k readings are O(1)
+- an exponentially weighted mean/variance, so each new reading is scored as a
+  spike against the patient's own baseline in O(1)
+- hourly and daily rollups (count/min/max/mean) updated as samples arrive
+
+At most VITALS_MAX_PATIENTS series stay in memory (least recently used are
+dropped and replayed from disk when the patient returns). Files are named by a
+hash of the patient id, so ids that differ only in punctuation ("PAT/1",
+"PAT_1") never share a history.
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+VAULT_BASE = os.getenv("VAULT_BASE", "./nexus_vault")
+VITALS_DIR = os.getenv("VITALS_DIR", f"{VAULT_BASE}/vitals")
+os.makedirs(VITALS_DIR, exist_ok=True)
+VITALS_MAX_PATIENTS = int(os.getenv("VITALS_MAX_PATIENTS", "1000"))
+
+VITALS = ("glucose", "heart_rate", "systolic", "diastolic", "spo2", "temperature")
+VITAL_INDEX = {name: i for i, name in enumerate(VITALS)}
+N_VITALS = len(VITALS)
+
+RECORD_DTYPE = np.dtype([("ts", "<f8"), ("v", "<f4", (N_VITALS,))])
+ROLLUPS = {"hourly": 3600, "daily": 86400}
+
+DEFAULT_WINDOW = 10
+EWMA_ALPHA = 0.2
+SPIKE_Z = 3.0
+MIN_BASELINE_SAMPLES = 3
+# Floor on the baseline std so a perfectly flat history doesn't flag tiny changes
+MIN_SPIKE_STD = {"glucose": 5.0, "heart_rate": 4.0, "systolic": 5.0, "diastolic": 4.0,
+                 "spo2": 1.0, "temperature": 0.2}
+
+# Filenames before hashing: ids made only of these characters were stored as-is
+_SAFE_ID = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def fahrenheit_to_celsius(temp: Optional[float]) -> Optional[float]:
+    """Temperatures above 45 are taken to be Fahrenheit (the diagnose form default is 98.6)."""
+    if temp is None or temp <= 45:
+        return temp
+    return round((temp - 32) * 5 / 9, 2)
+
+
+class _Rollup:
+    """Fixed-width time buckets with count/min/max/sum per vital."""
+
+    def __init__(self, width: int):
+        self.width = width
+        self.starts: List[int] = []
+        self.count = np.zeros((0, N_VITALS), dtype=np.int32)
+        self.sum = np.zeros((0, N_VITALS))
+        self.min = np.zeros((0, N_VITALS))
+        self.max = np.zeros((0, N_VITALS))
+
+    def add(self, ts: float, v: np.ndarray) -> None:
+        start = int(ts // self.width) * self.width
+        if not self.starts or self.starts[-1] != start:
+            self.starts.append(start)
+            self.count = np.vstack([self.count, np.zeros(N_VITALS, dtype=np.int32)])
+            self.sum = np.vstack([self.sum, np.zeros(N_VITALS)])
+            self.min = np.vstack([self.min, np.full(N_VITALS, np.inf)])
+            self.max = np.vstack([self.max, np.full(N_VITALS, -np.inf)])
+        seen = ~np.isnan(v)
+        self.count[-1, seen] += 1
+        self.sum[-1, seen] += v[seen]
+        self.min[-1, seen] = np.minimum(self.min[-1, seen], v[seen])
+        self.max[-1, seen] = np.maximum(self.max[-1, seen], v[seen])
+
+    def to_dict(self, limit: int) -> List[Dict[str, Any]]:
+        out = []
+        for k in range(max(0, len(self.starts) - limit), len(self.starts)):
+            row = {"start": self.starts[k]}
+            for j, name in enumerate(VITALS):
+                c = int(self.count[k, j])
+                if c:
+                    row[name] = {"count": c, "mean": round(self.sum[k, j] / c, 2),
+                                 "min": round(float(self.min[k, j]), 2), "max": round(float(self.max[k, j]), 2)}
+            out.append(row)
+        return out
+
+
+class PatientSeries:
+    """Append-only array-backed series for one patient."""
+
+    def __init__(self, capacity: int = 16):
+        self.n = 0
+        self.t0: Optional[float] = None
+        self.ts = np.empty(capacity)
+        self.values = np.empty((capacity, N_VITALS), dtype=np.float32)
+        # Prefix sums over valid readings; row i covers samples [0, i)
+        self._cnt = np.zeros((capacity + 1, N_VITALS), dtype=np.int64)
+        self._st = np.zeros((capacity + 1, N_VITALS))
+        self._sv = np.zeros((capacity + 1, N_VITALS))
+        self._stt = np.zeros((capacity + 1, N_VITALS))
+        self._stv = np.zeros((capacity + 1, N_VITALS))
+        self.ewma = np.full(N_VITALS, np.nan)
+        self.ewvar = np.zeros(N_VITALS)
+        self.last_spike: Dict[str, Dict[str, float]] = {}  # vital -> most recent spike
+        self.rollups = {name: _Rollup(width) for name, width in ROLLUPS.items()}
+
+    def _grow(self) -> None:
+        cap = len(self.ts) * 2
+        self.ts = np.resize(self.ts, cap)
+        self.values = np.resize(self.values, (cap, N_VITALS))
+        for attr in ("_cnt", "_st", "_sv", "_stt", "_stv"):
+            old = getattr(self, attr)
+            new = np.zeros((cap + 1, N_VITALS), dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, attr, new)
+
+    def append(self, ts: float, v: np.ndarray) -> Dict[str, Dict[str, float]]:
+        """Add one reading; returns the vitals that spiked against the running baseline."""
+        if self.n and ts < self.ts[self.n - 1]:
+            ts = float(self.ts[self.n - 1])  # keep the series monotonic
+        if self.n == len(self.ts):
+            self._grow()
+        if self.t0 is None:
+            self.t0 = ts
+        i = self.n
+        self.ts[i] = ts
+        self.values[i] = v
+
+        seen = ~np.isnan(v)
+        vv = np.where(seen, v, 0.0).astype(np.float64)
+        th = (ts - self.t0) / 3600.0  # hours since first reading keeps t*t well conditioned
+        self._cnt[i + 1] = self._cnt[i] + seen
+        self._st[i + 1] = self._st[i] + seen * th
+        self._sv[i + 1] = self._sv[i] + vv
+        self._stt[i + 1] = self._stt[i] + seen * th * th
+        self._stv[i + 1] = self._stv[i] + th * vv
+        self.n += 1
+
+        spikes = self._update_baseline(ts, vv, seen, self._cnt[i])
+        for rollup in self.rollups.values():
+            rollup.add(ts, v)
+        return spikes
+
+    def _update_baseline(self, ts: float, vv: np.ndarray, seen: np.ndarray,
+                         prior: np.ndarray) -> Dict[str, Dict[str, float]]:
+        spikes = {}
+        for j in np.flatnonzero(seen):
+            name = VITALS[j]
+            x = vv[j]
+            if np.isnan(self.ewma[j]):
+                self.ewma[j] = x
+                continue
+            diff = x - self.ewma[j]
+            std = max(np.sqrt(self.ewvar[j]), MIN_SPIKE_STD[name])
+            if prior[j] >= MIN_BASELINE_SAMPLES and abs(diff) > SPIKE_Z * std:
+                spikes[name] = {"value": round(float(x), 2), "baseline": round(float(self.ewma[j]), 2),
+                                "z": round(float(diff / std), 2), "at": ts}
+            # West's incremental EW mean/variance
+            incr = EWMA_ALPHA * diff
+            self.ewma[j] += incr
+            self.ewvar[j] = (1 - EWMA_ALPHA) * (self.ewvar[j] + diff * incr)
+        self.last_spike.update(spikes)
+        return spikes
+
+    def _window_start(self, j: int, k: int) -> int:
+        """Sample index where the last k valid readings of vital j begin."""
+        total = self._cnt[self.n, j]
+        target = max(total - k, 0)
+        return int(np.searchsorted(self._cnt[:self.n + 1, j], target, side="right")) - 1
+
+    def trend(self, name: str, window: int = DEFAULT_WINDOW) -> Optional[Dict[str, Any]]:
+        """Latest value, moving average and slope (units/hour) over the last ``window`` readings."""
+        j = VITAL_INDEX[name]
+        if self._cnt[self.n, j] == 0:
+            return None
+        a, b = self._window_start(j, window), self.n
+        n = float(self._cnt[b, j] - self._cnt[a, j])
+        st = self._st[b, j] - self._st[a, j]
+        sv = self._sv[b, j] - self._sv[a, j]
+        stt = self._stt[b, j] - self._stt[a, j]
+        stv = self._stv[b, j] - self._stv[a, j]
+        denom = n * stt - st * st
+        slope = (n * stv - st * sv) / denom if n >= 2 and denom > 1e-12 else 0.0
+
+        col = self.values[:self.n, j]
+        last = int(np.flatnonzero(~np.isnan(col))[-1])
+        spike = self.last_spike.get(name)
+        return {
+            "latest": round(float(col[last]), 2),
+            "latest_at": float(self.ts[last]),
+            "moving_average": round(float(sv / n), 2),
+            "slope_per_hour": round(float(slope), 3),
+            "samples": int(n),
+            "baseline": round(float(self.ewma[j]), 2),
+            "spike": spike if spike and spike["at"] == self.ts[last] else None,
+        }
+
+    def last_value(self, name: str) -> Optional[float]:
+        j = VITAL_INDEX[name]
+        col = self.values[:self.n, j]
+        idx = np.flatnonzero(~np.isnan(col))
+        return float(col[idx[-1]]) if len(idx) else None
+
+
+class VitalsStore:
+    def __init__(self, directory: str = VITALS_DIR, max_patients: int = VITALS_MAX_PATIENTS):
+        self.directory = directory
+        self.max_patients = max_patients
+        self._lock = threading.Lock()
+        self._series: "OrderedDict[str, PatientSeries]" = OrderedDict()
+
+    def _path(self, patient_id: str) -> str:
+        """Caller holds the lock."""
+        name = hashlib.blake2b(patient_id.encode("utf-8"), digest_size=16).hexdigest()
+        path = os.path.join(self.directory, name + ".vitals")
+        if not _SAFE_ID.search(patient_id) and not os.path.exists(path):
+            # History written under the old sanitized name; other ids could only have mapped to
+            # it through sanitizing, so it is adopted just by the id it spells exactly
+            legacy = os.path.join(self.directory, patient_id + ".vitals")
+            if os.path.exists(legacy):
+                os.replace(legacy, path)
+        return path
+
+    def _load(self, patient_id: str) -> PatientSeries:
+        """Series from memory, replaying the on-disk log the first time a patient is seen."""
+        series = self._series.get(patient_id)
+        if series is not None:
+            self._series.move_to_end(patient_id)
+            return series
+        series = PatientSeries()
+        path = self._path(patient_id)
+        if os.path.exists(path):
+            records = np.fromfile(path, dtype=RECORD_DTYPE)
+            for rec in records:
+                series.append(float(rec["ts"]), rec["v"].astype(np.float32))
+        self._series[patient_id] = series
+        while len(self._series) > self.max_patients:
+            self._series.popitem(last=False)
+        return series
+
+    def record(self, patient_id: str, ts: Optional[float] = None, **vitals: Optional[float]) -> Dict[str, Any]:
+        """Append one reading (any subset of VITALS); returns any spikes it triggered."""
+        unknown = set(vitals) - set(VITALS)
+        if unknown:
+            raise ValueError(f"Unknown vital(s): {', '.join(sorted(unknown))}")
+        v = np.full(N_VITALS, np.nan, dtype=np.float32)
+        for name, value in vitals.items():
+            if value is not None:
+                v[VITAL_INDEX[name]] = value
+        if np.isnan(v).all():
+            return {}
+        ts = time.time() if ts is None else ts
+
+        rec = np.zeros(1, dtype=RECORD_DTYPE)
+        rec["ts"] = ts
+        rec["v"] = v
+        with self._lock:
+            series = self._load(patient_id)
+            spikes = series.append(ts, v)
+            with open(self._path(patient_id), "ab") as f:
+                f.write(rec.tobytes())
+        if spikes:
+            logger.info(f"Vitals spike for {patient_id}: {spikes}")
+        return spikes
+
+    def last_value(self, patient_id: str, name: str) -> Optional[float]:
+        with self._lock:
+            if patient_id not in self._series and not os.path.exists(self._path(patient_id)):
+                return None
+            return self._load(patient_id).last_value(name)
+
+    def trends(self, patient_id: str, window: int = DEFAULT_WINDOW) -> Dict[str, Any]:
+        with self._lock:
+            if patient_id not in self._series and not os.path.exists(self._path(patient_id)):
+                return {}
+            series = self._load(patient_id)
+            return {name: t for name in VITALS if (t := series.trend(name, window)) is not None}
+
+    def summary(self, patient_id: str, window: int = DEFAULT_WINDOW, rollup: str = "hourly",
+                limit: int = 48) -> Dict[str, Any]:
+        with self._lock:
+            if patient_id not in self._series and not os.path.exists(self._path(patient_id)):
+                return {"patient_id": patient_id, "samples": 0, "trends": {}, "rollup": rollup, "buckets": []}
+            series = self._load(patient_id)
+            return {
+                "patient_id": patient_id,
+                "samples": series.n,
+                "first_at": float(series.ts[0]),
+                "last_at": float(series.ts[series.n - 1]),
+                "trends": {name: t for name in VITALS if (t := series.trend(name, window)) is not None},
+                "rollup": rollup,
+                "buckets": series.rollups[rollup].to_dict(limit),
+            }
+
+
+# Singleton instance
+vitals_store = VitalsStore()
@@ -0,0 +1,59 @@
+"""
+X-ray Gradient Service — memory-bounded Sobel profile for large radiographs.
+Computes the vertical-gradient row profile in horizontal strips so a 4k x 4k
+film never materialises more than one float32 strip at a time.
+"""
+import os
+import numpy as np
+from typing import Optional, Tuple
+from scipy.ndimage import sobel
+
+# Rows per strip; 0 disables tiling and processes the whole image at once
+XRAY_STRIP_ROWS = int(os.getenv("XRAY_STRIP_ROWS", "512"))
+
+
+def _sobel_dy_slab(img_array: np.ndarray, start: int, stop: int) -> np.ndarray:
+    """
+    Vertical Sobel response for rows [start, stop) as float32.
+    Pulls one halo row on each side so strip seams match a full-image pass,
+    and falls back to scipy's reflect mode at the true image borders.
+    """
+    height = img_array.shape[0]
+    lo = max(start - 1, 0)
+    hi = min(stop + 1, height)
+    slab = sobel(img_array[lo:hi], axis=0, output=np.float32)
+    return slab[start - lo:slab.shape[0] - (hi - stop)]
+
+
+def row_gradient_profile(img_array: np.ndarray, strip_rows: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stream the image in strips and return (row_grad, col_mean).
+
+    row_grad is the per-row mean |dy| normalised to [0, 1]; col_mean is the
+    per-column brightness used to locate the bone axis.
+    """
+    if strip_rows is None:
+        strip_rows = XRAY_STRIP_ROWS
+    height, width = img_array.shape
+    step = strip_rows if strip_rows > 0 else height
+
+    row_grad = np.empty(height, dtype=np.float32)
+    col_sum = np.zeros(width, dtype=np.float64)
+
+    for start in range(0, height, step):
+        stop = min(start + step, height)
+        dy = _sobel_dy_slab(img_array, start, stop)
+        np.abs(dy, out=dy)
+        row_grad[start:stop] = dy.mean(axis=1)
+        col_sum += img_array[start:stop].sum(axis=0, dtype=np.float64)
+        del dy
+
+    peak = float(row_grad.max()) if height else 0.0
+    if peak > 0:
+        row_grad /= peak
+    return row_grad, col_sum / max(height, 1)
+
+
+def sobel_dy_row(img_array: np.ndarray, row: int) -> np.ndarray:
+    """|dy| for a single row, recomputed from a 3-row window."""
+    return np.abs(_sobel_dy_slab(img_array, row, row + 1)[0])
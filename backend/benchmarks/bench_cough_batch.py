@@ -0,0 +1,63 @@
+"""
+Benchmark: batch cough analysis throughput.
+
+Compares analysing N synthetic clips one at a time (StreamingCoughAnalyzer, as
+/api/cough-analyzer does) against the single vectorised pass used by
+/api/cough-analyzer/batch. Reports clips/s and seconds of audio per second.
+
+Run from backend/:  python -m benchmarks.bench_cough_batch
+"""
+import time
+import numpy as np
+
+from app.services import cough_service
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_clips(n: int, seed: int = 0):
+    """Noise floor plus decaying noise bursts, 1-5 s long."""
+    rng = np.random.default_rng(seed)
+    clips = []
+    for _ in range(n):
+        length = int(SAMPLE_RATE * rng.uniform(1.0, 5.0))
+        t = np.arange(length) / SAMPLE_RATE
+        x = 0.005 * rng.standard_normal(length)
+        for start in rng.uniform(0, t[-1], size=rng.integers(1, 5)):
+            m = (t >= start) & (t < start + 0.25)
+            x[m] += rng.uniform(0.2, 0.9) * rng.standard_normal(m.sum()) * np.exp(-(t[m] - start) * 12)
+        clips.append(np.clip(x, -1, 1).astype(np.float32))
+    return clips
+
+
+def per_clip(clips):
+    rows = [cough_service.StreamingCoughAnalyzer(SAMPLE_RATE).analyze(c) for c in clips]
+    return [cough_service.classify_cough(r["rms_energy"], r["zero_crossing_rate"]) for r in rows]
+
+
+def batched(clips):
+    features = cough_service.batch_features(clips, SAMPLE_RATE)
+    return cough_service.classify_cough_batch(features["rms_energy"], features["zero_crossing_rate"])
+
+
+def best_of(fn, clips, repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(clips)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    for n in (8, 32, 100):
+        clips = synthetic_clips(n)
+        audio_s = sum(len(c) for c in clips) / SAMPLE_RATE
+        print(f"\n── {n} clips, {audio_s:.1f} s of audio ──")
+        for label, fn in (("per-clip", per_clip), ("batched", batched)):
+            elapsed = best_of(fn, clips)
+            print(f"{label:>10}: {elapsed * 1000:8.1f} ms   {n / elapsed:8.0f} clips/s   {audio_s / elapsed:8.0f}x realtime")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark: concurrent LLM calls through the async client against a local stub.
+
+Starts a minimal keep-alive HTTP server that answers Gemini generateContent
+and OpenAI chat/completions after a fixed delay, points the client at it,
+and fires N concurrent requests. With the semaphore at S, wall time should
+be about ceil(N / S) * delay, and the connection count should stay near S.
+
+Run from backend/:  python -m benchmarks.bench_llm_concurrency
+"""
+import os
+import json
+import time
+import asyncio
+
+STUB_DELAY = 0.5
+CONNECTIONS = {"opened": 0}
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    CONNECTIONS["opened"] += 1
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            path = lines[0].split(" ")[1]
+            length = 0
+            for line in lines[1:]:
+                if line.lower().startswith("content-length:"):
+                    length = int(line.split(":", 1)[1])
+            await reader.readexactly(length)
+            await asyncio.sleep(STUB_DELAY)
+            if "chat/completions" in path:
+                payload = {"choices": [{"message": {"content": '{"explanation": "stub"}'}}]}
+            else:
+                payload = {"candidates": [{"content": {"parts": [{"text": '{"explanation": "stub"}'}]}}]}
+            body = json.dumps(payload).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main():
+    server = await asyncio.start_server(_handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    os.environ["GEMINI_API_KEY"] = "stub"
+    os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("GEMINI_MAX_CONCURRENCY", "64")
+
+    from app.services.llm_client import AsyncLLMClient
+    client = AsyncLLMClient()
+    limit = client.providers["gemini"].max_concurrency
+
+    for n in (64, 256, 512):
+        CONNECTIONS["opened"] = 0
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(client.generate(f"prompt {i}") for i in range(n)), return_exceptions=True)
+        elapsed = time.perf_counter() - t0
+        failed = sum(isinstance(r, Exception) for r in results)
+        ideal = -(-n // limit) * STUB_DELAY
+        print(f"{n:>4} calls, limit {limit}: {elapsed:5.2f} s (ideal {ideal:.2f} s)  "
+              f"new connections {CONNECTIONS['opened']:>3}  failed {failed}")
+
+    await client.aclose()
+    server.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
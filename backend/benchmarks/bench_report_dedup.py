@@ -0,0 +1,145 @@
+"""
+Benchmark: report dedup recall and false matches.
+
+Renders a printed lab report lying on a table, photographs it once as the
+stored upload, then again as realistic retakes (shift, zoom, small rotation,
+perspective tilt, exposure, uneven lighting, blur, new sensor noise) and as
+different reports on the same template (one digit changed, digits swapped,
+several values changed, another test). Every photo goes through
+prepare_report_image and report_fingerprint like an upload; each pair is
+compared with the dedup gates. Prints per case the worst block's mismatched
+ink pixels, the overlap and the verdict, then retake recall, false matches
+and the fingerprint / comparison times.
+
+Run from backend/:  python -m benchmarks.bench_report_dedup
+"""
+import io
+import time
+import statistics
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from app.services.report_dedup import (compare_ink, report_fingerprint, REPORT_DEDUP_MAX_BLOCK_INK,
+                                       REPORT_DEDUP_MIN_OVERLAP)
+from app.services.report_image import prepare_report_image
+from benchmarks.bench_report_image import LINES
+
+WIDTH, HEIGHT = 2400, 1800
+# ~14 px capital height after preprocessing, like 10 pt print in a phone photo
+FONT_SIZE = 24
+
+RETAKES = {
+    "same shot, new noise": {},
+    "shift 30 px": dict(dx=30, dy=20),
+    "zoom 1%": dict(zoom=1.01),
+    "zoom 5%": dict(zoom=1.05),
+    "zoom out 3%": dict(zoom=0.97),
+    "rotate 0.2°": dict(angle=0.2),
+    "rotate 0.5°": dict(angle=0.5),
+    "rotate 2°": dict(angle=2.0),
+    "tilt 1%": dict(tilt=0.01),
+    "tilt 3%": dict(tilt=0.03),
+    "exposure -20%": dict(gain=0.8),
+    "exposure -40%": dict(gain=0.6),
+    "shade 30%": dict(shade=0.3),
+    "blur σ1": dict(blur=1.0),
+    "blur σ1.5 + rotate": dict(blur=1.5, angle=0.3),
+    "combined": dict(angle=-0.8, zoom=0.97, dx=-40, dy=30, gain=1.15, tilt=0.01),
+}
+
+
+def _changed(line: int, text: str):
+    return {line: text}
+
+
+DIFFERENT = {
+    "one digit (182 → 183)": _changed(1, "FASTING BLOOD SUGAR    183 mg/dL    (70 - 100)      HIGH"),
+    "digits swapped (182 → 128)": _changed(1, "FASTING BLOOD SUGAR    128 mg/dL    (70 - 100)      HIGH"),
+    "one digit (8.4 → 3.4)": _changed(2, LINES[2].replace("8.4", "3.4")),
+    # Differs by one short stroke: too close to tell apart, which is why matches are scoped
+    "one digit (8.4 → 6.4)": _changed(2, LINES[2].replace("8.4", "6.4")),
+    "value 182 → 96": _changed(1, "FASTING BLOOD SUGAR    96 mg/dL     (70 - 100)      HIGH"),
+    "three values": {0: "HAEMOGLOBIN            11.8 g/dL    (13.0 - 17.0)   LOW",
+                     1: "FASTING BLOOD SUGAR    104 mg/dL    (70 - 100)      HIGH",
+                     2: "HbA1c                  6.1 %        (< 5.7)         HIGH"},
+    "another test": {i: line for i, line in enumerate(
+        ["LIPID PROFILE", "TRIGLYCERIDES          310 mg/dL    (< 150)         HIGH",
+         "HDL CHOLESTEROL        38 mg/dL     (> 40)          LOW", "LDL CHOLESTEROL        160 mg/dL    (< 100)",
+         "VLDL                   62 mg/dL     (< 30)"] * 8)},
+}
+
+
+def scene(changes=None) -> np.ndarray:
+    """A report page on a wooden table; ``changes`` replaces lines by index."""
+    font = ImageFont.load_default(size=FONT_SIZE)
+    table = Image.new("RGB", (WIDTH, HEIGHT), (120, 84, 52))
+    page = (int(WIDTH * 0.12), int(HEIGHT * 0.08), int(WIDTH * 0.88), int(HEIGHT * 0.94))
+    draw = ImageDraw.Draw(table)
+    draw.rectangle(page, fill=(244, 242, 236))
+    step = (page[3] - page[1]) // 40
+    for i in range(36):
+        text = (changes or {}).get(i, LINES[i % len(LINES)])
+        draw.text((page[0] + step, page[1] + step * (i + 2)), text, fill=(20, 20, 20), font=font)
+    return np.asarray(table)
+
+
+def photo(world: np.ndarray, angle=0.0, zoom=1.0, dx=0, dy=0, tilt=0.0, gain=1.0, shade=0.0, blur=0.0,
+          seed=1) -> bytes:
+    """JPEG of ``world`` as a phone would take it with the given camera pose and lighting."""
+    m = cv2.getRotationMatrix2D((WIDTH / 2, HEIGHT / 2), angle, zoom)
+    m[0, 2] += dx
+    m[1, 2] += dy
+    img = cv2.warpAffine(world, m, (WIDTH, HEIGHT), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    if tilt:
+        corners = np.float32([[0, 0], [WIDTH, 0], [WIDTH, HEIGHT], [0, HEIGHT]])
+        tilted = np.float32([[WIDTH * tilt, 0], [WIDTH * (1 - tilt), 0], [WIDTH, HEIGHT], [0, HEIGHT]])
+        img = cv2.warpPerspective(img, cv2.getPerspectiveTransform(corners, tilted), (WIDTH, HEIGHT),
+                                  borderMode=cv2.BORDER_REPLICATE)
+    img = img.astype(np.float32) * gain
+    if shade:
+        img *= (1 - shade * np.linspace(0, 1, WIDTH, dtype=np.float32))[None, :, None]
+    if blur:
+        img = cv2.GaussianBlur(img, (0, 0), blur)
+    img += np.random.default_rng(seed).normal(0, 4, img.shape)
+    out = io.BytesIO()
+    Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(out, format="JPEG", quality=92)
+    return out.getvalue()
+
+
+def fingerprint(data: bytes):
+    return report_fingerprint(prepare_report_image(data).pil())
+
+
+def main():
+    t0 = time.perf_counter()
+    stored = fingerprint(photo(scene(), seed=0))
+    fp_ms = (time.perf_counter() - t0) * 1000
+    compare_ms = []
+
+    def verdict(fp):
+        t = time.perf_counter()
+        block_ink, overlap = compare_ink(fp.ink, stored.ink)
+        compare_ms.append((time.perf_counter() - t) * 1000)
+        match = 0 <= block_ink <= REPORT_DEDUP_MAX_BLOCK_INK and overlap >= REPORT_DEDUP_MIN_OVERLAP
+        return block_ink, overlap, match
+
+    print(f"{'case':<32} {'block ink':>9} {'overlap':>8}  verdict")
+    hits = 0
+    for label, pose in RETAKES.items():
+        block_ink, overlap, match = verdict(fingerprint(photo(scene(), **pose)))
+        hits += match
+        print(f"{'retake: ' + label:<32} {block_ink:>9} {overlap:>8.3f}  {'match' if match else 'MISS'}")
+    false_matches = 0
+    for label, changes in DIFFERENT.items():
+        block_ink, overlap, match = verdict(fingerprint(photo(scene(changes))))
+        false_matches += match
+        print(f"{'other: ' + label:<32} {block_ink:>9} {overlap:>8.3f}  {'FALSE MATCH' if match else 'rejected'}")
+    print(f"retake recall {hits}/{len(RETAKES)}, false matches {false_matches}/{len(DIFFERENT)} "
+          f"(max block ink {REPORT_DEDUP_MAX_BLOCK_INK}, min overlap {REPORT_DEDUP_MIN_OVERLAP})")
+    print(f"preprocess + fingerprint {fp_ms:.0f} ms, comparison median {statistics.median(compare_ms):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: report image preprocessing before Gemini vision.
+
+Renders synthetic phone photos of a printed lab report (page on a wooden
+table, slight noise, high-quality JPEG as phones save them) at 8 and 12
+megapixels, plus a colour photo that must keep its colour. For each: bytes
+before/after, preprocessing time, and the net end-to-end latency change at
+a few uplink speeds (upload time saved minus preprocessing time).
+
+Run from backend/:  python -m benchmarks.bench_report_image
+"""
+import io
+import time
+import statistics
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.services.report_image import prepare_report_image
+
+REPEATS = 3
+UPLINKS_KBPS = (256, 1000, 10000)
+
+LINES = ["HAEMOGLOBIN            9.2 g/dL     (13.0 - 17.0)   LOW",
+         "FASTING BLOOD SUGAR    182 mg/dL    (70 - 100)      HIGH",
+         "HbA1c                  8.4 %        (< 5.7)         HIGH",
+         "TOTAL CHOLESTEROL      221 mg/dL    (< 200)",
+         "SERUM CREATININE       1.1 mg/dL    (0.7 - 1.3)"]
+
+
+def report_photo(width: int, height: int, colour: bool = False, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    table = Image.new("RGB", (width, height), (120, 84, 52))
+    page_box = (int(width * 0.12), int(height * 0.08), int(width * 0.88), int(height * 0.94))
+    draw = ImageDraw.Draw(table)
+    draw.rectangle(page_box, fill=(244, 242, 236))
+    step = (page_box[3] - page_box[1]) // 40
+    for i in range(36):
+        text = LINES[i % len(LINES)]
+        draw.text((page_box[0] + step, page_box[1] + step * (i + 2)), text, fill=(20, 20, 20))
+    if colour:
+        # A skin-toned patch covering most of the frame: colour must be kept
+        draw.ellipse((width * 0.2, height * 0.2, width * 0.8, height * 0.8), fill=(200, 120, 90))
+    pixels = np.asarray(table, dtype=np.int16) + rng.normal(0, 4, (height, width, 3)).astype(np.int16)
+    out = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+
+def main():
+    cases = [("8 MP report", report_photo(3264, 2448)),
+             ("12 MP report", report_photo(4032, 3024)),
+             ("12 MP colour photo", report_photo(4032, 3024, colour=True))]
+    header = "".join(f"  Δ@{k}kbps" for k in UPLINKS_KBPS)
+    print(f"{'case':<20} {'before':>9} {'after':>9} {'saved':>6} {'gray':>5} {'crop':>5} {'ms':>7}{header}")
+    for label, data in cases:
+        samples = []
+        for _ in range(REPEATS):
+            t0 = time.perf_counter()
+            prepared = prepare_report_image(data)
+            samples.append((time.perf_counter() - t0) * 1000)
+        ms = statistics.median(samples)
+        s = prepared.stats
+        deltas = "".join(f"  {ms - s['bytes_saved'] * 8 / kbps:9.0f}ms" for kbps in UPLINKS_KBPS)
+        print(f"{label:<20} {s['original_bytes'] / 1e6:8.2f}M {s['bytes'] / 1e6:8.2f}M "
+              f"{s['bytes_saved'] / s['original_bytes']:6.0%} {str(s.get('grayscale')):>5} "
+              f"{str(s.get('cropped')):>5} {ms:7.0f}{deltas}")
+    print("Δ = preprocessing time minus upload time saved (negative = faster end to end)")
+
+
+if __name__ == "__main__":
+    main()
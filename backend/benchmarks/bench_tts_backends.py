@@ -0,0 +1,97 @@
+"""
+Benchmark: per-character synthesis latency of each TTS backend.
+
+Synthesizes a short template sentence, a fallback farm story and a long
+multi-sentence text in English and Hindi with every installed backend
+(gTTS needs network, espeak-ng needs the binary), then the same texts from
+the audio cache: hot set, disk tier, and joined per-sentence clips. Prints
+median ms and ms/char per row, and the order the selector would now try the
+backends in for a short and a long text.
+
+Run from backend/:  python -m benchmarks.bench_tts_backends
+"""
+import os
+import time
+import shutil
+import tempfile
+import statistics
+
+REPEATS = 3
+
+TEXTS = {
+    "en": [
+        "Your condition requires immediate attention. Please visit a hospital now.",
+        "Bhai, your health needs attention like a crop needs water. The doctor says you have HIGH risk. "
+        "Take care of yourself like you take care of your field. Eat simple village food, walk daily, and rest well.",
+    ],
+    "hi": [
+        "आपकी स्थिति गंभीर लग रही है। कृपया तुरंत अस्पताल जाएं।",
+        "भाई, आपकी सेहत को ध्यान चाहिए जैसे फसल को पानी। डॉक्टर कहते हैं आपको HIGH खतरा है। "
+        "अपना ख्याल रखो जैसे खेत का। सादा गाँव का खाना खाओ, रोज चलो, आराम करो।",
+    ],
+}
+
+
+def _long(lang):
+    return " ".join(TEXTS[lang] * 4)
+
+
+def _time(fn, *args):
+    samples = []
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def _row(label, lang, text, ms):
+    print(f"{label:<22} {lang:<3} {len(text):>5} chars  {ms:10.3f} ms  {ms / len(text):8.4f} ms/char")
+
+
+def main():
+    os.environ["TTS_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-tts-")
+    from app.services.tts_cache import AudioCache, tts_cache_key
+    from app.services.tts_backends import split_sentences, join_mp3
+    from app.services.tts_service import CloudTTSService
+
+    service = CloudTTSService()
+    clips = {}
+    for backend in service.backends.backends:
+        if not backend.installed:
+            print(f"{backend.name:<22} not installed")
+            continue
+        for lang in TEXTS:
+            for text in TEXTS[lang] + [_long(lang)]:
+                try:
+                    ms = _time(backend.synthesize, text, lang)
+                except Exception as e:
+                    print(f"{backend.name:<22} {lang:<3} failed: {e}")
+                    break
+                _row(backend.name, lang, text, ms)
+                clips.setdefault((lang, text), backend.synthesize(text, lang))
+
+    # Cache tiers, with stand-in audio when no backend could run
+    cache = AudioCache(max_bytes=64 * 1024 * 1024, disk_dir=os.environ["TTS_CACHE_DIR"])
+    for lang in TEXTS:
+        for text in TEXTS[lang] + [_long(lang)]:
+            audio = clips.get((lang, text), b"\xff\xfb" + bytes(len(text) * 200))
+            key = tts_cache_key(text, lang, "bench")
+            cache.put(key, audio)
+            _row("cache (memory)", lang, text, _time(cache.get, key))
+            cold = AudioCache(max_bytes=1, disk_dir=os.environ["TTS_CACHE_DIR"])
+            _row("cache (disk)", lang, text, _time(cold.get, key))
+            sentences = split_sentences(text)
+            for sentence in sentences:
+                cache.put(tts_cache_key(sentence, lang, "bench"), audio[:len(sentence) * 200])
+            _row("cache (sentence join)", lang, text,
+                 _time(lambda: join_mp3([cache.get(tts_cache_key(s, lang, "bench")) for s in sentences])))
+
+    for text in (TEXTS["en"][0], _long("en")):
+        order = [b.name for b in service.backends.choose(text, "en")]
+        print(f"selection for {len(text)} chars: {' → '.join(order) or 'none available'}")
+    shutil.rmtree(os.environ["TTS_CACHE_DIR"], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
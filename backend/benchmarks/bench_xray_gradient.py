@@ -0,0 +1,67 @@
+"""
+Benchmark: X-ray gradient pipeline on synthetic large radiographs.
+
+Compares the original full-image Sobel (both axes + magnitude) against the
+strip-streamed float32 row profile. Reports latency and peak traced memory.
+
+Run from backend/:  python -m benchmarks.bench_xray_gradient
+"""
+import time
+import resource
+import tracemalloc
+import numpy as np
+from scipy.ndimage import sobel
+
+from app.services.xray_service import row_gradient_profile
+
+
+def synthetic_radiograph(height: int, width: int, seed: int = 0) -> np.ndarray:
+    """Bright vertical bone on a dark background with a few horizontal breaks."""
+    rng = np.random.default_rng(seed)
+    img = rng.normal(40, 8, size=(height, width)).astype(np.float32)
+    x0, x1 = int(width * 0.4), int(width * 0.6)
+    img[:, x0:x1] += 150
+    for frac in (0.3, 0.55, 0.8):
+        r = int(height * frac)
+        img[r:r + max(height // 200, 2), x0:x1] -= 120
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def legacy_pipeline(img_array: np.ndarray):
+    dy = sobel(img_array.astype(np.float64), axis=0)
+    dx = sobel(img_array.astype(np.float64), axis=1)
+    grad = np.sqrt(dx ** 2 + dy ** 2)  # noqa: F841 — mirrors the old dead intermediate
+    row_grad = np.mean(np.abs(dy), axis=1)
+    row_grad = row_grad / np.max(row_grad) if np.max(row_grad) > 0 else row_grad
+    col_mean = np.mean(img_array, axis=0)
+    return row_grad, col_mean
+
+
+def measure(fn, *args, repeats: int = 3):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / (1024 * 1024)
+
+
+def main():
+    for size in (2048, 4096):
+        img = synthetic_radiograph(size, size)
+        print(f"\n── {size} x {size} radiograph ({img.nbytes / 1e6:.0f} MB uint8) ──")
+        rows = [("legacy float64", legacy_pipeline, ())]
+        rows += [(f"strips={n or 'off'}", row_gradient_profile, (n,)) for n in (0, 1024, 256, 64)]
+        for label, fn, extra in rows:
+            ms, peak_mb = measure(fn, img, *extra)
+            print(f"{label:>16}: {ms:8.1f} ms   peak alloc {peak_mb:8.1f} MB")
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\nProcess peak RSS: {max_rss_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Keep test runs away from the real vault and any local Ollama / TTS prewarm
+os.environ.setdefault("VAULT_BASE", tempfile.mkdtemp(prefix="nexus-vault-"))
+os.environ.setdefault("OLLAMA_HOST", "http://127.0.0.1:9")
+os.environ.setdefault("TTS_PREWARM", "0")
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.job_queue import JobQueue, QueueFull
+from app.services.pipeline import iterate_in_thread
+
+
+def _collect(gen_fn, *args, **kwargs):
+    async def run():
+        return [item async for item in iterate_in_thread(gen_fn, *args, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_producer_runs_on_stream_pool():
+    def names():
+        yield threading.current_thread().name
+
+    assert _collect(names)[0].startswith("stream-producer")
+
+
+def test_generator_error_reaches_consumer():
+    def failing():
+        yield 1
+        raise ConnectionError("gone")
+
+    with pytest.raises(ConnectionError):
+        _collect(failing)
+
+
+def test_start_hook_shares_job_queue_workers():
+    jobs = JobQueue("test-stream", lambda: None, workers=1, max_queue=1)
+
+    def numbers(n):
+        yield from range(n)
+
+    assert _collect(numbers, 3, start=jobs.run) == [0, 1, 2]
+    assert jobs.stats()["submitted"] == 1
+    jobs.shutdown()
+
+
+def test_start_hook_rejection_is_raised():
+    def full(fn):
+        raise QueueFull("story-video queue is full")
+
+    with pytest.raises(QueueFull):
+        _collect(lambda: iter([1]), start=full)
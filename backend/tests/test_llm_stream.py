@@ -0,0 +1,80 @@
+import json
+import asyncio
+
+import pytest
+
+from app.services import llm_router as router_module
+from app.services import llm_service as service_module
+from app.services.llm_client import LLMError
+from app.services.llm_router import LLMRouter
+
+PATIENT = {"demographics": {"age": 54, "gender": "Male"}}
+REPLY = {"explanation": "Bhai, sugar is high.", "analogy": "field"}
+
+
+class FakeClient:
+    available = True
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def provider_names(self):
+        return ["gemini", "openai"]
+
+    async def stream(self, prompt, system=None, provider=None, timeout=None):
+        self.system = system
+        for chunk in self.chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = LLMRouter()
+
+    async def gemini(prompt, system, timeout):
+        raise LLMError("gemini: should not be retried")
+
+    async def openai(prompt, system, timeout):
+        return json.dumps(REPLY)
+
+    router.register("gemini", gemini, prior_ms=100)
+    router.register("openai", openai, prior_ms=200)
+    monkeypatch.setattr(service_module, "llm_router", router)
+    return router
+
+
+def _stream(monkeypatch, chunks, risk):
+    client = FakeClient(chunks)
+    monkeypatch.setattr(service_module, "llm_client", client)
+    monkeypatch.setattr(router_module, "llm_client", client)
+    diagnosis = {"risk_level": risk, "diseases": [{"name": "Diabetes"}]}
+
+    async def run():
+        service = service_module.LLMService()
+        return [event async for event in service.stream_explanation(diagnosis, PATIENT, "en", timeout=5)]
+
+    return asyncio.run(run()), client
+
+
+def test_stream_failure_before_deltas_fails_over(monkeypatch, router):
+    events, client = _stream(monkeypatch, [LLMError("gemini: HTTP 503")], "HIGH")
+    assert events == [("result", REPLY)]
+    assert client.system == "You are a medical translator."
+    assert router.routes["gemini"].health.failures == 1
+    assert router.routes["openai"].health.wins == 1
+
+
+def test_stream_failure_after_deltas_uses_template(monkeypatch, router):
+    events, _ = _stream(monkeypatch, ['{"explanation": "Bhai, ', LLMError("gemini: stream reset")], "MEDIUM")
+    kinds = [kind for kind, _ in events]
+    assert kinds == ["delta", "result"]
+    assert router.routes["gemini"].health.failures == 1
+    assert router.routes["openai"].health.calls == 0
+
+
+def test_finished_stream_is_a_success(monkeypatch, router):
+    events, _ = _stream(monkeypatch, [json.dumps(REPLY)], "LOW")
+    assert events[-1] == ("result", REPLY)
+    assert router.routes["gemini"].health.wins == 1
@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from app.services.report_dedup import ReportDedupIndex, report_fingerprint
+
+LINES = ["HAEMOGLOBIN            9.2 g/dL     (13.0 - 17.0)   LOW",
+         "FASTING BLOOD SUGAR    182 mg/dL    (70 - 100)      HIGH",
+         "HbA1c                  8.4 %        (< 5.7)         HIGH",
+         "TOTAL CHOLESTEROL      221 mg/dL    (< 200)"]
+RESULT = {"report_type": "Blood Sugar", "key_findings": ["FBS 182"], "severity": 6}
+
+
+def page(changes=None) -> np.ndarray:
+    font = ImageFont.load_default(size=24)
+    img = Image.new("L", (1800, 1500), 240)
+    draw = ImageDraw.Draw(img)
+    for i in range(30):
+        draw.text((60, 60 + 45 * i), (changes or {}).get(i, LINES[i % len(LINES)]), fill=20, font=font)
+    return np.asarray(img)
+
+
+def photo(world: np.ndarray, angle=0.0, dx=0, gain=1.0, seed=0):
+    m = cv2.getRotationMatrix2D((900, 750), angle, 1.0)
+    m[0, 2] += dx
+    img = cv2.warpAffine(world, m, (1800, 1500), borderMode=cv2.BORDER_REPLICATE).astype(np.float32) * gain
+    img += np.random.default_rng(seed).normal(0, 4, img.shape)
+    return report_fingerprint(Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)))
+
+
+def test_retake_reuses_analysis_in_scope():
+    index = ReportDedupIndex(disk_dir=None)
+    index.store(photo(page()), "en", RESULT, scope="PAT1")
+    retake = photo(page(), angle=0.5, dx=25, gain=0.8, seed=1)
+    match = index.find(retake, "en", scope="PAT1")
+    assert match is not None and match.result == RESULT
+    assert index.find(retake, "en", scope="PAT2") is None
+    assert index.find(retake, "hi", scope="PAT1").result is None
+
+
+def test_changed_value_is_not_a_retake():
+    index = ReportDedupIndex(disk_dir=None)
+    index.store(photo(page()), "en", RESULT, scope="PAT1")
+    other = photo(page({1: LINES[1].replace("182", "96 ")}), seed=1)
+    assert index.find(other, "en", scope="PAT1") is None
+    assert index.stats()["rejected_by_ink_check"] == 1
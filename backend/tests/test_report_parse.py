@@ -0,0 +1,18 @@
+from app.services.vision_service import VisionService
+
+REPORT = '{"report_type": "Blood Sugar", "key_findings": ["FBS 182"], "severity": 6}'
+
+
+def test_complete_reply_is_storable():
+    result, complete = VisionService._parse_report_json("```json\n" + REPORT + "\n```")
+    assert complete and result["report_type"] == "Blood Sugar"
+
+
+def test_prose_reply_is_not_storable():
+    result, complete = VisionService._parse_report_json("The report shows high sugar.")
+    assert not complete and result["report_type"] == "Medical Report"
+
+
+def test_cut_off_reply_is_not_storable():
+    result, complete = VisionService._parse_report_json(REPORT[:-20])
+    assert not complete and result["report_type"] == "Blood Sugar"
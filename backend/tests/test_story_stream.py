@@ -0,0 +1,46 @@
+import json
+import asyncio
+
+from app import main
+from app.services.ollama_manager import ollama_manager
+
+DIAGNOSIS = {"diseases": [{"name": "Diabetes"}], "risk_level": "HIGH",
+             "treatment_plan": {"medications": [{"name": "Metformin"}]}}
+
+
+def _story_events(monkeypatch, chat):
+    monkeypatch.setattr(type(ollama_manager), "available", property(lambda self: True))
+    monkeypatch.setattr(ollama_manager, "chat", chat)
+
+    async def run():
+        queue = asyncio.Queue()
+        await main._story_events(DIAGNOSIS, "en", queue, timeout=5)
+        events = []
+        while not queue.empty():
+            kind, data = queue.get_nowait().strip().split("\n", 1)
+            events.append((kind[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+    return asyncio.run(run())
+
+
+def test_story_failing_mid_stream_ends_with_fallback(monkeypatch):
+    def chat(**kwargs):
+        yield {"message": {"content": "Bhai, your sugar is high, "}}
+        yield {"message": {"content": "jaise "}}
+        raise ConnectionError("ollama went away")
+
+    events = _story_events(monkeypatch, chat)
+    assert [kind for kind, _ in events] == ["story_delta", "story_delta", "story"]
+    story = events[-1][1]
+    assert story["truncated"] is True
+    assert story["farmStory"] == main.ollama_service._fallback_story(DIAGNOSIS, "en")
+
+
+def test_story_stream_completes(monkeypatch):
+    def chat(**kwargs):
+        yield {"message": {"content": "Bhai, "}}
+        yield {"message": {"content": "eat bajra roti."}}
+
+    events = _story_events(monkeypatch, chat)
+    assert events[-1] == ("story", {"farmStory": "Bhai, eat bajra roti."})
@@ -0,0 +1,25 @@
+import io
+import asyncio
+
+import pytest
+from fastapi import UploadFile
+
+from app.services.upload_stage import UPLOAD_LIMITS, UploadRejected, check_header, read_upload
+
+BMI_CSV = b"BMI,age,gender,systolic_bp\n31.2,54,M,150\n22.0,33,F,118\n"
+
+
+def test_bulk_csv_with_bmi_first_column_is_a_table():
+    assert check_header(BMI_CSV, UPLOAD_LIMITS["bulk-triage"]) == "csv"
+
+
+def test_bulk_csv_with_bmi_first_column_is_read():
+    upload = UploadFile(file=io.BytesIO(BMI_CSV), filename="patients.csv")
+    assert asyncio.run(read_upload(upload, "bulk-triage")) == BMI_CSV
+
+
+def test_bulk_rejects_images():
+    png = b"\x89PNG\r\n\x1a\n" + bytes(64)
+    with pytest.raises(UploadRejected):
+        check_header(png, UPLOAD_LIMITS["bulk-triage"])
+
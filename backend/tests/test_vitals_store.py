@@ -0,0 +1,24 @@
+import os
+
+from app.services.vitals_store import VitalsStore
+
+
+def test_punctuation_variants_keep_separate_histories(tmp_path):
+    store = VitalsStore(directory=str(tmp_path))
+    store.record("PAT/1", ts=1000.0, glucose=180)
+    store.record("PAT_1", ts=1000.0, glucose=95)
+    assert len(os.listdir(tmp_path)) == 2
+
+    reloaded = VitalsStore(directory=str(tmp_path))
+    assert reloaded.last_value("PAT/1", "glucose") == 180
+    assert reloaded.last_value("PAT_1", "glucose") == 95
+
+
+def test_history_under_old_filename_is_adopted(tmp_path):
+    VitalsStore(directory=str(tmp_path)).record("PAT_1", ts=1000.0, glucose=95)
+    (hashed,) = os.listdir(tmp_path)
+    os.replace(tmp_path / hashed, tmp_path / "PAT_1.vitals")
+
+    store = VitalsStore(directory=str(tmp_path))
+    assert store.last_value("PAT_1", "glucose") == 95
+    assert os.listdir(tmp_path) == [hashed]
@@ -2,6 +2,16 @@ import { useState } from 'react';
 import { Upload, Camera, FileImage, Loader } from 'lucide-react';
 import { motion } from 'framer-motion';
 
+// Per-tab id so the backend can reuse the analysis of a retaken report photo
+function reportSessionId() {
+    let id = sessionStorage.getItem('reportSessionId');
+    if (!id) {
+        id = Math.random().toString(36).slice(2) + Date.now().toString(36);
+        sessionStorage.setItem('reportSessionId', id);
+    }
+    return id;
+}
+
 export default function ReportScanner({ language = 'en', onResult }) {
     const [preview, setPreview] = useState(null);
     const [loading, setLoading] = useState(false);
@@ -63,6 +73,7 @@ export default function ReportScanner({ language = 'en', onResult }) {
         const formData = new FormData();
         formData.append('file', file);
         formData.append('language', language);
+        formData.append('session_id', reportSessionId());
 
         try {
             const response = await fetch('http://localhost:8000/api/analyze-report', {
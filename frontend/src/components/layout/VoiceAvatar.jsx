@@ -50,7 +50,7 @@ export default function VoiceAvatar({ textToSpeak, onSpeechEnd, isListening, lan
 
             if (result.success && result.audio_content) {
                 // Decode base64 and play audio
-                const audioBlob = base64ToBlob(result.audio_content, 'audio/mp3');
+                const audioBlob = base64ToBlob(result.audio_content, result.mime_type || 'audio/mp3');
                 const audioUrl = URL.createObjectURL(audioBlob);
 
                 if (audioRef.current) {